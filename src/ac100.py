@@ -6,6 +6,11 @@ import signal
 import sys
 import time
 
+import src.ac100aot as ac_aot
+import src.ac100bus as ac_bus
+import src.ac100dev as ac_dev
+import src.ac100img as ac_img
+import src.ac100verify as ac_verify
 import src.definitions as defs
 import src.exceptions as ac_exc
 
@@ -36,9 +41,20 @@ INSTRUCTION_TABLE = ["NONE" for i in range(2 ** defs.BYTE)]
 INSTRUCTION_TABLE[0x00] = "LDI"
 INSTRUCTION_TABLE[0x01] = "LDR"
 INSTRUCTION_TABLE[0x02] = "LDM"
+INSTRUCTION_TABLE[0x03] = "LDBM"
+INSTRUCTION_TABLE[0x04] = "LDMX"
+INSTRUCTION_TABLE[0x05] = "LDMP"
+INSTRUCTION_TABLE[0x06] = "LDBMX"
+INSTRUCTION_TABLE[0x07] = "LDBMP"
 INSTRUCTION_TABLE[0x10] = "ST"
 INSTRUCTION_TABLE[0x11] = "STH"
 INSTRUCTION_TABLE[0x12] = "STL"
+INSTRUCTION_TABLE[0x13] = "MEMCPY"
+INSTRUCTION_TABLE[0x14] = "MEMSET"
+INSTRUCTION_TABLE[0x15] = "STX"
+INSTRUCTION_TABLE[0x16] = "STP"
+INSTRUCTION_TABLE[0x17] = "STLX"
+INSTRUCTION_TABLE[0x18] = "STLP"
 INSTRUCTION_TABLE[0x20] = "CMR"
 INSTRUCTION_TABLE[0x21] = "CMI"
 INSTRUCTION_TABLE[0x30] = "JZ"
@@ -57,12 +73,38 @@ INSTRUCTION_TABLE[0x42] = "INC"
 INSTRUCTION_TABLE[0x43] = "SUBI"
 INSTRUCTION_TABLE[0x44] = "SUBR"
 INSTRUCTION_TABLE[0x45] = "DEC"
+INSTRUCTION_TABLE[0x46] = "MUL"
+INSTRUCTION_TABLE[0x47] = "DIVU"
+INSTRUCTION_TABLE[0x48] = "MOD"
+INSTRUCTION_TABLE[0x49] = "LSL"
+INSTRUCTION_TABLE[0x4A] = "LSR"
+INSTRUCTION_TABLE[0x4B] = "ASR"
+INSTRUCTION_TABLE[0x50] = "ANDR"
+INSTRUCTION_TABLE[0x51] = "ANDI"
+INSTRUCTION_TABLE[0x52] = "ORR"
+INSTRUCTION_TABLE[0x53] = "ORI"
+INSTRUCTION_TABLE[0x54] = "XORR"
+INSTRUCTION_TABLE[0x55] = "XORI"
+INSTRUCTION_TABLE[0x56] = "NOT"
+INSTRUCTION_TABLE[0x57] = "TSTR"
+INSTRUCTION_TABLE[0x58] = "TSTI"
 INSTRUCTION_TABLE[0xE0] = "PUSH"
 INSTRUCTION_TABLE[0xE1] = "POP"
 INSTRUCTION_TABLE[0xE2] = "RTS"
+INSTRUCTION_TABLE[0xE3] = "RTI"
+INSTRUCTION_TABLE[0xE4] = "WAIT"
 INSTRUCTION_TABLE[0xFE] = "HALT"
 INSTRUCTION_TABLE[0xFF] = "NOP"
 
+JUMP_OPCODES = frozenset(range(0x30, 0x3A)) # JZ through JSR
+# pending interrupts are only taken just after one of these runs: they end
+# basic blocks, so translated code need only check between blocks
+INTERRUPT_POINTS = JUMP_OPCODES | {0xE2, 0xE3, 0xE4}
+
+# the [Rn+offset] and [Rn]+ forms of the loads and stores
+_INDEXED = {"LDMX", "STX", "LDBMX", "STLX"}
+_POST_INCREMENT = {"LDMP", "STP", "LDBMP", "STLP"}
+
 # AC100 emulator
 class AC100:
 
@@ -77,6 +119,11 @@ class AC100:
     FLAG_ZERO = 0x2
     FLAG_OVERFLOW = 0x4
     FLAG_NEGATIVE = 0x8
+    # set while an interrupt is being handled, holding off others until RTI
+    FLAG_INTERRUPT = 0x10
+
+    # seconds each instruction takes in run(), with the display
+    DISPLAY_INSTRUCTION_TIME = 0.005
 
     VALID_FLAGS = [FLAG_NEGATIVE, FLAG_OVERFLOW, FLAG_ZERO, FLAG_CARRY]
     FLAG_NAMES = {
@@ -159,6 +206,7 @@ class AC100:
         self.REGS = [[0x00 for i in range(defs.BYTES_PER_WORD)]\
                      for j in range(defs.NUM_REGISTERS)]
         self.RAM = bytearray(defs.ADDRESS_SIZE)
+        self.bus = ac_bus.MemoryBus(self.RAM)   # page permissions and devices
         self.PS = 0x00          # 0b00000000
         self.SP = defs.STACK_MIN
         self.PC = defs.CODE_START
@@ -167,6 +215,17 @@ class AC100:
         self.VRAM_START: int = defs.VRAM_START
         self.stdscr = None
         self.display = None
+        self.halted: bool = False       # set by HALT
+        self.instruction_count: int = 0 # executed by run_headless()
+        self.backend = None     # e.g. an ac100aot.Backend for run_headless()
+        self.interrupts = None  # an ac100dev.InterruptController, if attached
+        self.waiting: bool = False  # WAIT ran and no interrupt has come yet
+        self.paced: bool = False    # run() is keeping to DISPLAY_INSTRUCTION_TIME
+        # nonzero at the address of each instruction that passed the
+        # verifier, whose jumps then skip their runtime checks
+        self.verified = bytearray(defs.ADDRESS_SIZE)
+        self.verified_end: int = 0  # just past the last verified instruction
+        self.verified_generation: int = 0 # bus.generation the marks are for
 
 
     def initialize_video(self) -> None:
@@ -205,14 +264,78 @@ class AC100:
         Load a program into memory.
 
         Parameters:
-        bytecode: the bytecode to load
+        bytecode: the bytecode to load, either a flat binary, which is loaded
+        at PC, or a sparse image, whose segments are each loaded at their own
+        address.  Raises ImageFormatError if a sparse image is malformed.
+
+        Any instructions marked as verified are unmarked, and a backend
+        forgets any stores into the code it was translated from.
         """
+        if self.verified_end:
+            self.mark_verified([])
+        if self.backend is not None:
+            self.backend.reset()
+        if ac_img.is_image(bytecode):
+            for address, data in ac_img.unpack(bytecode):
+                self.RAM[address:address + len(data)] = data
+            return
+
         program_len: int = len(bytecode)
 
         for i in range(program_len):
             self.RAM[self.PC + i] = bytecode[i]
 
 
+    def mark_verified(self, addresses: [int]) -> None:
+        """
+        Record which instructions passed the verifier.
+
+        Parameters:
+        addresses: e.g. the verified addresses from ac100verify.verify() on the
+        loaded program; these replace any marked before
+
+        A verified jump runs without any checks on its target.  The verifier
+        can't know about pages mapped or protected once the program runs, so
+        jumps whose targets the bus doesn't let run are left unmarked, and
+        are looked at again whenever the bus changes (see _check_verified()).
+        """
+        self.verified = bytearray(defs.ADDRESS_SIZE)
+        for address in addresses:
+            self.verified[address] = 1
+        self.verified_end = max(addresses, default=-4) + 4
+        self._check_verified()
+
+
+    def _check_verified(self) -> None:
+        """ Unmark verified jumps whose targets are no longer executable """
+        access, ram, verified = self.bus.access, self.RAM, self.verified
+        for pc in range(0, self.verified_end, 4):
+            if (verified[pc] and ram[pc] in JUMP_OPCODES
+                    and not access[ram[pc + 2] << 8 | ram[pc + 3]]
+                    & ac_bus.EXECUTE):
+                verified[pc] = 0
+        self.verified_generation = self.bus.generation
+
+
+    def _unverify(self, address: int, length: int) -> None:
+        """ Unmark the instructions that a store of length bytes overlaps """
+        for a in range(max(address - 3, 0), min(address + length,
+                                                 self.verified_end)):
+            self.verified[a] = 0
+
+
+    def invalidate_code(self, address: int, length: int) -> None:
+        """
+        Tell the machine that length bytes at address changed without a store
+        instruction, e.g. by a device copying into RAM, so that any code there
+        is checked and translated again.
+        """
+        if address < self.verified_end:
+            self._unverify(address, length)
+        if self.backend is not None:
+            self.backend.invalidate(address, length)
+
+
     def fetch_instruction(self) -> bytes:
         return [self.RAM[self.PC + i] for i in range(4)]
 
@@ -231,8 +354,44 @@ class AC100:
                       end='\t')
 
 
+    def _memory_operand(self, instruction: bytes) -> int:
+        """
+        Find the address a load or store refers to.
+
+        Parameters:
+        instruction: an LDM*, LDBM*, or ST* instruction
+
+        Return:
+        The address.  LDM, LDBM, and ST* take an absolute address, or [Rn]
+        when bytes 2 and 3 are below 0x10.  The *X forms ([Rn+offset]) take
+        the register in byte 2 and add the unsigned offset in byte 3,
+        wrapping at the top of memory.  The *P forms ([Rn]+) take the
+        register in byte 2; the caller steps it past the data afterwards.
+        """
+        mnemonic = INSTRUCTION_TABLE[instruction[0]]
+        if mnemonic in _INDEXED or mnemonic in _POST_INCREMENT:
+            register = instruction[2]
+            base = self.REGS[register][0] << 8 | self.REGS[register][1]
+            if mnemonic in _INDEXED:
+                return (base + instruction[3]) & 0xffff
+            return base
+        operand = instruction[2] << 8 | instruction[3]
+        if operand < 0x10:      # register indirect
+            return self.REGS[operand][0] << 8 | self.REGS[operand][1]
+        return operand          # absolute address
+
+
+    def _post_increment(self, instruction: bytes, step: int) -> None:
+        """ Step the base register of a *P load or store by step bytes """
+        register = instruction[2]
+        value = ((self.REGS[register][0] << 8 | self.REGS[register][1])
+                 + step) & 0xffff
+        self.REGS[register][0] = value >> 8
+        self.REGS[register][1] = value & 0xff
+
+
     def _exec_load(self, instruction: bytes) -> None:
-        """ Execute a load instruction (LDI|LDR|LDM). """
+        """ Execute a load instruction (LDI|LDR|LDM|LDMX|LDMP). """
         opcode = instruction[0]
         mnemonic = INSTRUCTION_TABLE[opcode]
         dest_reg = instruction[1]
@@ -245,15 +404,22 @@ class AC100:
                 src_reg = instruction[2]
                 self.REGS[dest_reg][0] = self.REGS[src_reg][0]
                 self.REGS[dest_reg][1] = self.REGS[src_reg][1]
-            case "LDM":
-                operand = instruction[2] << 8 | instruction[3]
-                address = 0x0
-                if operand < 0x10: # it’s a register-indirect load
-                    address = self.REGS[operand][0] << 8 | self.REGS[operand][1]
-                else:           # absolute address
-                    address = operand
-                self.REGS[dest_reg][0] = self.RAM[address]
-                self.REGS[dest_reg][1] = self.RAM[address + 1]
+            case "LDM" | "LDMX" | "LDMP":
+                address = self._memory_operand(instruction)
+                access = self.bus.access
+                if ((access[address] | access[address + 1]) & ac_bus.DEVICE
+                        or not access[address] & access[address + 1]
+                        & ac_bus.READ):
+                    value = self.bus.read_word(address)
+                    high, low = value >> 8, value & 0xff
+                else:
+                    high, low = self.RAM[address], self.RAM[address + 1]
+                # if the base register is also the destination, it ends up
+                # holding the loaded word
+                if mnemonic == "LDMP":
+                    self._post_increment(instruction, 2)
+                self.REGS[dest_reg][0] = high
+                self.REGS[dest_reg][1] = low
 
         value = self.REGS[dest_reg][0] << 8 | self.REGS[dest_reg][1]
 
@@ -263,7 +429,7 @@ class AC100:
 
     def _exec_ldbm(self, instruction: bytes) -> None:
         """
-        Execute a LDBM instruction.
+        Execute a LDBM instruction (LDBM|LDBMX|LDBMP).
 
         Parameters:
         instruction: the instruction to execute
@@ -273,49 +439,94 @@ class AC100:
         """
         dest_reg = instruction[1]
 
-        operand = instruction[2] << 8 | instruction[3]
-        address = 0x0000
-        if operand < 0x10:      # it’s a register-indirect load
-            address = self.REGS[operand][0] << 8 | self.REGS[operand][1]
-        else:                   # absolute address
-            address = operand
+        address = self._memory_operand(instruction)
+        if self.bus.access[address] & (ac_bus.READ | ac_bus.DEVICE) \
+                == ac_bus.READ:
+            byte = self.RAM[address]
+        else:
+            byte = self.bus.read(address)
+        # as for LDMP, a destination that is also the base gets the byte
+        if INSTRUCTION_TABLE[instruction[0]] == "LDBMP":
+            self._post_increment(instruction, 1)
         self.REGS[dest_reg][0] = 0x00
-        self.REGS[dest_reg][1] = self.RAM[address]
+        self.REGS[dest_reg][1] = byte
 
         value = self.REGS[dest_reg][0] << 8 | self.REGS[dest_reg][1]
 
         self.flag_set_or_clear(self.FLAG_ZERO, value == 0)
 
 
-    def _st_stack_error(self):
-        msg = "Programs may not store data in the stack "
-        msg += f"([0x{defs.STACK_MAX:04x}--0x{defs.STACK_MIN:04x}])"
-        logger.error(msg)
-
-
     def _exec_store(self, instruction: bytes) -> None:
         opcode = instruction[0]
         mnemonic = INSTRUCTION_TABLE[opcode]
         register = instruction[1]
-        operand = instruction[2] << 8 | instruction[3]
-        dest_address = 0x0000
-        if operand < 0x10:          # register-indirect store
-            dest_address = self.REGS[operand][0] << 8 | self.REGS[operand][1]
-        else:                       # absolute address
-            dest_address = operand
-
-        if dest_address < defs.STACK_MIN:
-            # trying to store in stack: forbidden
-            self._st_stack_error()
-            sys.exit(1)
-        match mnemonic:
-            case "ST":
-                self.RAM[dest_address] = self.REGS[register][0]
-                self.RAM[dest_address+1] = self.REGS[register][1]
-            case "STH":
-                self.RAM[dest_address] = self.REGS[register][0]
-            case "STL":
-                self.RAM[dest_address] = self.REGS[register][1]
+        dest_address = self._memory_operand(instruction)
+
+        word = mnemonic in ("ST", "STX", "STP")
+        last = dest_address + 1 if word else dest_address
+        if dest_address < self.verified_end: # may overwrite verified code
+            self._unverify(dest_address, last - dest_address + 1)
+        access = self.bus.access
+        if ((access[dest_address] | access[last]) & ac_bus.DEVICE
+                or not access[dest_address] & access[last] & ac_bus.WRITE):
+            # a device, or memory the program may not write
+            match mnemonic:
+                case "ST" | "STX" | "STP":
+                    self.bus.write_word(dest_address,
+                                        self.REGS[register][0] << 8
+                                        | self.REGS[register][1])
+                case "STH":
+                    self.bus.write(dest_address, self.REGS[register][0])
+                case "STL" | "STLX" | "STLP":
+                    self.bus.write(dest_address, self.REGS[register][1])
+        else:
+            match mnemonic:
+                case "ST" | "STX" | "STP":
+                    self.RAM[dest_address] = self.REGS[register][0]
+                    self.RAM[dest_address+1] = self.REGS[register][1]
+                case "STH":
+                    self.RAM[dest_address] = self.REGS[register][0]
+                case "STL" | "STLX" | "STLP":
+                    self.RAM[dest_address] = self.REGS[register][1]
+        if mnemonic == "STP":
+            self._post_increment(instruction, 2)
+        elif mnemonic == "STLP":
+            self._post_increment(instruction, 1)
+
+
+    def _exec_block(self, instruction: bytes) -> None:
+        """
+        Execute a block copy or fill (MEMCPY|MEMSET).  The first register
+        holds the source address, for MEMCPY, or the fill byte, in its low
+        byte, for MEMSET; the second the destination; the third the length
+        in bytes.  Overlapping copies work like memmove().
+        """
+        mnemonic = INSTRUCTION_TABLE[instruction[0]]
+        regs = [self.REGS[r][0] << 8 | self.REGS[r][1] for r in instruction[1:]]
+        source, dest, length = regs
+        if length == 0:
+            return
+        self.invalidate_code(dest, length)
+        bus = self.bus
+        if mnemonic == "MEMSET":
+            if bus.plain(dest, length, ac_bus.WRITE):
+                self.RAM[dest:dest + length] = bytes((source & 0xff,)) * length
+                return
+            data = [source & 0xff] * length
+        else:
+            if (bus.plain(source, length, ac_bus.READ)
+                    and bus.plain(dest, length, ac_bus.WRITE)):
+                self.RAM[dest:dest + length] = self.RAM[source:source + length]
+                return
+            if source + length > defs.ADDRESS_SIZE:
+                raise ac_exc.MemoryProtectionError(defs.ADDRESS_SIZE,
+                                                   "readable")
+            data = [bus.read(a) for a in range(source, source + length)]
+        # a device, or memory the program may not use, one byte at a time
+        if dest + length > defs.ADDRESS_SIZE:
+            raise ac_exc.MemoryProtectionError(defs.ADDRESS_SIZE, "writable")
+        for offset, value in enumerate(data):
+            bus.write(dest + offset, value)
 
 
     def _add_bits(self, a: int, b: int, carry_in: int) -> (int, int):
@@ -441,17 +652,14 @@ class AC100:
         opcode = instruction[0]
         mnemonic = INSTRUCTION_TABLE[opcode]
         address = instruction[2] << 8 | instruction[3]
-        # high-address end of the stack is the same address as the start of the
-        # code section, so we don't want to raise an exception if address is the
-        # high end of the stack
-        if address < defs.STACK_MIN:
-            raise ac_exc.StackJumpError(address)
-        # VRAM is not executable code
-        if address >= self.VRAM_START:
-            raise ac_exc.VRAMJumpError(address, self.VRAM_START,
-                                       defs.ADDRESS_MAX)
-        if address % 4 != 0:
-            raise ac_exc.PcAlignmentError(address)
+        # the target of a verified jump is aligned and, as of the last
+        # _check_verified(), executable; otherwise the stack, VRAM, and device
+        # pages aren't executable
+        if not self.verified[self.PC]:
+            if not self.bus.access[address] & ac_bus.EXECUTE:
+                raise ac_exc.MemoryProtectionError(address, "executable")
+            if address % 4 != 0:
+                raise ac_exc.PcAlignmentError(address)
 
         match mnemonic:
             case "JZ": self._branch_on_flag_set(self.FLAG_ZERO, address)
@@ -549,6 +757,106 @@ class AC100:
         self.flag_set_or_clear(self.FLAG_NEGATIVE, value >> 15 & 0x1 == 1)
 
 
+    def _exec_mul_div(self, instruction: bytes) -> None:
+        """
+        Execute a MUL, DIVU, or MOD instruction.  All are unsigned.
+
+        MUL Ra Rb Rh multiplies Ra by Rb, leaving the low word of the product
+        in Ra and the high word in Rh; C and V are set if the high word isn't
+        zero.  If Rh is Ra, the high word wins, and N and Z still describe
+        the low word; ac100aot must do the same.  DIVU and MOD replace Ra with
+        the quotient or remainder of Ra divided by Rb, and clear C and V.  N
+        and Z describe the value left in Ra.  Raises DivideByZeroError if Rb
+        is zero.
+        """
+        mnemonic = INSTRUCTION_TABLE[instruction[0]]
+        register = instruction[1]
+        a = self.REGS[register][0] << 8 | self.REGS[register][1]
+        b = self.REGS[instruction[2]][0] << 8 | self.REGS[instruction[2]][1]
+        high = 0
+        match mnemonic:
+            case "MUL":
+                product = a * b
+                result, high = product & 0xffff, product >> 16
+            case "DIVU" | "MOD":
+                if b == 0:
+                    raise ac_exc.DivideByZeroError(self.PC)
+                result = a // b if mnemonic == "DIVU" else a % b
+
+        self.REGS[register][0] = result >> 8 & 0xff
+        self.REGS[register][1] = result & 0xff
+        if mnemonic == "MUL":
+            self.REGS[instruction[3]][0] = high >> 8 & 0xff
+            self.REGS[instruction[3]][1] = high & 0xff
+
+        self.flag_set_or_clear(self.FLAG_CARRY, high != 0)
+        self.flag_set_or_clear(self.FLAG_NEGATIVE, result >> 15 & 0x1 == 1)
+        self.flag_set_or_clear(self.FLAG_OVERFLOW, high != 0)
+        self.flag_set_or_clear(self.FLAG_ZERO, result == 0)
+
+
+    def _exec_shift(self, instruction: bytes) -> None:
+        """
+        Execute an LSL, LSR, or ASR instruction, which shifts a register by
+        an immediate count.  Counts of 16 or more shift every bit out (ASR
+        leaves copies of the sign bit).  C gets the last bit shifted out, or
+        is cleared if the count is 0; V is cleared; N and Z describe the
+        result.
+        """
+        mnemonic = INSTRUCTION_TABLE[instruction[0]]
+        register = instruction[1]
+        count = instruction[2] << 8 | instruction[3]
+        a = self.REGS[register][0] << 8 | self.REGS[register][1]
+        if mnemonic == "ASR":
+            count = min(count, 16)
+            a -= (a & 0x8000) << 1  # sign-extend, so >> copies the sign bit
+        if count == 0:
+            result, carry = a & 0xffff, 0
+        elif mnemonic == "LSL":
+            wide = a << min(count, 17)
+            result, carry = wide & 0xffff, wide >> 16 & 0x1
+        else:
+            result, carry = a >> count & 0xffff, a >> (count - 1) & 0x1
+
+        self.REGS[register][0] = result >> 8 & 0xff
+        self.REGS[register][1] = result & 0xff
+
+        self.flag_set_or_clear(self.FLAG_CARRY, carry)
+        self.flag_set_or_clear(self.FLAG_NEGATIVE, result >> 15 & 0x1 == 1)
+        self.flag_set_or_clear(self.FLAG_OVERFLOW, False)
+        self.flag_set_or_clear(self.FLAG_ZERO, result == 0)
+
+
+    def _exec_logic(self, instruction: bytes) -> None:
+        """
+        Execute a bitwise instruction (AND*|OR*|XOR*|NOT|TST*).  The *R
+        forms take their second operand from a register and the *I forms
+        from the immediate.  TSTR and TSTI AND the operands without storing
+        the result.  C and V are cleared; N and Z describe the result.
+        """
+        mnemonic = INSTRUCTION_TABLE[instruction[0]]
+        register = instruction[1]
+        a = self.REGS[register][0] << 8 | self.REGS[register][1]
+        if mnemonic.endswith("I"):
+            b = instruction[2] << 8 | instruction[3]
+        else:
+            b = self.REGS[instruction[2]][0] << 8 | self.REGS[instruction[2]][1]
+        match mnemonic:
+            case "ANDR" | "ANDI" | "TSTR" | "TSTI": result = a & b
+            case "ORR" | "ORI": result = a | b
+            case "XORR" | "XORI": result = a ^ b
+            case "NOT": result = ~a & 0xffff
+
+        if not mnemonic.startswith("TST"):
+            self.REGS[register][0] = result >> 8 & 0xff
+            self.REGS[register][1] = result & 0xff
+
+        self.flag_set_or_clear(self.FLAG_CARRY, False)
+        self.flag_set_or_clear(self.FLAG_NEGATIVE, result >> 15 & 0x1 == 1)
+        self.flag_set_or_clear(self.FLAG_OVERFLOW, False)
+        self.flag_set_or_clear(self.FLAG_ZERO, result == 0)
+
+
     def _decrement_sp(self):
         self.SP -= 2
 
@@ -595,6 +903,87 @@ class AC100:
         self.PC = address
 
 
+    def _exec_rti(self, instruction: bytes) -> None:
+        """ Return from an interrupt: pop PS, then the interrupted PC """
+        if self.SP > defs.STACK_MIN - 4: # PS and PC aren't both there
+            raise ac_exc.StackEmptyError()
+        self.PS = self.RAM[self.SP + 1]
+        self._increment_sp()
+        address = self.RAM[self.SP] << 8 | self.RAM[self.SP + 1]
+        self._increment_sp()
+        if address < defs.CODE_START:
+            raise ac_exc.StackJumpError(address)
+        self.PC = address
+
+
+    def _exec_wait(self, instruction: bytes) -> None:
+        """ Wait for an interrupt; the check after WAIT does the waiting """
+        if self.interrupts is None:
+            raise ac_exc.WaitForeverError(self.PC)
+        self.waiting = True
+        self.interrupts.due = 0 # check straight away
+        self._increment_pc()
+
+
+    def _idle(self, retired: int) -> None:
+        """
+        Let time pass until the next timer tick, for WAIT.  Headless, the
+        interrupt controller's clock jumps straight there; under run(), the
+        host sleeps for as long as the instructions would have taken, or
+        until a device raises a line.
+
+        Parameters:
+        retired: as for poll_interrupts()
+        """
+        interrupts = self.interrupts
+        if self.PS & self.FLAG_INTERRUPT or not interrupts.can_wake():
+            raise ac_exc.WaitForeverError(self.PC - 4)
+        ticks = interrupts.due - retired
+        if self.paced:
+            start = time.monotonic()
+            interrupts.event.clear()
+            if interrupts.event.wait(ticks * self.DISPLAY_INSTRUCTION_TIME):
+                elapsed = time.monotonic() - start
+                ticks = min(ticks, int(elapsed / self.DISPLAY_INSTRUCTION_TIME))
+        interrupts.idle += ticks
+
+
+    def poll_interrupts(self, retired: int) -> None:
+        """
+        Take the highest-priority pending interrupt, if there is one and no
+        interrupt is already being handled.
+
+        Parameters:
+        retired: the number of instructions retired so far, including any not
+        yet added to instruction_count; timers count these
+
+        Called just after an instruction in INTERRUPT_POINTS, once retired
+        reaches the controller's due count.  Taking an interrupt pushes PC,
+        then PS, sets FLAG_INTERRUPT, and jumps to the line's vector.  After
+        WAIT, this idles until there is an interrupt to take.
+        """
+        interrupts = self.interrupts
+        while not interrupts.update(retired) or self.PS & self.FLAG_INTERRUPT:
+            if not self.waiting:
+                return
+            self._idle(retired)
+        self.waiting = False
+        line, vector = interrupts.acknowledge()
+        if (not self.bus.access[vector] & ac_bus.EXECUTE or vector % 4 != 0
+                or vector >= self.VRAM_START):
+            raise ac_exc.InterruptVectorError(line, vector)
+        if self.SP < 4:
+            raise ac_exc.StackOverflowError()
+        self._decrement_sp()
+        self.RAM[self.SP] = self.PC >> 8 & 0xff
+        self.RAM[self.SP + 1] = self.PC & 0xff
+        self._decrement_sp()
+        self.RAM[self.SP] = 0x00
+        self.RAM[self.SP + 1] = self.PS
+        self.PS |= self.FLAG_INTERRUPT
+        self.PC = vector
+
+
     def decode_execute_instruction(self, instruction) -> bool:
         """
         Decode and execute the next instruction
@@ -605,8 +994,7 @@ class AC100:
         Return:
         On success, return True.  On failure, return False.
 
-        HALT never returns to the caller, instead causing the Python interpreter
-        to exit.
+        HALT sets halted and leaves PC on the HALT instruction.
         """
         if len(instruction) != 4:
             logger.error("Expected 4-byte instruction")
@@ -615,12 +1003,18 @@ class AC100:
         opcode: bytes = INSTRUCTION_TABLE[instruction[0]]
         logger.debug(f"Executing {opcode}")
         match opcode:
-            case "LDI" | "LDR" | "LDM":
+            case "LDI" | "LDR" | "LDM" | "LDMX" | "LDMP":
                 self._exec_load(instruction)
                 self._increment_pc()
-            case "ST" | "STH" | "STL":
+            case "LDBM" | "LDBMX" | "LDBMP":
+                self._exec_ldbm(instruction)
+                self._increment_pc()
+            case "ST" | "STH" | "STL" | "STX" | "STP" | "STLX" | "STLP":
                 self._exec_store(instruction)
                 self._increment_pc()
+            case "MEMCPY" | "MEMSET":
+                self._exec_block(instruction)
+                self._increment_pc()
             case "CMR" | "CMI":
                 self._exec_cmp(instruction)
                 self._increment_pc()
@@ -630,9 +1024,22 @@ class AC100:
                 # occurs or not, so _exec_jump handles it (more precisely, its
                 # helper functions handle PC manipulation)
                 self._exec_jump(instruction)
+            case "ADDI" | "ADDR" | "SUBI" | "SUBR":
+                self._exec_add_sub(instruction)
+                self._increment_pc()
             case "INC":
                 self._exec_inc(instruction)
                 self._increment_pc()
+            case "MUL" | "DIVU" | "MOD":
+                self._exec_mul_div(instruction)
+                self._increment_pc()
+            case "LSL" | "LSR" | "ASR":
+                self._exec_shift(instruction)
+                self._increment_pc()
+            case "ANDR" | "ANDI" | "ORR" | "ORI" | "XORR" | "XORI" | "NOT" \
+                    | "TSTR" | "TSTI":
+                self._exec_logic(instruction)
+                self._increment_pc()
             case "DEC":
                 self._exec_dec(instruction)
                 self._increment_pc()
@@ -653,7 +1060,9 @@ class AC100:
                     logger.error(e)
                     return False
             case "RTS": self._exec_rts(instruction)
-            case "HALT": sys.exit(0)
+            case "RTI": self._exec_rti(instruction)
+            case "WAIT": self._exec_wait(instruction)
+            case "HALT": self.halted = True
             case "NOP":
                 self._increment_pc()
             case _:
@@ -678,18 +1087,80 @@ class AC100:
         self.display.refresh()
 
 
+    def run_headless(self, max_instructions: int = None) -> int:
+        """
+        Run the loaded program without the curses display or any delay.
+
+        Parameters:
+        max_instructions: if given, stop after executing this many instructions
+
+        Return:
+        The same as interpret(), which does the work unless a backend is set.
+        Devices are flushed when the run stops.
+        """
+        try:
+            if self.backend is not None:
+                return self.backend.run(self, max_instructions)
+            return self.interpret(max_instructions)
+        finally:
+            self.bus.flush()
+
+
+    def interpret(self, max_instructions: int = None) -> int:
+        """
+        Run the loaded program one instruction at a time.
+
+        Parameters:
+        max_instructions: if given, stop after executing this many instructions
+
+        Return:
+        0 once the program halts, runs into VRAM, or has executed
+        max_instructions; -1 if an instruction fails.  instruction_count is
+        increased by the number of instructions executed.
+        """
+        count = 0
+        status = 0
+        interrupts = self.interrupts
+        if self.verified_generation != self.bus.generation:
+            self._check_verified()
+        while self.PC < self.VRAM_START and not self.halted:
+            if max_instructions is not None and count >= max_instructions:
+                break
+            instruction = self.fetch_instruction()
+            if not self.decode_execute_instruction(instruction):
+                logger.error(f"{INSTRUCTION_TABLE[instruction[0]]} failed")
+                status = -1
+                break
+            count += 1
+            if (interrupts is not None and instruction[0] in INTERRUPT_POINTS
+                    and self.instruction_count + count >= interrupts.due):
+                self.poll_interrupts(self.instruction_count + count)
+        self.instruction_count += count
+        return status
+
+
     def run(self):
-        while self.PC < self.VRAM_START:
+        self.paced = True
+        if self.verified_generation != self.bus.generation:
+            self._check_verified()
+        while self.PC < self.VRAM_START and not self.halted:
             instruction = self.fetch_instruction()
             ok = self.decode_execute_instruction(instruction)
             if not ok:
                 self.end_video()
+                self.bus.flush()
                 logger.error(f"{INSTRUCTION_TABLE[instruction[0]]} failed")
                 return -1
+            self.instruction_count += 1
+            if (self.interrupts is not None
+                    and instruction[0] in INTERRUPT_POINTS
+                    and self.instruction_count >= self.interrupts.due):
+                self.poll_interrupts(self.instruction_count)
             self.update_screen()
-            time.sleep(0.005)
+            time.sleep(self.DISPLAY_INSTRUCTION_TIME)
 
         self.end_video()
+        self.bus.flush()
         return 0
 
 
@@ -703,6 +1174,22 @@ def setup_parser(parser):
                         help="Logging level (default: %(default)s)",
                         metavar="level",
                         choices=["debug", "info", "warning", "error", "critical"])
+    parser.add_argument("--no-verify", action="store_true",
+                        help="Don't check the program before running it")
+    parser.add_argument("--headless", action="store_true",
+                        help="Run without the display, as fast as possible")
+    parser.add_argument("--aot", action="store_true",
+                        help="Translate the program into Python before running "
+                        "it (implies --headless)")
+    parser.add_argument("--devices", action="store_true",
+                        help="Map the console, interrupt controller, and timer "
+                        "over RAM at 0xf800-0xf8ff and 0xfa00-0xfbff")
+    parser.add_argument("--disk", metavar="file",
+                        help="Attach a host file as the disk (its size must "
+                        "be a multiple of 512 bytes)")
+    parser.add_argument("--aot-cache-dir", metavar="dir",
+                        help="Where translations are cached (default: "
+                        f"{ac_aot.DEFAULT_CACHE_DIR})")
 
 
 def setup_logger(logger, args):
@@ -721,8 +1208,44 @@ def main():
     setup_logger(logger, args)
 
     with open(args.binary, "rb") as f:
-        machine.load_ram(f.read())
+        program = f.read()
+        try:
+            machine.load_ram(program)
+            if not args.no_verify:
+                result = ac_verify.verify(program)
+                for diagnostic in result.diagnostics:
+                    print(f"{args.binary}:{diagnostic}", file=sys.stderr)
+                if not result.ok:
+                    sys.exit(1)
+                machine.mark_verified(result.verified)
+            if args.aot:
+                machine.backend = ac_aot.load(program, args.aot_cache_dir)
+        except ac_exc.ImageFormatError as e:
+            logger.error(e)
+            sys.exit(1)
 
+    # devices take over pages that are otherwise ordinary RAM, so a program
+    # only gets them when asked for
+    headless = args.headless or args.aot
+    if args.devices:
+        # console output would garble the display, so it waits until the end
+        console = ac_dev.Console(chunk_size=ac_dev.Console.DEFAULT_CHUNK_SIZE
+                                 if headless else None)
+        machine.bus.map_device(defs.CONSOLE_START, console)
+        machine.interrupts = ac_dev.InterruptController()
+        machine.bus.map_device(defs.INTC_START, machine.interrupts)
+        machine.bus.map_device(defs.TIMER_START,
+                               ac_dev.Timer(machine.interrupts))
+    if args.disk is not None:
+        try:
+            disk = ac_dev.Disk(machine, args.disk)
+        except (OSError, ValueError) as e:
+            logger.error(e)
+            sys.exit(1)
+        atexit.register(disk.close)
+        machine.bus.map_device(defs.DISK_START, disk)
+    if headless:
+        return machine.run_headless()
     machine.initialize_video()
     return machine.run()
 
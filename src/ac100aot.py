@@ -0,0 +1,772 @@
+# Ahead-of-time translation of AC100 programs into Python
+#
+#   python -m src.ac100aot prog.bin [-o module.py] [--cache-dir dir]
+#
+# The program's reachable code is split into the basic blocks of its
+# control-flow graph (see src.ac100cfg), and each block becomes a Python
+# function over the machine's state.  Registers, flags, and the stack pointer
+# are kept in locals while a block runs and written back when it exits; a
+# block returns the address of the next block to run.
+#
+# Translated code matches the interpreter exactly, instruction counts
+# included.  Anything unusual -- an unknown opcode, an access to a device or
+# to memory the bus protects, an invalid jump target, a stack error -- makes
+# the block write its state back and hand the instruction to the interpreter,
+# which then does whatever it would have done anyway.  A store into translated
+# code means the program modifies itself, so the rest of that run is left to
+# the interpreter.
+#
+# Translations are cached on disk as Python modules, named after a hash of the
+# binary, so Python's own bytecode cache applies to them too.
+
+import argparse
+import hashlib
+import importlib.util
+import logging
+import os
+import pathlib
+import sys
+import tempfile
+
+import src.ac100bus as ac_bus
+import src.ac100cfg as ac_cfg
+import src.definitions as defs
+import src.exceptions as ac_exc
+
+logger = logging.getLogger("ac100aot")
+parser = argparse.ArgumentParser()
+
+# part of every cache key; change it whenever translation of the same binary
+# could produce different code
+TRANSLATOR_VERSION: str = "11"
+DEFAULT_CACHE_DIR: str = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.join("~", ".cache")), "ac100aot")
+
+# what a block returns when it stops before its end, after setting PC to the
+# instruction the interpreter should run
+BAIL: int = -1
+SELF_MODIFIED: int = -2         # ... which stores into translated code
+
+_LOADS = {0x00: "LDI", 0x01: "LDR", 0x02: "LDM", 0x03: "LDBM", 0x04: "LDMX",
+          0x05: "LDMP", 0x06: "LDBMX", 0x07: "LDBMP"}
+_STORES = {0x10: "ST", 0x11: "STH", 0x12: "STL", 0x15: "STX", 0x16: "STP",
+           0x17: "STLX", 0x18: "STLP"}
+# the [Rn+offset] forms (0) and the [Rn]+ forms (how many bytes they step
+# the register), whose base register is in byte 2
+_INDEXED = {0x04: 0, 0x05: 2, 0x06: 0, 0x07: 1, 0x15: 0, 0x16: 2, 0x17: 0,
+            0x18: 1}
+_BLOCK_OPS = {0x13: "MEMCPY", 0x14: "MEMSET"}
+_COMPARES = {0x20: "CMR", 0x21: "CMI"}
+_ARITHMETIC = {0x40: "ADDI", 0x41: "ADDR", 0x42: "INC", 0x43: "SUBI",
+               0x44: "SUBR", 0x45: "DEC"}
+_MUL_DIV = {0x46: "MUL", 0x47: "DIVU", 0x48: "MOD"}
+_SHIFTS = {0x49: "LSL", 0x4A: "LSR", 0x4B: "ASR"}
+# bitwise opcode -> (Python operator, second operand, whether it's stored)
+_LOGIC = {0x50: ("&", "r", True), 0x51: ("&", "imm", True),
+          0x52: ("|", "r", True), 0x53: ("|", "imm", True),
+          0x54: ("^", "r", True), 0x55: ("^", "imm", True),
+          0x56: ("^", "not", True), 0x57: ("&", "r", False),
+          0x58: ("&", "imm", False)}
+# conditional jump -> (flag, whether the jump is taken when the flag is set)
+_BRANCHES = {0x30: (0x2, True), 0x31: (0x2, False), 0x32: (0x1, True),
+             0x33: (0x1, False), 0x34: (0x8, True), 0x35: (0x8, False),
+             0x36: (0x4, True), 0x37: (0x4, False)}
+_JMP, _JSR = 0x38, 0x39
+_PUSH, _POP, _RTS, _RTI = 0xE0, 0xE1, 0xE2, 0xE3
+_HALT, _NOP = 0xFE, 0xFF
+# the machine checks for interrupts after these (see ac100.INTERRUPT_POINTS)
+_INTERRUPT_POINTS = {*_BRANCHES, _JMP, _JSR, _RTS, _RTI}
+
+
+def _valid_target(address: int) -> bool:
+    """ Check a static jump target the way the interpreter does """
+    return (defs.STACK_MIN <= address < defs.VRAM_START
+            and address % 4 == 0)
+
+
+def _translatable(memory: bytes, pc: int) -> bool:
+    """ Check that an instruction is one the translator handles """
+    opcode, reg, hi, lo = memory[pc:pc + 4]
+    if opcode in _LOADS or opcode in _STORES:
+        if (opcode == 0x01 or opcode in _INDEXED) and hi >= defs.NUM_REGISTERS:
+            return False
+        return reg < defs.NUM_REGISTERS
+    if opcode in _BLOCK_OPS or opcode == 0x46:      # three registers
+        return max(reg, hi, lo) < defs.NUM_REGISTERS
+    if opcode in _MUL_DIV:
+        return max(reg, hi) < defs.NUM_REGISTERS
+    if opcode in _SHIFTS:
+        return reg < defs.NUM_REGISTERS
+    if opcode in _LOGIC:
+        if _LOGIC[opcode][1] == "r" and hi >= defs.NUM_REGISTERS:
+            return False
+        return reg < defs.NUM_REGISTERS
+    if opcode in _COMPARES or opcode in _ARITHMETIC:
+        if opcode in (0x20, 0x41, 0x44) and hi >= defs.NUM_REGISTERS:
+            return False
+        return reg < defs.NUM_REGISTERS
+    if opcode in (_PUSH, _POP):
+        return reg < defs.NUM_REGISTERS
+    return opcode in _BRANCHES or opcode in (_JMP, _JSR, _RTS, _HALT, _NOP)
+
+
+def _code_ranges(blocks: dict) -> [(int, int)]:
+    """ Merge the blocks' addresses into (start, end) ranges """
+    ranges = []
+    for start in sorted(blocks):
+        end = blocks[start][-1] + 4
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+# Writes the body of one block function
+class _BlockWriter:
+    def __init__(self, code_ranges: [(int, int)]):
+        self.code_ranges = code_ranges
+        self.lines: [str] = []
+        self.regs: set = set()      # registers held in locals
+        self.dirty: set = set()     # ... and changed
+        self.ps_loaded = False
+        self.ps_dirty = False
+        self.sp_loaded = False
+        self.sp_dirty = False
+
+
+    def emit(self, line: str, indent: int = 1) -> None:
+        self.lines.append("    " * indent + line)
+
+
+    def reg(self, n: int) -> str:
+        """ Name the local holding a register, loading it first if needed """
+        if n not in self.regs:
+            self.emit(f"r{n} = R[{n}][0] << 8 | R[{n}][1]")
+            self.regs.add(n)
+        return f"r{n}"
+
+
+    def set_reg(self, n: int) -> str:
+        """ Name the local holding a register that is about to change """
+        self.regs.add(n)
+        self.dirty.add(n)
+        return f"r{n}"
+
+
+    def flags(self) -> str:
+        if not self.ps_loaded:
+            self.emit("ps = m.PS")
+            self.ps_loaded = True
+        return "ps"
+
+
+    def set_flags(self, cleared: int, value: str) -> None:
+        """ Clear some flags, then OR value into the status register """
+        self.flags()
+        self.ps_dirty = True
+        self.emit(f"ps = ps & ~0x{cleared:x}" + (f" | {value}" if value else ""))
+
+
+    def set_zn(self, name: str) -> None:
+        """ Set Z and N from a 16-bit value, like a load """
+        self.set_flags(0xa, f"({name} == 0) << 1 | {name} >> 12 & 8")
+
+
+    def stack(self) -> str:
+        if not self.sp_loaded:
+            self.emit("sp = m.SP")
+            self.sp_loaded = True
+        return "sp"
+
+
+    def writeback(self, indent: int) -> None:
+        for n in sorted(self.dirty):
+            self.emit(f"R[{n}][0] = r{n} >> 8", indent)
+            self.emit(f"R[{n}][1] = r{n} & 0xff", indent)
+        if self.ps_dirty:
+            self.emit("m.PS = ps", indent)
+        if self.sp_dirty:
+            self.emit("m.SP = sp", indent)
+
+
+    def bail(self, pc: int, indent: int = 1, status: int = BAIL) -> None:
+        """ Stop before the instruction at pc and let the interpreter run it """
+        self.writeback(indent)
+        self.emit(f"m.PC = 0x{pc:x}", indent)
+        self.emit(f"return {status}", indent)
+
+
+    def bail_if(self, condition: str, pc: int, status: int = BAIL) -> None:
+        self.emit(f"if {condition}:")
+        self.bail(pc, 2, status)
+
+
+    def exit(self, value: str) -> None:
+        self.writeback(1)
+        self.emit(f"return {value}")
+
+
+    def not_ram(self, address: str, width: int, permission: int) -> str:
+        """
+        A condition that's true unless an access of width bytes is to RAM
+        that allows it, according to the bus's access table A
+        """
+        mask = f"0x{ac_bus.DEVICE | permission:x}"
+        tests = [f"A[{address}] & {mask} != 0x{permission:x}"]
+        if width == 2:
+            tests.append(f"A[{address} + 1] & {mask} != 0x{permission:x}")
+        return " or ".join(tests)
+
+
+    def in_code(self, name: str, width: int) -> str:
+        """ A condition that's true if a store of width bytes hits the code """
+        tests = [f"0x{start - width + 1:x} <= {name} < 0x{end:x}"
+                 for start, end in self.code_ranges]
+        return " or ".join(tests) if tests else "False"
+
+
+    def overlaps_code(self, address: str, length: str) -> str:
+        """ A condition that's true if a store of length bytes hits the code """
+        tests = [f"{address} < 0x{end:x} and {address} + {length} > 0x{start:x}"
+                 for start, end in self.code_ranges]
+        return " or ".join(tests) if tests else "False"
+
+
+def _address(writer: _BlockWriter, operand: int) -> str:
+    """ Resolve a memory operand, which may name a register """
+    if operand < 0x10:
+        writer.emit(f"a = {writer.reg(operand)}")
+        return "a"
+    return f"0x{operand:x}"
+
+
+def _indexed_address(writer: _BlockWriter, opcode: int, hi: int,
+                     lo: int) -> str:
+    """ Resolve an [Rn+offset] or [Rn]+ operand """
+    base = writer.reg(hi)
+    if _INDEXED[opcode]:
+        writer.emit(f"a = {base}")
+    else:
+        writer.emit(f"a = ({base} + 0x{lo:x}) & 0xffff")
+    return "a"
+
+
+def _step_base(writer: _BlockWriter, opcode: int, hi: int) -> None:
+    """ Step the base register of an [Rn]+ operand, once a is accessed """
+    if _INDEXED.get(opcode):
+        writer.emit(f"{writer.set_reg(hi)} = (a + {_INDEXED[opcode]}) "
+                    "& 0xffff")
+
+
+def _translate_instruction(writer: _BlockWriter, memory: bytes,
+                           pc: int) -> bool:
+    """
+    Translate one instruction into a block's body.
+
+    Return:
+    True if the instruction ends the block.
+    """
+    opcode, reg, hi, lo = memory[pc:pc + 4]
+    operand = hi << 8 | lo
+    if not _translatable(memory, pc):
+        writer.bail(pc)
+        return True
+
+    if opcode in _LOADS:
+        match _LOADS[opcode]:
+            case "LDI":
+                writer.emit(f"{writer.set_reg(reg)} = 0x{operand:x}")
+                value = (2 if operand == 0 else 0) | (8 if operand & 0x8000
+                                                      else 0)
+                writer.set_flags(0xa, f"0x{value:x}" if value else "")
+                return False
+            case "LDR":
+                src = writer.reg(hi)
+                writer.emit(f"{writer.set_reg(reg)} = {src}")
+            case "LDMX" | "LDMP":
+                _indexed_address(writer, opcode, hi, lo)
+                writer.bail_if(f"a == 0x{defs.ADDRESS_MAX:x} or "
+                               + writer.not_ram("a", 2, ac_bus.READ), pc)
+                # before the load, so a destination that is also the base
+                # register ends up with the loaded word
+                _step_base(writer, opcode, hi)
+                writer.emit(f"{writer.set_reg(reg)} = RAM[a] << 8 | "
+                            "RAM[a + 1]")
+            case "LDBM" | "LDBMX" | "LDBMP":
+                if opcode in _INDEXED:
+                    address = _indexed_address(writer, opcode, hi, lo)
+                else:
+                    address = _address(writer, operand)
+                writer.bail_if(writer.not_ram(address, 1, ac_bus.READ), pc)
+                _step_base(writer, opcode, hi)
+                writer.emit(f"{writer.set_reg(reg)} = RAM[{address}]")
+                # LDBM leaves N alone
+                writer.set_flags(0x2, f"(r{reg} == 0) << 1")
+                return False
+            case "LDM":
+                address = _address(writer, operand)
+                # the interpreter fails halfway through a word at the top of
+                # memory, which only it can reproduce
+                if operand < 0x10:
+                    writer.bail_if(f"a == 0x{defs.ADDRESS_MAX:x}", pc)
+                elif operand == defs.ADDRESS_MAX:
+                    writer.bail(pc)
+                    return True
+                # devices and read-protected memory are the interpreter's
+                writer.bail_if(writer.not_ram(address, 2, ac_bus.READ), pc)
+                writer.emit(f"{writer.set_reg(reg)} = RAM[{address}] << 8 | "
+                            f"RAM[{address} + 1]")
+        writer.set_zn(f"r{reg}")
+
+    elif opcode in _STORES:
+        mnemonic = _STORES[opcode]
+        width = 2 if mnemonic in ("ST", "STX", "STP") else 1
+        if opcode in _INDEXED:
+            address = _indexed_address(writer, opcode, hi, lo)
+        else:
+            address = _address(writer, operand)
+        if address == "a":
+            writer.bail_if(writer.not_ram("a", width, ac_bus.WRITE) + (
+                f" or a == 0x{defs.ADDRESS_MAX:x}" if width == 2 else ""), pc)
+            writer.bail_if(writer.in_code("a", width), pc, SELF_MODIFIED)
+        else:
+            if width == 2 and operand == defs.ADDRESS_MAX:
+                writer.bail(pc)
+                return True
+            if any(start - width < operand < end
+                   for start, end in writer.code_ranges):
+                writer.bail(pc, status=SELF_MODIFIED)
+                return True
+            writer.bail_if(writer.not_ram(address, width, ac_bus.WRITE), pc)
+        value = writer.reg(reg)
+        match mnemonic:
+            case "ST" | "STX" | "STP":
+                writer.emit(f"RAM[{address}] = {value} >> 8")
+                writer.emit(f"RAM[{address} + 1] = {value} & 0xff")
+            case "STH":
+                writer.emit(f"RAM[{address}] = {value} >> 8")
+            case "STL" | "STLX" | "STLP":
+                writer.emit(f"RAM[{address}] = {value} & 0xff")
+        _step_base(writer, opcode, hi)
+
+    elif opcode in _BLOCK_OPS:
+        source, dest, length = writer.reg(reg), writer.reg(hi), writer.reg(lo)
+        # devices, protected memory such as the stack, and ranges past the top
+        # of memory are the interpreter's; a length of 0 does nothing anywhere
+        checks = [f"not m.bus.plain({dest}, {length}, 0x{ac_bus.WRITE:x})"]
+        if _BLOCK_OPS[opcode] == "MEMCPY":
+            checks.append(
+                f"not m.bus.plain({source}, {length}, 0x{ac_bus.READ:x})")
+        writer.bail_if(f"{length} and ({' or '.join(checks)})", pc)
+        writer.bail_if(f"{length} and ({writer.overlaps_code(dest, length)})",
+                       pc, SELF_MODIFIED)
+        if _BLOCK_OPS[opcode] == "MEMCPY":
+            writer.emit(f"RAM[{dest}:{dest} + {length}] = "
+                        f"RAM[{source}:{source} + {length}]")
+        else:
+            writer.emit(f"RAM[{dest}:{dest} + {length}] = "
+                        f"bytes(({source} & 0xff,)) * {length}")
+
+    elif opcode in _COMPARES:
+        a = writer.reg(reg)
+        if _COMPARES[opcode] == "CMR":
+            writer.emit(f"t = {a} + (-{writer.reg(hi)} & 0xffff)")
+        else:
+            writer.emit(f"t = {a} + 0x{-operand & 0xffff:x}")
+        writer.emit("s = t & 0xffff")
+        writer.set_flags(0xb, "t >> 16 | (s == 0) << 1 | s >> 12 & 8")
+
+    elif opcode in _ARITHMETIC:
+        mnemonic = _ARITHMETIC[opcode]
+        a = writer.reg(reg)
+        if mnemonic in ("INC", "DEC"):
+            step = "+" if mnemonic == "INC" else "-"
+            writer.emit(f"{writer.set_reg(reg)} = ({a} {step} 1) & 0xffff")
+            writer.set_zn(a)
+            return False
+        match mnemonic:
+            case "ADDI": b = f"0x{operand:x}"
+            case "SUBI": b = f"0x{-operand & 0xffff:x}"
+            case "ADDR": b = writer.reg(hi)
+            case "SUBR":
+                writer.emit(f"b = -{writer.reg(hi)} & 0xffff")
+                b = "b"
+        writer.emit(f"t = {a} + {b}")
+        writer.emit(f"v = ({a} ^ t) & ({b} ^ t)")
+        writer.emit(f"{writer.set_reg(reg)} = t & 0xffff")
+        writer.set_flags(0xf, f"t >> 16 | ({a} == 0) << 1 | v >> 13 & 4 | "
+                         f"{a} >> 12 & 8")
+
+    elif opcode in _MUL_DIV:
+        mnemonic = _MUL_DIV[opcode]
+        a, b = writer.reg(reg), writer.reg(hi)
+        if mnemonic == "MUL":
+            writer.emit(f"t = {a} * {b}")
+            writer.emit(f"{writer.set_reg(reg)} = t & 0xffff")
+            writer.set_flags(0xf, f"(t > 0xffff) * 5 | (r{reg} == 0) << 1 | "
+                             f"r{reg} >> 12 & 8")
+            writer.emit(f"{writer.set_reg(lo)} = t >> 16")
+        else:
+            writer.bail_if(f"{b} == 0", pc)
+            operator = "//" if mnemonic == "DIVU" else "%"
+            writer.emit(f"{writer.set_reg(reg)} = {a} {operator} {b}")
+            writer.set_flags(0xf, f"(r{reg} == 0) << 1 | r{reg} >> 12 & 8")
+
+    elif opcode in _SHIFTS:
+        # the count is a constant, so only the shift itself is left to run
+        mnemonic = _SHIFTS[opcode]
+        a = writer.reg(reg)
+        count = min(operand, 16 if mnemonic == "ASR" else 17)
+        if count == 0:
+            writer.set_flags(0xf, f"({a} == 0) << 1 | {a} >> 12 & 8")
+            return False
+        if mnemonic == "LSL":
+            writer.emit(f"t = {a} << {count}")
+            writer.emit(f"{writer.set_reg(reg)} = t & 0xffff")
+            carry = "t >> 16 & 1"
+        else:
+            if mnemonic == "ASR":
+                writer.emit(f"t = {a} - (({a} & 0x8000) << 1)")
+            else:
+                writer.emit(f"t = {a}")
+            writer.emit(f"{writer.set_reg(reg)} = t >> {count} & 0xffff")
+            carry = f"t >> {count - 1} & 1"
+        writer.set_flags(0xf, f"{carry} | (r{reg} == 0) << 1 | "
+                         f"r{reg} >> 12 & 8")
+
+    elif opcode in _LOGIC:
+        operator, form, stored = _LOGIC[opcode]
+        a = writer.reg(reg)
+        match form:
+            case "r": b = writer.reg(hi)
+            case "imm": b = f"0x{operand:x}"
+            case "not": b = "0xffff"
+        result = writer.set_reg(reg) if stored else "t"
+        writer.emit(f"{result} = {a} {operator} {b}")
+        writer.set_flags(0xf, f"({result} == 0) << 1 | {result} >> 12 & 8")
+
+    elif opcode == _PUSH:
+        sp = writer.stack()
+        writer.bail_if(f"{sp} == 0 or {sp} & 1", pc)
+        value = writer.reg(reg)
+        writer.sp_dirty = True
+        writer.emit("sp -= 2")
+        writer.emit(f"RAM[sp] = {value} >> 8")
+        writer.emit(f"RAM[sp + 1] = {value} & 0xff")
+
+    elif opcode == _POP:
+        sp = writer.stack()
+        writer.bail_if(f"{sp} == 0x{defs.STACK_MIN:x} or {sp} & 1", pc)
+        writer.emit(f"{writer.set_reg(reg)} = RAM[sp] << 8 | RAM[sp + 1]")
+        writer.sp_dirty = True
+        writer.emit("sp += 2")
+
+    elif opcode in _BRANCHES or opcode in (_JMP, _JSR):
+        if not _valid_target(operand):
+            writer.bail(pc)
+            return True
+        # the bus may map a device, which can't be executed, at the target
+        writer.bail_if(f"not A[0x{operand:x}] & 0x{ac_bus.EXECUTE:x}", pc)
+        if opcode == _JMP:
+            writer.exit(f"0x{operand:x}")
+        elif opcode == _JSR:
+            sp = writer.stack()
+            writer.bail_if(f"{sp} == 0", pc)
+            writer.sp_dirty = True
+            writer.emit("sp -= 2")
+            writer.emit(f"RAM[sp] = 0x{(pc + 4) >> 8:x}")
+            writer.emit(f"RAM[sp + 1] = 0x{(pc + 4) & 0xff:x}")
+            writer.exit(f"0x{operand:x}")
+        else:
+            flag, when_set = _BRANCHES[opcode]
+            taken, not_taken = f"0x{operand:x}", f"0x{pc + 4:x}"
+            if not when_set:
+                taken, not_taken = not_taken, taken
+            writer.exit(f"{taken} if {writer.flags()} & 0x{flag:x} "
+                        f"else {not_taken}")
+        return True
+
+    elif opcode == _RTS:
+        sp = writer.stack()
+        writer.bail_if(f"{sp} == 0x{defs.CODE_START:x}", pc)
+        writer.emit("a = RAM[sp] << 8 | RAM[sp + 1]")
+        writer.bail_if(f"a < 0x{defs.CODE_START:x}", pc)
+        writer.sp_dirty = True
+        writer.emit("sp += 2")
+        writer.exit("a")
+        return True
+
+    elif opcode == _HALT:
+        writer.emit("m.halted = True")
+        writer.exit(f"0x{pc:x}")
+        return True
+
+    return False
+
+
+def translate(program: bytes) -> str:
+    """
+    Translate a program into the source of a Python module.
+
+    Parameters:
+    program: a flat binary, which loads at CODE_START, or a sparse image.
+    Raises ImageFormatError if a sparse image is malformed.
+
+    Return:
+    The module's source.  It defines one function per basic block, BLOCKS
+    (block address -> function), LENGTHS (block address -> number of
+    instructions), and CHECKS, the blocks that end with an instruction after
+    which the machine checks for interrupts.  Each function takes the
+    machine, its REGS, its RAM, and its bus's access table, and returns the
+    address of the next block, or BAIL or SELF_MODIFIED.
+    """
+    graph = ac_cfg.ControlFlowGraph.from_program(program)
+    memory = graph.memory
+    blocks = {start: list(block.addresses)
+              for start, block in graph.blocks.items()}
+    code_ranges = _code_ranges(blocks)
+
+    digest = hashlib.sha256(program).hexdigest()
+    out = [f"# AC100 program {digest}",
+           f"# translated by src.ac100aot version {TRANSLATOR_VERSION}; "
+           "do not edit", ""]
+    for start, pcs in blocks.items():
+        writer = _BlockWriter(code_ranges)
+        for pc in pcs:
+            if _translate_instruction(writer, memory, pc):
+                break
+        else:                   # falls through into the next block
+            writer.exit(f"0x{pcs[-1] + 4:x}")
+        out.append("")
+        out.append(f"def block_{start:04x}(m, R, RAM, A):")
+        out.extend(writer.lines)
+        out.append("")
+    out.append("")
+    out.append("BLOCKS = {")
+    out.extend(f"    0x{start:x}: block_{start:04x}," for start in blocks)
+    out.append("}")
+    out.append("LENGTHS = {")
+    out.extend(f"    0x{start:x}: {len(pcs)}," for start, pcs in blocks.items())
+    out.append("}")
+    checks = [start for start, pcs in blocks.items()
+              if memory[pcs[-1]] in _INTERRUPT_POINTS]
+    out.append("CHECKS = frozenset({")
+    out.extend(f"    0x{start:x}," for start in checks)
+    out.append("})")
+    return "\n".join(out) + "\n"
+
+
+def cache_key(program: bytes) -> str:
+    digest = hashlib.sha256(TRANSLATOR_VERSION.encode("utf-8") + b"\0")
+    digest.update(program)
+    return digest.hexdigest()
+
+
+# Runs a translated program on an AC100
+class Backend:
+    def __init__(self, blocks: dict, lengths: dict,
+                 checks: frozenset = frozenset()):
+        self.blocks = blocks
+        self.lengths = lengths
+        self.checks = checks
+        self.code_start = min(lengths, default=0)
+        self.code_end = max((start + 4 * n for start, n in lengths.items()),
+                            default=0)
+        self.self_modified: bool = False  # set once the program stores into
+                                          # its own code
+        self.machine = None     # the machine self_modified is about
+
+
+    @classmethod
+    def from_module(cls, module) -> "Backend":
+        return cls(module.BLOCKS, module.LENGTHS, module.CHECKS)
+
+
+    def reset(self) -> None:
+        """
+        Forget that the code was modified, for when the program has been
+        loaded again; AC100.load_ram() calls this.
+        """
+        self.self_modified = False
+
+
+    def invalidate(self, address: int, length: int) -> None:
+        """
+        Note that something other than a store, such as a device, wrote
+        length bytes at address; if that overlaps translated code, the rest
+        of the run is interpreted.
+        """
+        if (self.self_modified or address >= self.code_end
+                or address + length <= self.code_start):
+            return
+        for start, n in self.lengths.items():
+            if start - length < address < start + 4 * n:
+                logger.info(f"Write into code at 0x{address:04x}; "
+                            "interpreting the rest of the program")
+                self.self_modified = True
+                return
+
+
+    def run(self, machine, max_instructions: int = None) -> int:
+        """
+        Run the program loaded in a machine, like AC100.run_headless().
+
+        Parameters:
+        - machine: the AC100, with the program this backend was translated
+          from loaded into its memory
+        - max_instructions: if given, stop after executing this many
+          instructions
+
+        Return:
+        The same as AC100.interpret().  If an instruction raises, the
+        exception propagates and, as with the interpreter, instruction_count
+        is left as it was.
+
+        A store into the code makes the rest of the run interpreted, until
+        the program is loaded again or the backend runs on another machine.
+        """
+        if machine is not self.machine: # a machine with the code intact
+            self.machine = machine
+            self.reset()
+        count = machine.instruction_count
+        try:
+            return self._run(machine, max_instructions)
+        except BaseException:
+            machine.instruction_count = count
+            raise
+
+
+    def _run(self, machine, max_instructions: int) -> int:
+        blocks = self.blocks
+        lengths = self.lengths
+        checks = self.checks
+        interrupts = machine.interrupts
+        R = machine.REGS
+        RAM = machine.RAM
+        A = machine.bus.access
+        vram_start = machine.VRAM_START
+        executed = 0
+        interpret = False       # the next instruction is the interpreter's
+        while machine.PC < vram_start and not machine.halted:
+            if self.self_modified:
+                return machine.interpret(None if max_instructions is None
+                                         else max_instructions - executed)
+            pc = machine.PC
+            block = None if interpret else blocks.get(pc)
+            if block is not None and (max_instructions is None or
+                                      executed + lengths[pc] <= max_instructions):
+                result = block(machine, R, RAM, A)
+                if result >= 0:
+                    machine.PC = result
+                    n = lengths[pc]
+                else:
+                    n = (machine.PC - pc) >> 2
+                    interpret = True
+                    if result == SELF_MODIFIED:
+                        logger.info(f"Store into code at 0x{machine.PC:04x}; "
+                                    "interpreting the rest of the program")
+                        self.self_modified = True
+                machine.instruction_count += n
+                executed += n
+                # a block that bailed stops before its last instruction, and
+                # the interpreter checks after running that itself
+                if (interrupts is not None
+                        and machine.instruction_count >= interrupts.due
+                        and result >= 0 and pc in checks):
+                    machine.poll_interrupts(machine.instruction_count)
+                continue
+            if max_instructions is not None and executed >= max_instructions:
+                break
+            before = machine.instruction_count
+            status = machine.interpret(1)
+            executed += machine.instruction_count - before
+            interpret = False
+            if status != 0:
+                return status
+        return 0
+
+
+def _import(path: pathlib.Path):
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load(program: bytes, cache_dir: str = None) -> Backend:
+    """
+    Translate a program, or fetch its translation from the cache.
+
+    Parameters:
+    - program: the binary, as given to AC100.load_ram()
+    - cache_dir: where translations are kept (default: DEFAULT_CACHE_DIR)
+
+    Return:
+    A Backend for the program; assign it to an AC100's backend to have
+    run_headless() use it.  Raises ImageFormatError if program is a malformed
+    sparse image.
+    """
+    directory = pathlib.Path(os.path.expanduser(cache_dir or DEFAULT_CACHE_DIR))
+    path = directory / f"ac100aot_{cache_key(program)}.py"
+    if not path.exists():
+        source = translate(program)
+        directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(source)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        logger.info(f"Translated program into {path}")
+    return Backend.from_module(_import(path))
+
+
+def setup_parser(parser) -> None:
+    """ Set up ArgumentParser """
+    parser.add_argument("binary", help="AC100 binary to translate")
+    parser.add_argument("-o", "--output", metavar="file",
+                        help="write the module here instead of into the cache")
+    parser.add_argument("--cache-dir", metavar="dir",
+                        help="translation cache (default: "
+                        f"{DEFAULT_CACHE_DIR})")
+    parser.add_argument("-l", "--loglevel", default="warning",
+                        choices=["debug", "info", "warning", "error"],
+                        metavar="level", help="logging level")
+
+
+def setup_logger(level) -> None:
+    """
+    Set up logger
+
+    Parameters:
+    level: the level to use
+    """
+    format = "[%(levelname)s] %(name)s:%(funcName)s():%(lineno)d: %(message)s"
+    logging.basicConfig(format=format, level=logging.getLevelName(level))
+
+
+def main():
+    setup_parser(parser)
+    args = parser.parse_args()
+    setup_logger(args.loglevel.upper())
+    try:
+        with open(args.binary, "rb") as f:
+            program = f.read()
+        if args.output is not None:
+            with open(args.output, "w") as f:
+                f.write(translate(program))
+        else:
+            load(program, args.cache_dir)
+    except OSError as e:
+        logger.error(e)
+        sys.exit(1)
+    except ac_exc.ImageFormatError as e:
+        logger.error(e)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,66 @@
 import argparse
+import codecs
+import concurrent.futures
+import dataclasses
 import logging
+import os
+import pathlib
 import re
 import sys
 import typing
 
+import src.ac100cache as ac_cache
+import src.ac100img as ac_img
+import src.ac100ld as ac_ld
+import src.ac100map as ac_map
+import src.ac100obj as ac_obj
+import src.ac100opt as ac_opt
+import src.ac100pp as ac_pp
 import src.definitions as defs
 import src.exceptions as ac_exc
 
 logger = logging.getLogger("ac100asm")
-parser = argparse.ArgumentParser()
 
 DEFAULT_OUTPUT: str = "out.bin"
+DEFAULT_OBJECT_OUTPUT: str = "out.o"
+# directives that emit bytes rather than instructions
+DATA_DIRECTIVES = (".word", ".byte", ".ascii", ".fill")
+# part of every cache key; change it whenever the same source could assemble
+# to different output
+ASSEMBLER_VERSION: str = "10"
+
+# opcodes of the instructions whose operands are all registers, and how many
+REGISTER_OPERANDS = {
+    "MEMCPY": (0x13, 3), "MEMSET": (0x14, 3),
+    "MUL": (0x46, 3), "DIVU": (0x47, 2), "MOD": (0x48, 2),
+    "ANDR": (0x50, 2), "ORR": (0x52, 2), "XORR": (0x54, 2), "NOT": (0x56, 1),
+    "TSTR": (0x57, 2),
+}
+# opcodes of the [Rn+offset] and [Rn]+ forms of the instructions that have
+# them
+INDEXED_OPCODES = {"LDM": (0x04, 0x05), "LDBM": (0x06, 0x07),
+                   "ST": (0x15, 0x16), "STL": (0x17, 0x18)}
+INDEXED_OPERAND = re.compile(r"\[R\d{1,2}(\+|\]\+)")
+# opcodes of the instructions that take a register and a 16-bit immediate
+IMMEDIATE_OPERANDS = {
+    "LSL": 0x49, "LSR": 0x4A, "ASR": 0x4B,
+    "ANDI": 0x51, "ORI": 0x53, "XORI": 0x55, "TSTI": 0x58,
+}
+
+@dataclasses.dataclass
+class AssemblyResult:
+    bytecode: bytes             # flat binary or sparse image for load_ram()
+    labels: dict                # label -> address
+    line_map: dict              # source line number -> instruction address
+
+
+class FileResult(typing.NamedTuple):
+    path: str                   # the source file
+    output: bytes               # bytecode or object file; None on failure
+    diagnostics: [logging.LogRecord] # log records emitted while assembling
+    labels: dict = None         # label -> address; None on failure
+    line_map: dict = None       # source line number -> instruction address
+
 
 class LabelDict(typing.TypedDict):
     name: str                   # the label
@@ -25,6 +75,12 @@ class AC100ASM:
         self.lineno: int = 0    # line number of current source line
         self.default_output: str = DEFAULT_OUTPUT
         self.offset = defs.CODE_START # code section starts here
+        # when set, emit relocation entries so the output can be linked
+        self.relocatable: bool = False
+        self.exports: [str] = []        # labels named by .global
+        self.relocations: [ac_obj.Relocation] = []
+        self.optimize: bool = False     # run the peephole optimizer
+        self.line_map: dict = {}        # source line -> instruction address
 
 
     def parse_label(self, tokens: [str]) -> str:
@@ -112,6 +168,67 @@ class AC100ASM:
             return self.parse_register_name(register_tok)
 
 
+    def parse_indexed(self, token: str) -> (int, int):
+        """
+        Parse an [Rn+offset] or [Rn]+ memory operand.
+
+        Parameters:
+        token: the token to parse
+
+        Return: a 2-tuple (register, offset), where offset is None for [Rn]+,
+        or None if the token is neither form.  Raises ValueError if the
+        offset isn't in the range 0--255.
+        """
+        match = re.fullmatch(r"\[(R\d{1,2})(?:\+([^\]]+)\]|\]\+)", token)
+        if match is None:
+            return None
+        register = self.parse_register_name(match.group(1))
+        if match.group(2) is None:
+            return (register, None)
+        offset = int.from_bytes(self.parse_int(match.group(2)),
+                                byteorder='big')
+        if offset > 0xff:
+            raise ValueError(f"Offset {match.group(2)} does not fit in 8 bits")
+        return (register, offset)
+
+
+    def _assemble_indexed(self, tokens: [str]) -> bytes:
+        """
+        Assemble the [Rn+offset] or [Rn]+ form of an instruction listed in
+        INDEXED_OPCODES
+
+        Parameters:
+        tokens: the line to be assembled
+
+        Return:
+        On success, return the assembled bytecode.  On failure, return None
+        """
+        if tokens[0] not in INDEXED_OPCODES:
+            logger.error(f"{tokens[0]} has no [Rn+offset] or [Rn]+ form")
+            return None
+        if len(tokens) != 3:
+            logger.error(f"{tokens[0]} takes a register and a memory operand, "
+                         f"not '{' '.join(tokens[1:])}'")
+            return None
+        try:
+            register = self.parse_register_name(tokens[1])
+            operand = self.parse_indexed(tokens[2])
+        except (ac_exc.InvalidRegisterNameError,
+                ac_exc.RegisterNameMissingPrefixError, ValueError) as e:
+            logger.error(e)
+            return None
+        if operand is None:
+            logger.error(f"Malformed memory operand '{tokens[2]}'")
+            return None
+        base, offset = operand
+        indexed, post_increment = INDEXED_OPCODES[tokens[0]]
+        opcode = post_increment if offset is None else indexed
+        bytecode = bytes([opcode, register, base, offset or 0])
+
+        self._increment_offset()
+        return self._check_len(bytecode)
+
+
     def parse_int(self, token) -> bytes:
         """
         Parse an integer.
@@ -191,6 +308,46 @@ class AC100ASM:
         return address
 
 
+    def _resolve_address(self, token: str, field: int = None,
+                         kind: int = ac_obj.RELOC_DATA) -> (bytes, bool):
+        """
+        Resolve an address operand given as a label or a hex address.
+
+        Every label reference is recorded as a relocation, which lets the
+        peephole optimizer find addresses it has to move.  When assembling a
+        relocatable object, labels not defined in this source file are left as
+        0x0000 for the linker to fill in.
+
+        Parameters:
+        - token: the operand to resolve
+        - field: offset of the address in the code, if it isn't bytes 2 and 3
+          of the instruction being assembled
+        - kind: the kind of relocation to record, RELOC_JUMP for a jump target
+
+        Return:
+        A 2-tuple (address, external): the address as bytes, and whether it
+        refers to a label defined outside this source file.  Raises ValueError
+        if the operand is neither a known label nor a valid address.
+        """
+        if field is None:
+            field = self.offset - defs.CODE_START + 2 # address is bytes 2, 3
+        if not token.startswith(defs.HEX_PREFIX):
+            label = self.parse_label([token])
+            if label is not None:
+                offset = self.get_label_offset(label)
+                if offset is not None:
+                    reloc = ac_obj.Relocation(field, "", offset - defs.CODE_START,
+                                              kind)
+                    self.relocations.append(reloc)
+                    return (offset.to_bytes(2, byteorder='big'), False)
+                if self.relocatable:
+                    self.relocations.append(ac_obj.Relocation(field, label, 0,
+                                                              kind))
+                    return (b"\x00\x00", True)
+
+        return (self.parse_address(token), False)
+
+
     def tokenize_line(self, line) -> [str]:
         """
         Split a source line into tokens
@@ -318,6 +475,8 @@ class AC100ASM:
         """
         bytecode: bytes = b""
         opcode = tokens[0]
+        if len(tokens) > 2 and INDEXED_OPERAND.match(tokens[2]):
+            return self._assemble_indexed(tokens)
         match opcode:
             case "LDM": bytecode = b"\x02"
             case "LDBM": bytecode = b"\x03"
@@ -336,9 +495,9 @@ class AC100ASM:
         if tokens[2].startswith("["): # register indirect addressing
             reg_num = self.parse_register_indirect(tokens[2])
             bytecode += reg_num.to_bytes(2, byteorder='big')
-        else:                   # direct address
+        else:                   # direct address or label
             try:
-                address = self.parse_address(tokens[2])
+                address, _ = self._resolve_address(tokens[2])
             except ValueError as e:
                 logger.error(e)
                 return None
@@ -363,6 +522,8 @@ class AC100ASM:
         """
         bytecode: bytes = b""
         opcode: str = tokens[0]
+        if len(tokens) > 2 and INDEXED_OPERAND.match(tokens[2]):
+            return self._assemble_indexed(tokens)
         match opcode:
             case "ST": bytecode = b"\x10"
             case "STH": bytecode = b"\x11"
@@ -385,9 +546,9 @@ class AC100ASM:
         if tokens[2].startswith("["): # register indirect addressing
             reg_num = self.parse_register_indirect(tokens[2])
             bytecode += reg_num.to_bytes(2, byteorder='big')
-        else:                   # direct address
+        else:                   # direct address or label
             try:
-                address = self.parse_address(tokens[2])
+                address, _ = self._resolve_address(tokens[2])
             except ValueError as e:
                 logger.error(e)
                 return None
@@ -401,6 +562,71 @@ class AC100ASM:
         return self._check_len(bytecode)
 
 
+    def _assemble_registers(self, tokens: [str]) -> bytes:
+        """
+        Assemble an instruction whose operands are all registers, listed in
+        REGISTER_OPERANDS
+
+        Parameters:
+        tokens: the line to be assembled
+
+        Return:
+        On success, return the assembled bytecode.  On failure, return None
+        """
+        opcode, count = REGISTER_OPERANDS[tokens[0]]
+        if len(tokens) != count + 1:
+            logger.error(f"{tokens[0]} takes {count} registers, not "
+                         f"'{' '.join(tokens[1:])}'")
+            return None
+        bytecode: bytes = opcode.to_bytes(1, byteorder='big')
+        for token in tokens[1:]:
+            try:
+                register = self.parse_register_name(token)
+            except (ac_exc.InvalidRegisterNameError,
+                    ac_exc.RegisterNameMissingPrefixError, ValueError) as e:
+                logger.error(e)
+                return None
+            bytecode += register.to_bytes(1, byteorder='big')
+        bytecode = bytecode.ljust(4, b"\x00")  # unused bytes
+
+        self._increment_offset()
+        return self._check_len(bytecode)
+
+
+    def _assemble_immediate(self, tokens: [str]) -> bytes:
+        """
+        Assemble an instruction that takes a register and a 16-bit immediate,
+        listed in IMMEDIATE_OPERANDS
+
+        Parameters:
+        tokens: the line to be assembled
+
+        Return:
+        On success, return the assembled bytecode.  On failure, return None
+        """
+        if len(tokens) != 3:
+            logger.error(f"{tokens[0]} takes a register and a value, not "
+                         f"'{' '.join(tokens[1:])}'")
+            return None
+        bytecode: bytes = IMMEDIATE_OPERANDS[tokens[0]].to_bytes(
+            1, byteorder='big')
+        try:
+            register = self.parse_register_name(tokens[1])
+        except (ac_exc.InvalidRegisterNameError,
+                ac_exc.RegisterNameMissingPrefixError, ValueError) as e:
+            logger.error(e)
+            return None
+        bytecode += register.to_bytes(1, byteorder='big')
+        try:
+            bytecode += self.parse_int(tokens[2])
+        except ValueError as e:
+            logger.error(e)
+            return None
+
+        self._increment_offset()
+        return self._check_len(bytecode)
+
+
     def _assemble_cmr(self, tokens: [str]) -> bytes:
         """
         Assemble a CMR instruction
@@ -514,33 +740,30 @@ class AC100ASM:
         bytecode += b"\x00"     # second byte unused
 
         address: bytes = None
+        external: bool = False  # label the linker resolves
 
-        # see if it's a label
-        label = self.parse_label([tokens[1]])
-        if label is not None:
-            offset = self.get_label_offset(label)
-            if offset is not None:
-                address = offset.to_bytes(2, byteorder='big')
-        if address is None:
-            try:
-                address = self.parse_address(tokens[1])
-            except ValueError as e:
-                logger.error(e)
-                return None
-            except Exception as e:
-                logger.error("Unexpected error:", e)
-                return None
+        try:
+            address, external = self._resolve_address(
+                tokens[1], kind=ac_obj.RELOC_JUMP)
+        except ValueError as e:
+            logger.error(e)
+            return None
+        except Exception as e:
+            logger.error("Unexpected error:", e)
+            return None
         # stack space may not be interpreted as executable code --- bad idea
         # anyways
         addr_as_int = address[0] << 8 | address[1]
-        if addr_as_int < defs.STACK_MIN:
+        if external:
+            pass                # checked by AC100LD.link() once resolved
+        elif addr_as_int < defs.STACK_MIN:
             logger.error("Programs may not jump into stack space "
                          f"([0x{defs.STACK_MAX:04x}, "
                          f"0x{defs.STACK_MIN:04x}])")
             return None
         # all instructions are four-byte aligned; jumping to a misaligned
         # address is sure to cause bugs
-        if addr_as_int % 4 != 0:
+        elif addr_as_int % 4 != 0:
             logger.error(f"Address 0x{addr_as_int:04x} not 4-byte aligned")
             return None
         bytecode += address
@@ -824,6 +1047,19 @@ class AC100ASM:
 
     def _assemble_rts(self, tokens: [str]) -> bytes:
         bytecode = b"\xe2\x00\x00\x00"
+        self._increment_offset()
+        return self._check_len(bytecode)
+
+
+    def _assemble_rti(self, tokens: [str]) -> bytes:
+        bytecode = b"\xe3\x00\x00\x00"
+        self._increment_offset()
+        return self._check_len(bytecode)
+
+
+    def _assemble_wait(self, tokens: [str]) -> bytes:
+        bytecode = b"\xe4\x00\x00\x00"
+        self._increment_offset()
         return self._check_len(bytecode)
 
 
@@ -839,6 +1075,158 @@ class AC100ASM:
         return bytecode
 
 
+    def _parse_byte(self, token: str) -> int:
+        """
+        Parse a value that has to fit in one byte.
+
+        Parameters:
+        token: the token to parse
+
+        Return:
+        The byte as an int.  Raises ValueError if token is not an integer in
+        the range -128--255.
+        """
+        word = self.parse_int(token)
+        value = word[0] << 8 | word[1]
+        if token.startswith("-"):
+            fits = value == 0 or value >= 0xff80
+        else:
+            fits = value <= 0xff
+        if not fits:
+            raise ValueError(f"Value '{token}' does not fit in a byte")
+        return value & 0xff
+
+
+    def _parse_ascii(self, line: str) -> bytes:
+        """
+        Parse the operand of an .ascii directive.
+
+        Strings may contain spaces, so the operand is taken from the whole
+        source line rather than from its tokens.  It must be in double quotes
+        and may use backslash escapes such as \\n and \\".
+
+        Parameters:
+        line: the source line
+
+        Return:
+        The string's bytes.  Raises ValueError if the operand is not a quoted
+        ASCII string.
+        """
+        operand = line.strip()[len(".ascii"):].strip()
+        if len(operand) < 2 or operand[0] != '"' or operand[-1] != '"':
+            raise ValueError(f"Expected a string in double quotes, got "
+                             f"'{operand}'")
+        try:
+            return codecs.decode(operand[1:-1], "unicode_escape").encode("ascii")
+        except UnicodeError as e:
+            raise ValueError(f"Invalid string {operand}: {e}")
+
+
+    def _parse_fill(self, tokens: [str]) -> (int, int):
+        """
+        Parse the operands of a .fill directive: a count and an optional byte.
+
+        Parameters:
+        tokens: the line to parse
+
+        Return:
+        A 2-tuple (count, value).  Raises ValueError if the operands are
+        invalid.
+        """
+        if len(tokens) not in (2, 3) or tokens[1].startswith("-"):
+            raise ValueError(f"Invalid .fill directive: {tokens}")
+        count = int.from_bytes(self.parse_int(tokens[1]), byteorder='big')
+        value = self._parse_byte(tokens[2]) if len(tokens) == 3 else 0
+        return (count, value)
+
+
+    def _data_size(self, tokens: [str], line: str) -> int:
+        """
+        Get the number of bytes a data directive emits, without resolving any
+        labels in it.  Raises ValueError if the directive is malformed.
+        """
+        if len(tokens) < 2:
+            raise ValueError(f"{tokens[0]} needs an operand")
+        match tokens[0]:
+            case ".word": return 2 * (len(tokens) - 1)
+            case ".byte": return len(tokens) - 1
+            case ".ascii": return len(self._parse_ascii(line))
+            case ".fill": return self._parse_fill(tokens)[0]
+
+
+    def _assemble_data(self, tokens: [str], line: str) -> bytes:
+        """
+        Assemble a data directive.
+
+        .word takes 16-bit values or labels, .byte takes 8-bit values, .ascii
+        takes a quoted string, and .fill takes a count and an optional byte to
+        repeat (default 0).  Unlike instructions, data need not be four-byte
+        aligned.
+
+        Parameters:
+        - tokens: the line to be assembled
+        - line: the untokenized source line
+
+        Return:
+        On success, return the bytes.  On failure, return None
+        """
+        data: bytes = b""
+        try:
+            self._data_size(tokens, line) # checks operand counts
+            match tokens[0]:
+                case ".word":
+                    for token in tokens[1:]:
+                        if token[0].isalpha(): # label
+                            field = self.offset + len(data) - defs.CODE_START
+                            word, _ = self._resolve_address(token, field)
+                        else:
+                            word = self.parse_int(token)
+                        data += word
+                case ".byte":
+                    data = bytes(self._parse_byte(token) for token in tokens[1:])
+                case ".ascii":
+                    data = self._parse_ascii(line)
+                case ".fill":
+                    count, value = self._parse_fill(tokens)
+                    data = bytes([value]) * count
+        except ValueError as e:
+            logger.error(e)
+            return None
+
+        self.offset += len(data)
+        return data
+
+
+    def _parse_org(self, tokens: [str]) -> int:
+        """
+        Parse an .org directive, which moves assembly to a later address.
+
+        Parameters:
+        tokens: the line to be parsed
+
+        Return:
+        On success, return the new address.  On failure, return None
+        """
+        if self.relocatable:
+            logger.error(".org can't be used in a relocatable object; the "
+                         "linker decides where its code goes")
+            return None
+        if len(tokens) != 2:
+            logger.error(f"Invalid .org directive: {tokens}")
+            return None
+        try:
+            address = self.parse_address(tokens[1])
+        except ValueError as e:
+            logger.error(e)
+            return None
+        address = address[0] << 8 | address[1]
+        if address < self.offset:
+            logger.error(f".org 0x{address:04x} is before the current address "
+                         f"0x{self.offset:04x}")
+            return None
+        return address
+
+
     def find_labels(self, infile: typing.TextIO) -> bool:
         """
         Find source labels and populate the assembler's label dictionary.
@@ -852,6 +1240,7 @@ class AC100ASM:
         """
         self.lineno = 0
         self.offset = defs.CODE_START
+        self.exports = []
         for line in infile:
             self.lineno += 1
             label: str = ""
@@ -859,6 +1248,25 @@ class AC100ASM:
             # blank line
             if tokens is None or tokens[0] == ";":
                 continue
+            if tokens[0] == ".global":
+                if len(tokens) != 2 or self.parse_label([tokens[1]]) is None:
+                    logger.error(f"Invalid .global directive: {tokens}")
+                    return False
+                self.exports.append(tokens[1])
+                continue
+            if tokens[0] == ".org":
+                address = self._parse_org(tokens)
+                if address is None:
+                    return False
+                self.offset = address
+                continue
+            if tokens[0] in DATA_DIRECTIVES:
+                try:
+                    self.offset += self._data_size(tokens, line)
+                except ValueError as e:
+                    logger.error(e)
+                    return False
+                continue
             if len(tokens) == 1 and tokens[0].endswith(":"):
                 label = self.parse_label([tokens[0]])
                 if label is None:
@@ -876,34 +1284,57 @@ class AC100ASM:
         return True
 
 
-    def assemble(self, infile: typing.TextIO) -> bytes:
+    def assemble(self, infile: typing.Iterable[str]) -> bytes:
         """
         Assemble a binary from source code.
 
         Parameters:
-        infile: the file object associated with the source code file
+        infile: the file object associated with the source code file, or any
+        other re-iterable sequence of source lines
 
         Return:
         On success, return the assembled bytecode.  On failure, return None.
         """
-        infile.seek(0)          # reset file position after label search
+        if hasattr(infile, "seek"):
+            infile.seek(0)      # reset file position after label search
+        # preprocessed input knows which source line each line came from
+        expanded: bool = hasattr(infile, "source_lineno")
         self.lineno = 0
         self.offset = defs.CODE_START # reset offset
+        self.relocations = []
+        self.line_map = {}
         bytecode: bytes = b""
         next_line: bytes = None # next assembled bytecode
+        start: int = defs.CODE_START # address of bytecode
+        segments: [(int, bytes)] = [] # earlier pieces, separated by .org
+        has_data: bool = False
         for source_line in infile:
             self.lineno += 1
+            next_line = None
+            address: int = self.offset
             tokens = self.tokenize_line(source_line)
             if tokens is None:  # empty line, go on to the next one
                 continue
             logger.debug(f"tokens: {tokens}")
             opcode: str = tokens[0]
             logger.debug(f"opcode: {opcode}")
+            if opcode in DATA_DIRECTIVES:
+                has_data = True
+            elif not opcode.startswith((";", ".")) and address % 4 != 0:
+                if len(tokens) > 1 or opcode in ("HALT", "NOP", "RTS", "RTI",
+                                                 "WAIT"):
+                    logger.error(f"{opcode} at 0x{address:04x} is not 4-byte "
+                                 "aligned; pad the data before it")
+                    return None
             match opcode:
                 case "LDI": next_line = self._assemble_ldi(tokens)
                 case "LDR": next_line = self._assemble_ldr(tokens)
-                case "LDM": next_line = self._assemble_ldm(tokens)
+                case "LDM" | "LDBM": next_line = self._assemble_ldm(tokens)
                 case "ST" | "STH" | "STL": next_line = self._assemble_st(tokens)
+                case _ if opcode in REGISTER_OPERANDS:
+                    next_line = self._assemble_registers(tokens)
+                case _ if opcode in IMMEDIATE_OPERANDS:
+                    next_line = self._assemble_immediate(tokens)
                 case "CMR": next_line = self._assemble_cmr(tokens)
                 case "CMI": next_line = self._assemble_cmi(tokens)
                 case "JZ" | "JNZ" | "JC" | "JNC" | "JN" | "JP" | "JV" | "JNV"\
@@ -918,10 +1349,26 @@ class AC100ASM:
                 case "PUSH": next_line = self._assemble_push(tokens)
                 case "POP": next_line = self._assemble_pop(tokens)
                 case "RTS": next_line = self._assemble_rts(tokens)
+                case "RTI": next_line = self._assemble_rti(tokens)
+                case "WAIT": next_line = self._assemble_wait(tokens)
                 case "HALT": next_line = self._assemble_halt()
                 case "NOP": next_line = self._assemble_nop()
                 case ";":       # comment; do nothing
                     continue
+                case ".global": # handled by find_labels()
+                    continue
+                case ".word" | ".byte" | ".ascii" | ".fill":
+                    next_line = self._assemble_data(tokens, source_line)
+                case ".org":
+                    origin = self._parse_org(tokens)
+                    if origin is None:
+                        return None
+                    if bytecode:
+                        segments.append((start, bytecode))
+                    start = self.offset = origin
+                    bytecode = b""
+                    has_data = True
+                    continue
                 case _:
                     # this has to be here, since HALT is a valid instruction
                     # that exists by itself on a source line (len(tokens) is 1)
@@ -939,20 +1386,337 @@ class AC100ASM:
                 logger.error(f"Failed to assemble {opcode}")
                 return None
             bytecode += next_line
+            if expanded:        # a macro invocation maps to its first address
+                self.line_map.setdefault(infile.source_lineno, address)
+            else:
+                self.line_map[self.lineno] = address
             logger.debug(f"self.offset=0x{self.offset:04x}")
 
-        return bytecode
+        if self.offset > defs.ADDRESS_SIZE:
+            logger.error(f"Program ends at 0x{self.offset:x}, past the end of "
+                         "memory")
+            return None
+        if self.optimize and has_data:
+            logger.warning("Not running the peephole optimizer, since the "
+                           "program contains data")
+        elif self.optimize:
+            optimizer = ac_opt.PeepholeOptimizer(bytecode, self.labels,
+                                                 self.relocations)
+            bytecode = optimizer.optimize()
+            self.labels = optimizer.labels
+            self.relocations = optimizer.relocations
+            self.line_map = {line: optimizer.address_map[address]
+                             for line, address in self.line_map.items()
+                             if address in optimizer.address_map}
+            self.offset = defs.CODE_START + len(bytecode)
+
+        if segments or start != defs.CODE_START:
+            segments.append((start, bytecode))
+            return ac_img.pack(segments)
+
+        return ac_img.from_flat(bytecode)
+
+
+    def assemble_lines(self, lines: [str]) -> bytes:
+        """
+        Preprocess source lines, then run both assembler passes over them.
+
+        Parameters:
+        lines: the source lines
+
+        Return:
+        On success, return the assembled bytecode.  On failure, return None.
+        """
+        preprocessor = ac_pp.Preprocessor()
+        try:
+            if not self.find_labels(preprocessor.expand(lines)):
+                return None
+            return self.assemble(preprocessor.expand(lines))
+        except ac_exc.PreprocessorError as e:
+            logger.error(e)
+            return None
+
+
+    def make_object(self, bytecode: bytes) -> ac_obj.ObjectFile:
+        """
+        Package assembled bytecode as a relocatable object.
+
+        Should be called right after assemble(), with relocatable set, so the
+        relocations recorded during assembly match the bytecode.
+
+        Parameters:
+        bytecode: the bytecode returned by assemble()
+
+        Return:
+        On success, return the object.  If a label named by a .global
+        directive is never defined, return None.
+        """
+        symbols = {}
+        for name in self.exports:
+            offset = self.get_label_offset(name)
+            if offset is None:
+                logger.error(f"Exported label '{name}' is not defined")
+                return None
+            symbols[name] = offset - defs.CODE_START
+        return ac_obj.ObjectFile(bytecode, symbols, self.relocations)
+
+
+def _cache_key(lines: [str], *options) -> str:
+    return ac_cache.make_key(ASSEMBLER_VERSION, repr(options), "\n".join(lines))
+
+
+def _cache_metadata(labels: dict, line_map: dict) -> dict:
+    return {"labels": labels, "line_map": line_map}
+
+
+def _from_cache_metadata(metadata: dict) -> (dict, dict):
+    # JSON object keys are always strings
+    line_map = {int(line): address
+                for line, address in metadata["line_map"].items()}
+    return (metadata["labels"], line_map)
+
+
+def assemble_source(source: str | typing.Iterable[str], optimize: bool = False,
+                    cache: ac_cache.AssemblyCache = None) -> AssemblyResult:
+    """
+    Assemble source code held in memory.
+
+    Parameters:
+    - source: the program, either as one string or as an iterable of lines
+    - optimize: if True, run the peephole optimizer
+    - cache: if given, return the cached result for this source when there
+      is one, and store the result when there isn't
+
+    Return:
+    On success, return an AssemblyResult.  On failure, return None.
+    """
+    if isinstance(source, str):
+        lines = source.splitlines()
+    else:                       # both passes need to see every line
+        lines = [line.rstrip("\r\n") for line in source]
+    key: str = None
+    if cache is not None:
+        key = _cache_key(lines, optimize)
+        hit = cache.get(key)
+        if hit is not None:
+            return AssemblyResult(hit[0], *_from_cache_metadata(hit[1]))
+
+    assembler = AC100ASM()
+    assembler.optimize = optimize
+    bytecode = assembler.assemble_lines(lines)
+    if bytecode is None:
+        return None
+    result = AssemblyResult(bytecode, dict(assembler.labels),
+                            assembler.line_map)
+    if cache is not None:
+        cache.put(key, bytecode, _cache_metadata(result.labels,
+                                                 result.line_map))
+    return result
+
+
+def assemble_and_load(machine, source: str | typing.Iterable[str],
+                      optimize: bool = False) -> AssemblyResult:
+    """
+    Assemble source code held in memory and load it into an emulator.
+
+    Parameters:
+    - machine: the AC100 whose RAM receives the program
+    - source: the program, either as one string or as an iterable of lines
+    - optimize: if True, run the peephole optimizer
+
+    Return:
+    On success, return the AssemblyResult that was loaded.  On failure,
+    return None and leave the machine untouched.
+    """
+    result = assemble_source(source, optimize)
+    if result is not None:
+        machine.load_ram(result.bytecode)
+    return result
+
+
+class _RecordCollector(logging.Handler):
+    """ Logging handler that keeps records instead of emitting them """
+    def __init__(self):
+        super().__init__()
+        self.records: [logging.LogRecord] = []
+
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # flatten the message so the record survives pickling back to the
+        # parent process
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        self.records.append(record)
+
+
+def assemble_file(path: str, relocatable: bool = False, level: str = "ERROR",
+                  optimize: bool = False, cache_dir: str = None,
+                  cache_size: int = ac_cache.DEFAULT_MAX_BYTES) -> FileResult:
+    """
+    Assemble one source file, collecting its diagnostics.
+
+    This is the unit of work handed to each process by assemble_files(), so it
+    must stay a module-level function.
+
+    Parameters:
+    - path: the source file to assemble
+    - relocatable: if True, produce an object file instead of a flat binary
+    - level: the logging level to collect diagnostics at
+    - optimize: if True, run the peephole optimizer
+    - cache_dir: if given, the directory of an AssemblyCache to use
+    - cache_size: the cache's size limit in bytes
+
+    Return:
+    A FileResult holding the serialized output and the log records emitted
+    while assembling.  Nothing is printed.  On a cache hit, the source is not
+    parsed at all.
+    """
+    collector = _RecordCollector()
+    propagate = logger.propagate
+    old_level = logger.level
+    logger.addHandler(collector)
+    logger.propagate = False
+    logger.setLevel(level)
+    output: bytes = None
+    labels: dict = None
+    line_map: dict = None
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+        cache: ac_cache.AssemblyCache = None
+        key: str = None
+        hit = None
+        if cache_dir is not None:
+            cache = ac_cache.AssemblyCache(cache_dir, cache_size)
+            key = _cache_key(lines, relocatable, optimize)
+            hit = cache.get(key)
+        if hit is not None:
+            output = hit[0]
+            labels, line_map = _from_cache_metadata(hit[1])
+        else:
+            assembler = AC100ASM()
+            assembler.relocatable = relocatable
+            assembler.optimize = optimize
+            output = assembler.assemble_lines(lines)
+            if output is not None and relocatable:
+                obj = assembler.make_object(output)
+                output = obj.to_bytes() if obj is not None else None
+            if output is not None:
+                labels = dict(assembler.labels)
+                line_map = assembler.line_map
+                if cache is not None:
+                    cache.put(key, output, _cache_metadata(labels, line_map))
+    except OSError as e:
+        logger.error(e)
+        output = None
+    finally:
+        logger.removeHandler(collector)
+        logger.propagate = propagate
+        logger.setLevel(old_level)
+
+    return FileResult(path, output, collector.records, labels, line_map)
+
+
+def assemble_files(paths: [str], relocatable: bool = False, jobs: int = None,
+                   level: str = "ERROR", optimize: bool = False,
+                   cache_dir: str = None,
+                   cache_size: int = ac_cache.DEFAULT_MAX_BYTES) -> [FileResult]:
+    """
+    Assemble several source files concurrently.
+
+    Parameters:
+    - paths: the source files to assemble
+    - relocatable: if True, produce object files instead of flat binaries
+    - jobs: number of worker processes (default: one per CPU)
+    - level: the logging level to collect diagnostics at
+    - optimize: if True, run the peephole optimizer
+    - cache_dir: if given, the directory of an AssemblyCache to use
+    - cache_size: the cache's size limit in bytes
+
+    Return:
+    One FileResult per path, in the same order as paths regardless of the
+    order in which the workers finish.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(paths))
+    n = len(paths)
+    args = (paths, [relocatable] * n, [level] * n, [optimize] * n,
+            [cache_dir] * n, [cache_size] * n)
+    if jobs <= 1:
+        return list(map(assemble_file, *args))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(assemble_file, *args))
+
+
+def write_listing_and_map(results: [FileResult], segments: [[(int, bytes)]],
+                          shifts: [int], listing: str = None,
+                          source_map: str = None) -> None:
+    """
+    Write a listing and/or a source map for assembled files.
+
+    Parameters:
+    - results: the files' results from assemble_files()
+    - segments: each file's code, as returned by ac100map.memory_segments()
+    - shifts: how far each file's code was moved from where it was assembled
+    - listing: if given, the path to write the listing to
+    - source_map: if given, the path to write the source map to
+    """
+    if listing is not None:
+        with open(listing, "w") as f:
+            for result, code, shift in zip(results, segments, shifts):
+                if len(results) > 1:
+                    f.write(f"; {result.path}\n")
+                with open(result.path) as src:
+                    lines = src.read().splitlines()
+                for line in ac_map.make_listing(lines, result.line_map, code,
+                                                shift):
+                    f.write(line + "\n")
+    if source_map is not None:
+        mapping = ac_map.SourceMap()
+        for result, code, shift in zip(results, segments, shifts):
+            mapping.add_file(result.path, result.line_map, result.labels, code,
+                             shift)
+        mapping.write(source_map)
 
 
 def setup_parser(parser) -> None:
     """ Set up ArgumentParser """
-    parser.add_argument("infile", help="The source file to assemble")
+    parser.add_argument("infiles", nargs="+", metavar="infile",
+                        help="The source file(s) to assemble")
     parser.add_argument("-l", "--loglevel", default="error",
                         choices=["debug", "info", "warning", "error"],
                         metavar="level", help="logging level")
-    parser.add_argument("-o", "--outfile", default=DEFAULT_OUTPUT,
-                        metavar="file",
-                        help="name to use for output file (default: %(default)s)")
+    parser.add_argument("-o", "--outfile", default=None, metavar="file",
+                        help="name to use for output file (default: "
+                        f"{DEFAULT_OUTPUT}, or {DEFAULT_OBJECT_OUTPUT} with -c); "
+                        "with several inputs, only valid with --combine")
+    parser.add_argument("-c", "--object", action="store_true",
+                        help="emit a relocatable object for src.ac100ld "
+                        "instead of a flat binary")
+    parser.add_argument("-j", "--jobs", type=int, default=None, metavar="n",
+                        help="number of files to assemble in parallel "
+                        "(default: number of CPUs)")
+    parser.add_argument("--combine", action="store_true",
+                        help="link all inputs, in the order given, into one "
+                        "binary instead of writing one output per input")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="run the peephole optimizer on the output")
+    parser.add_argument("--cache-dir", metavar="dir",
+                        default=os.environ.get("AC100ASM_CACHE_DIR"),
+                        help="reuse output for unchanged sources from this "
+                        "directory (default: $AC100ASM_CACHE_DIR, or no cache)")
+    parser.add_argument("--cache-size", type=int, metavar="bytes",
+                        default=ac_cache.DEFAULT_MAX_BYTES,
+                        help="evict least recently used cache entries beyond "
+                        "this size (default: %(default)s)")
+    parser.add_argument("--listing", metavar="file",
+                        help="write a listing of addresses, bytes, and source "
+                        "lines to this file")
+    parser.add_argument("--map", metavar="file",
+                        help="write a binary source map from addresses to "
+                        "source lines, plus the label table, to this file")
 
 
 def setup_logger(level) -> None:
@@ -966,20 +1730,79 @@ def setup_logger(level) -> None:
     logging.basicConfig(format=format, level=logging.getLevelName(level))
 
 
-def main():
-    assembler = AC100ASM()
+def main(argv: [str] = None):
+    """
+    Run the assembler's command line.
+
+    Parameters:
+    argv: the arguments, without the program name; sys.argv[1:] if None
+    """
+    parser = argparse.ArgumentParser() # fresh, so main() can run repeatedly
     setup_parser(parser)
-    if len(sys.argv) == 1:
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv:
         parser.print_help()
         sys.exit(1)
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     setup_logger(args.loglevel.upper())
-    with open(args.infile) as f, open(args.outfile, "wb") as f2:
-        ok = assembler.find_labels(f)
-        if ok:
-            bytecode: bytes = assembler.assemble(f)
-            if bytecode is not None:
-                f2.write(bytecode)
+    if args.combine and args.object:
+        parser.error("--combine produces a linked binary; it can't be used "
+                     "with -c")
+    if len(args.infiles) > 1 and not args.combine and args.outfile is not None:
+        parser.error("-o needs --combine when assembling several files")
+    if len(args.infiles) > 1 and not args.combine \
+       and (args.listing or args.map):
+        parser.error("--listing and --map need --combine when assembling "
+                     "several files")
+
+    # a combined image is linked from objects, so labels are resolved across
+    # files in input order no matter which file finishes first
+    relocatable = args.object or args.combine
+    results = assemble_files(args.infiles, relocatable, args.jobs,
+                             args.loglevel.upper(), args.optimize,
+                             args.cache_dir, args.cache_size)
+    ok = True
+    for result in results:      # report diagnostics in input order
+        for record in result.diagnostics:
+            record.msg = f"{result.path}: {record.msg}"
+            logger.handle(record)
+        ok = ok and result.output is not None
+    if not ok:
+        sys.exit(1)
+
+    if args.combine:
+        linker = ac_ld.AC100LD()
+        for result in results:
+            linker.add_object(ac_obj.ObjectFile.from_bytes(result.output))
+        binary = linker.link()
+        if binary is None:
+            sys.exit(1)
+        with open(args.outfile or DEFAULT_OUTPUT, "wb") as f:
+            f.write(binary)
+        write_listing_and_map(
+            results, [[(defs.CODE_START, obj.code)] for obj in linker.objects],
+            [base - defs.CODE_START for base in linker.bases], args.listing,
+            args.map)
+        return
+
+    default = DEFAULT_OBJECT_OUTPUT if args.object else DEFAULT_OUTPUT
+    for result in results:
+        if len(results) == 1:
+            outfile = args.outfile or default
+        else:                   # one output beside each input
+            outfile = pathlib.Path(result.path).with_suffix(
+                pathlib.Path(default).suffix)
+        with open(outfile, "wb") as f:
+            f.write(result.output)
+    if args.listing or args.map:
+        result = results[0]
+        if args.object:
+            code = ac_obj.ObjectFile.from_bytes(result.output).code
+            segments = [(defs.CODE_START, code)]
+        else:
+            segments = ac_map.memory_segments(result.output)
+        write_listing_and_map(results, [segments], [0], args.listing, args.map)
 
 
 if __name__ == "__main__":
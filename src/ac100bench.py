@@ -0,0 +1,672 @@
+# Benchmarks for the AC100 toolchain
+#
+#   python -m src.ac100bench [-o results.json] asm
+#   python -m src.ac100bench [-o results.json] emu
+#
+# The asm benchmark assembles synthetic sources of increasing size and reports
+# lines per second and peak memory for each assembler pass and for the whole
+# command line tool.  Results are written as JSON so runs on different commits
+# can be compared.
+#
+# A single AC100 program can't be much more than 16k instructions long, so
+# sources bigger than UNIT_LINES are generated as several independent units,
+# the way a project that size would have to be split into object files.
+#
+# The emu benchmark runs a set of guest programs on the emulator without a
+# display and reports instructions per second, host time spent on each class
+# of opcode, and peak RSS.  Each program runs in a fresh process so that its
+# RSS isn't inflated by whatever ran before it.
+
+import argparse
+import concurrent.futures
+import contextlib
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import pathlib
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import src.ac100 as emu
+import src.ac100asm as asm
+
+logger = logging.getLogger("ac100bench")
+parser = argparse.ArgumentParser()
+
+ASM_SIZES: [int] = [1_000, 10_000, 100_000, 1_000_000]
+UNIT_LINES: int = 10_000        # largest unit within the 16k limit
+DEFAULT_REPEAT: int = 3
+DEFAULT_SEED: int = 100
+
+# relative frequency of each kind of line in generated sources
+_LINE_WEIGHTS = {
+    "instruction": 80, "comment": 10, "label": 7, "blank": 3
+}
+_INSTRUCTION_WEIGHTS = {
+    "LDI": 14, "LDR": 8, "LDM": 8, "ST": 8, "STH": 1, "STL": 1, "CMR": 4,
+    "CMI": 6, "ADDI": 8, "ADDR": 5, "INC": 5, "SUBI": 4, "SUBR": 3, "DEC": 5,
+    "PUSH": 3, "POP": 3, "JZ": 3, "JNZ": 4, "JC": 1, "JNC": 1, "JN": 1,
+    "JP": 1, "JV": 1, "JNV": 1, "JMP": 3, "JSR": 2, "RTS": 2, "NOP": 1
+}
+# guest programs for the emu benchmark; {passes} is scaled by --scale, and
+# each pass runs roughly the same number of instructions every time
+EMU_PROGRAMS = {
+    "count": ("""
+; counting loop
+LDI R2 {passes}
+outer:
+LDI R1 1000
+inner:
+DEC R1
+JNZ inner
+DEC R2
+JNZ outer
+HALT
+""", 100),
+    "fill": ("""
+; fill 8 KiB of memory with a word
+LDI R5 {passes}
+pass:
+LDI R1 0x4000
+LDI R2 0xabcd
+LDI R3 4096
+fill:
+ST R2 [R1]
+ADDI R1 2
+DEC R3
+JNZ fill
+DEC R5
+JNZ pass
+HALT
+""", 12),
+    "memcpy": ("""
+; copy 4 KiB one word at a time
+LDI R5 {passes}
+pass:
+LDI R1 0x4000
+LDI R2 0x8000
+LDI R3 2048
+copy:
+LDM R4 [R1]
+ST R4 [R2]
+ADDI R1 2
+ADDI R2 2
+DEC R3
+JNZ copy
+DEC R5
+JNZ pass
+HALT
+""", 16),
+    "recursion": ("""
+; sum 100..1 with a recursive subroutine
+LDI R5 {passes}
+again:
+LDI R1 100
+LDI R2 0
+JSR sum
+DEC R5
+JNZ again
+HALT
+sum:
+CMI R1 0
+JZ base
+PUSH R1
+ADDR R2 R1
+DEC R1
+JSR sum
+POP R1
+base:
+RTS
+""", 250),
+    "sieve": ("""
+; sieve of Eratosthenes over 2..1999; one word per number at 0x4000,
+; nonzero for composites
+LDI R12 {passes}
+pass:
+LDI R1 0x4000
+LDI R3 2000
+LDI R2 0
+clear:
+ST R2 [R1]
+ADDI R1 2
+DEC R3
+JNZ clear
+LDI R4 2
+outer:
+CMI R4 45
+JP done
+LDR R7 R4
+ADDR R7 R4
+ADDI R7 0x4000
+LDM R8 [R7]
+CMI R8 0
+JNZ next
+LDR R9 R4
+ADDR R9 R4
+LDR R10 R7
+ADDR R10 R9
+LDI R11 1
+mark:
+CMI R10 0x4fa0
+JP next
+ST R11 [R10]
+ADDR R10 R9
+JMP mark
+next:
+INC R4
+JMP outer
+done:
+DEC R12
+JNZ pass
+HALT
+""", 6),
+    "screen": ("""
+; fill the screen with characters, one byte at a time
+LDI R5 {passes}
+pass:
+LDI R1 0xfc3f
+LDI R2 960
+LDI R3 0x41
+fill:
+STL R3 [R1]
+INC R1
+DEC R2
+JNZ fill
+DEC R5
+JNZ pass
+HALT
+""", 50),
+}
+
+# opcode classes reported by the emu benchmark
+OPCODE_CLASSES = {
+    "load": ("LDI", "LDR", "LDM", "LDBM", "LDMX", "LDMP", "LDBMX", "LDBMP"),
+    "store": ("ST", "STH", "STL", "STX", "STP", "STLX", "STLP", "MEMCPY",
+              "MEMSET"),
+    "compare": ("CMR", "CMI"),
+    "jump": ("JZ", "JNZ", "JC", "JNC", "JN", "JP", "JV", "JNV", "JMP", "JSR"),
+    "arithmetic": ("ADDI", "ADDR", "INC", "SUBI", "SUBR", "DEC", "MUL",
+                   "DIVU", "MOD", "LSL", "LSR", "ASR"),
+    "logic": ("ANDR", "ANDI", "ORR", "ORI", "XORR", "XORI", "NOT", "TSTR",
+              "TSTI"),
+    "stack": ("PUSH", "POP", "RTS", "RTI"),
+    "other": ("HALT", "NOP", "WAIT")
+}
+_OPCODE_CLASS = {mnemonic: name for name, mnemonics in OPCODE_CLASSES.items()
+                 for mnemonic in mnemonics}
+
+_COMMENT_WORDS = ["load", "the", "next", "value", "into", "counter", "loop",
+                  "until", "done", "save", "registers", "screen", "pointer"]
+
+
+def _register(rng: random.Random) -> str:
+    return f"R{rng.randint(1, 16)}"
+
+
+def _instruction(rng: random.Random, mnemonic: str, labels: [str]) -> str:
+    match mnemonic:
+        case "LDI" | "CMI" | "ADDI" | "SUBI":
+            value = rng.choice([str(rng.randint(0, 255)),
+                                f"0x{rng.randint(0, 0xffff):04x}",
+                                f"0b{rng.randint(0, 255):08b}"])
+            return f"{mnemonic} {_register(rng)} {value}"
+        case "LDR" | "CMR" | "ADDR" | "SUBR":
+            return f"{mnemonic} {_register(rng)} {_register(rng)}"
+        case "LDM" | "ST" | "STH" | "STL":
+            if rng.random() < 0.3:
+                address = f"[{_register(rng)}]"
+            else:
+                address = f"0x{rng.randint(0xfc3f, 0xffff):04x}"
+            return f"{mnemonic} {_register(rng)} {address}"
+        case "INC" | "DEC" | "PUSH" | "POP":
+            return f"{mnemonic} {_register(rng)}"
+        case "RTS" | "NOP":
+            return mnemonic
+        case _:                 # jumps; the label may come later in the unit
+            return f"{mnemonic} {rng.choice(labels)}"
+
+
+def generate_unit(n_lines: int, rng: random.Random) -> [str]:
+    """
+    Generate one assemblable source file.
+
+    Parameters:
+    - n_lines: the number of lines to generate
+    - rng: the random number generator to draw from
+
+    Return:
+    The source lines: a mix of instructions, comments, labels, and blank
+    lines, with jumps to labels both before and after them.  The last line
+    is always HALT.
+    """
+    kinds = rng.choices(list(_LINE_WEIGHTS), list(_LINE_WEIGHTS.values()),
+                        k=n_lines - 1)
+    n_labels = max(1, kinds.count("label"))
+    labels = [f"L{i}" for i in range(n_labels)]
+    mnemonics = iter(rng.choices(list(_INSTRUCTION_WEIGHTS),
+                                 list(_INSTRUCTION_WEIGHTS.values()),
+                                 k=len(kinds)))
+    lines = [f"{labels[0]}:"]
+    next_label = 1
+    for kind in kinds[1:]:
+        match kind:
+            case "instruction":
+                lines.append(_instruction(rng, next(mnemonics), labels))
+            case "comment":
+                words = rng.choices(_COMMENT_WORDS, k=rng.randint(2, 8))
+                lines.append("; " + " ".join(words))
+            case "label" if next_label < n_labels:
+                lines.append(f"{labels[next_label]}:")
+                next_label += 1
+            case _:
+                lines.append("")
+    # labels the random draw didn't place still need defining
+    lines.extend(f"{label}:" for label in labels[next_label:])
+    lines.append("HALT")
+    return lines
+
+
+def generate_source(n_lines: int, seed: int = DEFAULT_SEED) -> [[str]]:
+    """
+    Generate a synthetic source of a given size.
+
+    Parameters:
+    - n_lines: the total number of lines
+    - seed: seed for the random number generator, so runs are repeatable
+
+    Return:
+    A list of units, each a list of lines no longer than UNIT_LINES.
+    """
+    rng = random.Random(seed)
+    units = []
+    remaining = n_lines
+    while remaining > 0:
+        size = min(remaining, UNIT_LINES)
+        units.append(generate_unit(size, rng))
+        remaining -= size
+    return units
+
+
+def _find_labels(units: [[str]]) -> None:
+    for unit in units:
+        if not asm.AC100ASM().find_labels(unit):
+            raise RuntimeError("find_labels() failed on generated source")
+
+
+def _assemble(units: [[str]]) -> None:
+    for unit in units:
+        assembler = asm.AC100ASM()
+        assembler.find_labels(unit)
+        if assembler.assemble(unit) is None:
+            raise RuntimeError("assemble() failed on generated source")
+
+
+def _asm_main(paths: [str], outdir: str, jobs: int,
+              object_files: bool = False) -> None:
+    # several inputs each get their output beside them, in outdir
+    argv = ["-j", str(jobs)]
+    if object_files:
+        argv.append("-c")
+    if len(paths) == 1:
+        argv += ["-o", os.path.join(outdir, "out.o" if object_files
+                                    else "out.bin")]
+    try:
+        asm.main(argv + paths)
+    except SystemExit as e:
+        if e.code:
+            raise RuntimeError("ac100asm exited with an error on generated "
+                               "source")
+
+
+def measure(function, *args, repeat: int = DEFAULT_REPEAT) -> ([float], int):
+    """
+    Time a function and measure its peak memory use.
+
+    The timed runs are made without tracemalloc, which slows Python down
+    considerably; one extra run under tracemalloc measures memory.
+
+    Parameters:
+    - function: the function to benchmark
+    - args: arguments to pass to it
+    - repeat: the number of timed runs
+
+    Return:
+    A 2-tuple (samples, peak_bytes): the time of each run, and the peak
+    memory allocated by Python code during the traced run.
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        samples.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return (samples, peak)
+
+
+@contextlib.contextmanager
+def _no_cache():
+    """ Keep a cache directory from the environment out of the benchmark """
+    saved = os.environ.pop("AC100ASM_CACHE_DIR", None)
+    try:
+        yield
+    finally:
+        if saved is not None:
+            os.environ["AC100ASM_CACHE_DIR"] = saved
+
+
+def bench_asm(sizes: [int] = ASM_SIZES, repeat: int = DEFAULT_REPEAT,
+              seed: int = DEFAULT_SEED, jobs: int = 1,
+              end_to_end: bool = True) -> [dict]:
+    """
+    Benchmark the assembler on generated sources.
+
+    Parameters:
+    - sizes: the source sizes to try, in lines
+    - repeat: the number of timed runs of each phase
+    - seed: seed for the source generator
+    - jobs: worker processes for the end-to-end run; memory is only measured
+      for the benchmark's own process
+    - end_to_end: if True, also time main() on the sources written to files,
+      both as users run it, producing flat binaries (phase "main"), and with
+      -c, producing object files (phase "main_object")
+
+    Return:
+    One result per size and phase, with the keys benchmark, phase, lines,
+    units, seconds (of the fastest run), lines_per_second, samples (the
+    time of every run), and peak_bytes.
+    """
+    results = []
+    for size in sizes:
+        units = generate_source(size, seed)
+        n_lines = sum(len(unit) for unit in units)
+        phases = [("find_labels", _find_labels, (units,)),
+                  ("assemble", _assemble, (units,))]
+        with contextlib.ExitStack() as stack:
+            if end_to_end:
+                tmpdir = stack.enter_context(tempfile.TemporaryDirectory())
+                stack.enter_context(_no_cache())
+                paths = []
+                for i, unit in enumerate(units):
+                    path = os.path.join(tmpdir, f"unit{i:04d}.s")
+                    with open(path, "w") as f:
+                        f.write("\n".join(unit) + "\n")
+                    paths.append(path)
+                phases.append(("main", _asm_main, (paths, tmpdir, jobs)))
+                phases.append(("main_object", _asm_main,
+                               (paths, tmpdir, jobs, True)))
+            for phase, function, args in phases:
+                samples, peak = measure(function, *args, repeat=repeat)
+                seconds = min(samples)
+                logger.info(f"{phase} on {n_lines} lines: {seconds:.3f} s, "
+                            f"peak {peak} bytes")
+                results.append({
+                    "benchmark": "asm", "phase": phase, "lines": n_lines,
+                    "units": len(units), "seconds": seconds,
+                    "lines_per_second": n_lines / seconds if seconds else None,
+                    "samples": samples, "peak_bytes": peak
+                })
+    return results
+
+
+def emu_source(name: str, scale: float = 1.0) -> str:
+    """
+    Get the source of one of the emu benchmark's guest programs.
+
+    Parameters:
+    - name: the program, a key of EMU_PROGRAMS
+    - scale: multiplies the program's number of passes (at least 1 is run)
+
+    Return:
+    The program's source text.
+    """
+    template, passes = EMU_PROGRAMS[name]
+    return template.format(passes=max(1, round(passes * scale)))
+
+
+def _load(source: str) -> emu.AC100:
+    result = asm.assemble_source(source)
+    if result is None:
+        raise RuntimeError("benchmark program failed to assemble")
+    machine = emu.AC100()
+    machine.load_ram(result.bytecode)
+    return machine
+
+
+def profile_opcodes(machine: emu.AC100) -> dict:
+    """
+    Run a loaded program, timing every instruction.
+
+    Parameters:
+    machine: the emulator, with the program loaded
+
+    Return:
+    A mapping from opcode class to a dict with the number of instructions in
+    that class and the host nanoseconds spent executing them.
+    """
+    classes = {name: {"count": 0, "ns": 0} for name in OPCODE_CLASSES}
+    table = emu.INSTRUCTION_TABLE
+    while machine.PC < machine.VRAM_START and not machine.halted:
+        instruction = machine.fetch_instruction()
+        start = time.perf_counter_ns()
+        ok = machine.decode_execute_instruction(instruction)
+        elapsed = time.perf_counter_ns() - start
+        if not ok:
+            raise RuntimeError(f"{table[instruction[0]]} failed")
+        totals = classes[_OPCODE_CLASS.get(table[instruction[0]], "other")]
+        totals["count"] += 1
+        totals["ns"] += elapsed
+    return classes
+
+
+def run_emu_program(name: str, source: str, repeat: int = DEFAULT_REPEAT) -> dict:
+    """
+    Benchmark one guest program in the current process.
+
+    The program is run repeat times with run_headless() for timing, and once
+    more under profile_opcodes(), whose per-instruction timing would distort
+    the totals.
+
+    Parameters:
+    - name: the program's name, for the results
+    - source: the program's source
+    - repeat: the number of timed runs
+
+    Return:
+    A result with the keys benchmark, program, instructions, seconds (of the
+    fastest run), instructions_per_second, samples (the time of every run),
+    opcode_classes, and peak_rss_kib.
+    """
+    samples = []
+    instructions = 0
+    for _ in range(repeat):
+        machine = _load(source)
+        start = time.perf_counter()
+        status = machine.run_headless()
+        seconds = time.perf_counter() - start
+        if status != 0 or not machine.halted:
+            raise RuntimeError(f"benchmark program {name} did not halt")
+        samples.append(seconds)
+        instructions = machine.instruction_count
+    classes = profile_opcodes(_load(source))
+    # kilobytes on Linux, bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss //= 1024
+    best = min(samples)
+    return {
+        "benchmark": "emu", "program": name, "instructions": instructions,
+        "seconds": best, "samples": samples,
+        "instructions_per_second": instructions / best if best else None,
+        "opcode_classes": classes, "peak_rss_kib": peak_rss
+    }
+
+
+def bench_emu(programs: [str] = None, scale: float = 1.0,
+              repeat: int = DEFAULT_REPEAT, isolate: bool = True) -> [dict]:
+    """
+    Benchmark the emulator on the guest programs in EMU_PROGRAMS.
+
+    Parameters:
+    - programs: the names of the programs to run (default: all)
+    - scale: multiplies each program's running time
+    - repeat: the number of timed runs of each program
+    - isolate: if True, run each program in a new process, so peak RSS is
+      the program's own
+
+    Return:
+    One result per program, as returned by run_emu_program().
+    """
+    if programs is None:
+        programs = list(EMU_PROGRAMS)
+    results = []
+    for name in programs:
+        source = emu_source(name, scale)
+        if isolate:
+            context = multiprocessing.get_context("spawn")
+            with concurrent.futures.ProcessPoolExecutor(
+                    max_workers=1, mp_context=context) as pool:
+                result = pool.submit(run_emu_program, name, source,
+                                     repeat).result()
+        else:
+            result = run_emu_program(name, source, repeat)
+        logger.info(f"{name}: {result['instructions']} instructions in "
+                    f"{result['seconds']:.3f} s")
+        results.append(result)
+    return results
+
+
+def _git_commit() -> str:
+    """ Return the commit being benchmarked, or None outside a git checkout """
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                             text=True, check=True,
+                             cwd=pathlib.Path(__file__).parent)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def make_report(results: [dict]) -> dict:
+    """ Wrap results with what's needed to compare them with other runs """
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results
+    }
+
+
+def format_asm_results(results: [dict]) -> str:
+    """ Format asm benchmark results as a table for the terminal """
+    rows = [f"{'phase':<12} {'lines':>9} {'seconds':>9} {'lines/s':>11} "
+            f"{'peak MiB':>9}"]
+    for r in results:
+        rate = r["lines_per_second"] or 0
+        rows.append(f"{r['phase']:<12} {r['lines']:>9} {r['seconds']:>9.3f} "
+                    f"{rate:>11.0f} {r['peak_bytes'] / 2 ** 20:>9.1f}")
+    return "\n".join(rows)
+
+
+def format_emu_results(results: [dict]) -> str:
+    """ Format emu benchmark results as a table for the terminal """
+    rows = [f"{'program':<10} {'instructions':>12} {'seconds':>8} {'MIPS':>7} "
+            f"{'RSS MiB':>8}  host time by opcode class"]
+    for r in results:
+        classes = r["opcode_classes"]
+        total = sum(c["ns"] for c in classes.values()) or 1
+        shares = ", ".join(f"{name} {c['ns'] / total:.0%}"
+                           for name, c in classes.items() if c["count"])
+        rate = (r["instructions_per_second"] or 0) / 1e6
+        rows.append(f"{r['program']:<10} {r['instructions']:>12} "
+                    f"{r['seconds']:>8.3f} {rate:>7.3f} "
+                    f"{r['peak_rss_kib'] / 1024:>8.1f}  {shares}")
+    return "\n".join(rows)
+
+
+def setup_parser(parser) -> None:
+    """ Set up ArgumentParser """
+    parser.add_argument("-l", "--loglevel", default="warning",
+                        choices=["debug", "info", "warning", "error"],
+                        metavar="level", help="logging level")
+    parser.add_argument("-o", "--outfile", metavar="file",
+                        help="write results to this file as JSON")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    asm_parser = subparsers.add_parser("asm", help="assembler throughput")
+    asm_parser.add_argument("--sizes", type=int, nargs="+", default=ASM_SIZES,
+                            metavar="lines",
+                            help="source sizes to benchmark (default: "
+                            "%(default)s)")
+    asm_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                            metavar="n", help="timed runs per phase; the "
+                            "fastest is reported (default: %(default)s)")
+    asm_parser.add_argument("--seed", type=int, default=DEFAULT_SEED,
+                            help="seed for the source generator")
+    asm_parser.add_argument("-j", "--jobs", type=int, default=1, metavar="n",
+                            help="worker processes for the end-to-end run "
+                            "(default: %(default)s)")
+    asm_parser.add_argument("--no-main", action="store_true",
+                            help="skip the end-to-end run of ac100asm")
+
+    emu_parser = subparsers.add_parser("emu", help="emulator speed")
+    emu_parser.add_argument("--programs", nargs="+", choices=list(EMU_PROGRAMS),
+                            default=None, metavar="name",
+                            help="guest programs to run (default: all of "
+                            f"{', '.join(EMU_PROGRAMS)})")
+    emu_parser.add_argument("--scale", type=float, default=1.0,
+                            help="multiply each program's running time "
+                            "(default: %(default)s)")
+    emu_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                            metavar="n", help="timed runs per program; the "
+                            "fastest is reported (default: %(default)s)")
+    emu_parser.add_argument("--in-process", action="store_true",
+                            help="run every program in this process instead "
+                            "of a new one each")
+
+
+def setup_logger(level) -> None:
+    """
+    Set up logger
+
+    Parameters:
+    level: the level to use
+    """
+    format = "[%(levelname)s] %(name)s:%(funcName)s():%(lineno)d: %(message)s"
+    logging.basicConfig(format=format, level=logging.getLevelName(level))
+
+
+def main():
+    setup_parser(parser)
+    args = parser.parse_args()
+    setup_logger(args.loglevel.upper())
+    match args.benchmark:
+        case "asm":
+            results = bench_asm(args.sizes, args.repeat, args.seed, args.jobs,
+                                not args.no_main)
+            print(format_asm_results(results))
+        case "emu":
+            results = bench_emu(args.programs, args.scale, args.repeat,
+                                not args.in_process)
+            print(format_emu_results(results))
+    if args.outfile is not None:
+        with open(args.outfile, "w") as f:
+            json.dump(make_report(results), f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
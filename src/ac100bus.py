@@ -0,0 +1,180 @@
+# Memory bus for the AC100
+#
+# The 64 KiB address space is split into 256-byte pages.  A page is either
+# plain RAM or belongs to a memory-mapped device, and every address has a set
+# of permission bits.  Both live in one lookup table, access, with an entry
+# per address, so the emulator can check an access and pick the fast path --
+# indexing the RAM bytearray directly -- with a single lookup.  Only accesses
+# that land on a device page, or that aren't allowed, go through the bus's
+# methods.
+#
+# Permissions are kept per address rather than per page because VRAM starts
+# partway through a page.  Devices are mapped a page at a time.
+#
+# The stack is always RAM: PUSH, POP, JSR, and RTS use it directly, and no
+# device may be mapped over it.
+
+import src.definitions as defs
+import src.exceptions as ac_exc
+
+PAGE_SIZE: int = 0x100
+NUM_PAGES: int = defs.ADDRESS_SIZE // PAGE_SIZE
+
+# bits of MemoryBus.access
+READ: int = 0x1
+WRITE: int = 0x2
+EXECUTE: int = 0x4
+DEVICE: int = 0x8               # the address is on a device page
+
+_NAMES = {READ: "readable", WRITE: "writable", EXECUTE: "executable"}
+
+# for MemoryBus.plain(): maps each access value to 0 if it's RAM that allows
+# a permission and 1 if it isn't
+_NOT_PLAIN = {permission: bytes(0 if a & (DEVICE | permission) == permission
+                                else 1 for a in range(256))
+              for permission in _NAMES}
+
+
+# A memory-mapped device.  Subclasses override read() and write(); offsets
+# are from the first address the device is mapped at.
+class Device:
+    def read(self, offset: int) -> int:
+        """ Return the byte at offset; a device without registers reads 0 """
+        return 0
+
+
+    def write(self, offset: int, value: int) -> None:
+        """ Handle a store of one byte at offset """
+        pass
+
+
+    def flush(self) -> None:
+        """ Push out anything buffered; called when the machine stops """
+        pass
+
+
+class MemoryBus:
+    def __init__(self, ram: bytearray):
+        self.ram = ram
+        # permission bits, plus DEVICE, for each address; the extra entry past
+        # the top of memory copies the last one, so a word access there fails
+        # the same way with or without the bus
+        self.access = bytearray(defs.ADDRESS_SIZE + 1)
+        self.devices: list = [None] * NUM_PAGES
+        self.bases: list = [0] * NUM_PAGES  # where each page's device starts
+        self.generation: int = 0    # bumped whenever access changes
+        self.protect(defs.ADDRESS_MIN, defs.STACK_MIN, READ)
+        self.protect(defs.STACK_MIN, defs.VRAM_START, READ | WRITE | EXECUTE)
+        self.protect(defs.VRAM_START, defs.ADDRESS_SIZE, READ | WRITE)
+
+
+    def protect(self, start: int, end: int, permissions: int) -> None:
+        """
+        Set the permissions of a range of addresses.
+
+        Parameters:
+        - start, end: the range, end excluded
+        - permissions: READ, WRITE, and EXECUTE, or'ed together
+        """
+        for address in range(start, end):
+            self.access[address] = (self.access[address] & DEVICE
+                                    | permissions)
+        self.access[defs.ADDRESS_SIZE] = self.access[defs.ADDRESS_MAX]
+        self.generation += 1
+
+
+    def map_device(self, address: int, device: Device, pages: int = 1,
+                   permissions: int = READ | WRITE) -> None:
+        """
+        Map a device over one or more pages.
+
+        Parameters:
+        - address: the first address, which must start a page above the stack
+        - device: the device, whose read() and write() then handle every
+          access to the pages
+        - pages: how many pages to map
+        - permissions: the pages' new permissions
+        """
+        end = address + pages * PAGE_SIZE
+        if address % PAGE_SIZE != 0 or pages < 1:
+            raise ValueError(f"Devices are mapped at page boundaries, not "
+                             f"0x{address:04x}")
+        if address < defs.CODE_START or end > defs.ADDRESS_SIZE:
+            raise ValueError(f"Can't map a device at 0x{address:04x}--"
+                             f"0x{end - 1:04x}")
+        for page in range(address // PAGE_SIZE, end // PAGE_SIZE):
+            self.devices[page] = device
+            self.bases[page] = address
+        for a in range(address, end):
+            self.access[a] = DEVICE | permissions
+        self.access[defs.ADDRESS_SIZE] = self.access[defs.ADDRESS_MAX]
+        self.generation += 1
+
+
+    def flush(self) -> None:
+        """ Flush every mapped device """
+        flushed = set()
+        for device in self.devices:
+            if device is not None and id(device) not in flushed:
+                flushed.add(id(device))
+                device.flush()
+
+
+    def plain(self, address: int, length: int, permission: int) -> bool:
+        """
+        Check that a range of addresses is all RAM that allows a permission,
+        so that it can be copied to or from RAM with a slice.
+
+        Parameters:
+        - address, length: the range
+        - permission: READ, WRITE, or EXECUTE
+        """
+        end = address + length
+        return (end <= defs.ADDRESS_SIZE and 1 not in
+                self.access[address:end].translate(_NOT_PLAIN[permission]))
+
+
+    def device_at(self, address: int) -> Device:
+        """ Return the device mapped at an address, or None for RAM """
+        return self.devices[address // PAGE_SIZE]
+
+
+    def _check(self, address: int, permission: int) -> int:
+        access = self.access[address]
+        if not access & permission:
+            raise ac_exc.MemoryProtectionError(address, _NAMES[permission])
+        return access
+
+
+    def read(self, address: int) -> int:
+        """
+        Read a byte, checking permissions.  Raises MemoryProtectionError if
+        the address isn't readable.
+        """
+        if self._check(address, READ) & DEVICE:
+            page = address // PAGE_SIZE
+            return self.devices[page].read(address - self.bases[page]) & 0xff
+        return self.ram[address]
+
+
+    def write(self, address: int, value: int) -> None:
+        """
+        Write a byte, checking permissions.  Raises MemoryProtectionError if
+        the address isn't writable.
+        """
+        if self._check(address, WRITE) & DEVICE:
+            page = address // PAGE_SIZE
+            self.devices[page].write(address - self.bases[page], value & 0xff)
+        else:
+            self.ram[address] = value
+
+
+    def read_word(self, address: int) -> int:
+        """ Read a big-endian word, one byte at a time """
+        return self.read(address) << 8 | self.read(address + 1)
+
+
+    def write_word(self, address: int, value: int) -> None:
+        """ Write a big-endian word, high byte first """
+        self.write(address, value >> 8 & 0xff)
+        self.write(address + 1, value & 0xff)
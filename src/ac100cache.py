@@ -0,0 +1,135 @@
+# Content-addressed on-disk cache of assembler output
+#
+# Each entry is one file named after its key:
+#
+#   metadata length  4 bytes, big-endian
+#   metadata         UTF-8 JSON
+#   output           the rest of the file
+#
+# Entries are written to a temporary file and renamed into place, so several
+# assembler processes can share one cache directory.  A hit refreshes the
+# entry's modification time, which is what eviction uses to find the least
+# recently used entries.
+
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import struct
+import tempfile
+
+logger = logging.getLogger("ac100asm")
+
+DEFAULT_MAX_BYTES: int = 64 * 1024 * 1024
+ENTRY_SUFFIX: str = ".ac100c"
+
+_LENGTH = struct.Struct(">I")
+
+
+def make_key(*parts: str) -> str:
+    """
+    Build a cache key from the parts that determine the output.
+
+    Parameters:
+    parts: e.g. the assembler version, its options, and the source text
+
+    Return:
+    The SHA-256 of the parts, as a hex string.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        encoded = part.encode("utf-8")
+        digest.update(_LENGTH.pack(len(encoded))) # keep the parts distinct
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+class AssemblyCache:
+    def __init__(self, directory, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+
+    def _path(self, key: str) -> pathlib.Path:
+        return self.directory / (key + ENTRY_SUFFIX)
+
+
+    def get(self, key: str) -> (bytes, dict):
+        """
+        Look up an entry.
+
+        Parameters:
+        key: the key from make_key()
+
+        Return:
+        On a hit, return a 2-tuple (output, metadata).  On a miss, or if the
+        entry is unreadable, return None.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)      # mark as recently used
+        except OSError:
+            return None
+        try:
+            (length,) = _LENGTH.unpack_from(data)
+            end = _LENGTH.size + length
+            metadata = json.loads(data[_LENGTH.size:end].decode("utf-8"))
+        except (struct.error, ValueError) as e:
+            logger.warning(f"Ignoring corrupt cache entry {path}: {e}")
+            return None
+        logger.debug(f"Cache hit for {key}")
+        return (data[end:], metadata)
+
+
+    def put(self, key: str, output: bytes, metadata: dict) -> None:
+        """
+        Store an entry, then evict old entries if the cache is too big.
+
+        Parameters:
+        - key: the key from make_key()
+        - output: the assembled bytes
+        - metadata: anything JSON-serializable to store alongside output
+        """
+        encoded = json.dumps(metadata, separators=(",", ":")).encode("utf-8")
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_LENGTH.pack(len(encoded)))
+                f.write(encoded)
+                f.write(output)
+            os.replace(tmp, self._path(key))
+        except OSError as e:
+            logger.warning(f"Could not write cache entry {key}: {e}")
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+        self.evict()
+
+
+    def evict(self) -> None:
+        """ Delete least recently used entries until under max_bytes. """
+        entries = []
+        total = 0
+        for path in self.directory.glob("*" + ENTRY_SUFFIX):
+            try:
+                st = path.stat()
+            except FileNotFoundError: # evicted by another process
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, path))
+            total += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+                logger.debug(f"Evicted cache entry {path.name}")
+            except FileNotFoundError:
+                pass
+            total -= size
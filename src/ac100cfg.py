@@ -0,0 +1,424 @@
+# Control-flow graph and loop analysis for AC100 binaries
+#
+#   python -m src.ac100cfg prog.bin [--json file] [--dot file]
+#
+# Basic blocks are found by following every path from the entry point, the
+# same way the verifier does; blocks start at the entry, at jump and call
+# targets, and after conditional jumps and calls, and end at a jump, RTS,
+# HALT, or an instruction the verifier rejects.
+#
+# Each call target starts a function, made of the blocks reachable from it
+# without following calls.  A call block gets an edge to its callee and an
+# "after-call" edge to its return site, and each RTS gets a return edge to the
+# return site of every call to its function.  Dominators and natural loops are
+# computed per function over the intraprocedural edges, so a call looks like
+# one step to the caller's loops.
+
+import argparse
+import json
+import logging
+import sys
+import typing
+
+import src.ac100dis as ac_dis
+import src.ac100map as ac_map
+import src.ac100verify as ac_verify
+import src.definitions as defs
+import src.exceptions as ac_exc
+
+logger = logging.getLogger("ac100cfg")
+parser = argparse.ArgumentParser()
+
+# edge kinds
+FALLTHROUGH = "fallthrough"     # to the next block, including an untaken branch
+BRANCH = "branch"               # a taken conditional jump
+JUMP = "jump"
+CALL = "call"                   # JSR to its target
+AFTER_CALL = "after-call"       # JSR to its return site
+RETURN = "return"               # RTS to a return site
+INTRAPROCEDURAL = (FALLTHROUGH, BRANCH, JUMP, AFTER_CALL)
+
+_CONDITIONAL = {"JZ", "JNZ", "JC", "JNC", "JN", "JP", "JV", "JNV"}
+# WAIT ends a block, like a call, because an interrupt handler runs there
+_ENDS_BLOCK = _CONDITIONAL | {"JMP", "JSR", "RTS", "RTI", "WAIT", "HALT"}
+
+
+class Edge(typing.NamedTuple):
+    source: int                 # block addresses
+    target: int
+    kind: str
+
+
+class BasicBlock(typing.NamedTuple):
+    start: int
+    end: int                    # just past the last instruction
+    terminator: str             # the last instruction's mnemonic, "invalid"
+                                # if the verifier rejects it, or None if the
+                                # block just runs into the next one
+
+    @property
+    def addresses(self) -> range:
+        return range(self.start, self.end, 4)
+
+
+class Loop(typing.NamedTuple):
+    header: int
+    blocks: frozenset           # block addresses, header included
+    back_edges: tuple           # (source, header) pairs
+    depth: int                  # 1 for an outermost loop
+
+
+class ControlFlowGraph:
+    def __init__(self, memory: bytes, entry: int, blocks: dict, edges: [Edge]):
+        self.memory = memory
+        self.entry = entry
+        self.blocks: dict = blocks      # address -> BasicBlock, in order
+        self.edges: [Edge] = edges
+        self.successors: dict = {start: [] for start in blocks}
+        self.predecessors: dict = {start: [] for start in blocks}
+        for edge in edges:
+            self.successors[edge.source].append(edge)
+            self.predecessors[edge.target].append(edge)
+        self.functions: dict = {}       # entry -> sorted block addresses
+
+
+    @classmethod
+    def from_program(cls, program: bytes,
+                     entry: int = defs.CODE_START) -> "ControlFlowGraph":
+        """
+        Build the graph of a program.
+
+        Parameters:
+        - program: a flat binary, which loads at CODE_START, or a sparse
+          image.  Raises ImageFormatError if a sparse image is malformed.
+        - entry: where execution starts
+
+        Return:
+        The graph, with its functions found.
+        """
+        memory = bytearray(defs.ADDRESS_SIZE)
+        loaded = []
+        for address, data in ac_map.memory_segments(program):
+            memory[address:address + len(data)] = data
+            end = min(address + len(data), defs.VRAM_START)
+            if address < end:
+                loaded.append((address, end))
+        memory = bytes(memory)
+
+        def fetchable(pc):
+            return any(start <= pc and pc + 4 <= end for start, end in loaded)
+
+        def mnemonic(pc):
+            if ac_verify.check_instruction(memory[pc:pc + 4], pc):
+                return "invalid"
+            return defs.INSTRUCTION_FORMATS[memory[pc]][0]
+
+        # find every reachable instruction and where blocks must start
+        leaders = {entry}
+        visited = set()
+        work = [entry]
+        while work:
+            pc = work.pop()
+            while fetchable(pc) and pc not in visited:
+                visited.add(pc)
+                name = mnemonic(pc)
+                if name in _CONDITIONAL or name in ("JMP", "JSR"):
+                    target = memory[pc + 2] << 8 | memory[pc + 3]
+                    leaders.add(target)
+                    work.append(target)
+                if name in _CONDITIONAL or name in ("JSR", "WAIT"):
+                    leaders.add(pc + 4)
+                    work.append(pc + 4)
+                if name in _ENDS_BLOCK or name == "invalid":
+                    break
+                pc += 4
+
+        blocks = {}
+        edges = []
+        calls = []              # (block, callee, return site)
+        for start in sorted(leaders & visited):
+            pc = start
+            while True:
+                name = mnemonic(pc)
+                if name in _ENDS_BLOCK or name == "invalid":
+                    break
+                if pc + 4 not in visited or pc + 4 in leaders:
+                    if pc + 4 in visited:
+                        edges.append(Edge(start, pc + 4, FALLTHROUGH))
+                    name = None
+                    break
+                pc += 4
+            blocks[start] = BasicBlock(start, pc + 4, name)
+            target = memory[pc + 2] << 8 | memory[pc + 3]
+            if name in _CONDITIONAL:
+                edges.append(Edge(start, target, BRANCH))
+                edges.append(Edge(start, pc + 4, FALLTHROUGH))
+            elif name == "JMP":
+                edges.append(Edge(start, target, JUMP))
+            elif name == "JSR":
+                edges.append(Edge(start, target, CALL))
+                edges.append(Edge(start, pc + 4, AFTER_CALL))
+                calls.append((start, target, pc + 4))
+            elif name == "WAIT" and pc + 4 in visited:
+                edges.append(Edge(start, pc + 4, FALLTHROUGH))
+
+        # paths that run off the loaded code end without an edge
+        edges = [edge for edge in edges if edge.target in blocks]
+        calls = [call for call in calls if call[1] in blocks]
+        graph = cls(memory, entry, blocks, edges)
+        graph._find_functions(calls)
+        return graph
+
+
+    def _find_functions(self, calls: [(int, int, int)]) -> None:
+        """ Group blocks into functions and add the RTS return edges """
+        entries = {self.entry} | {callee for _, callee, _ in calls}
+        for function in sorted(entries & self.blocks.keys()):
+            self.functions[function] = sorted(self.reachable(function))
+        for function, members in self.functions.items():
+            sites = [site for _, callee, site in calls if callee == function]
+            for block in members:
+                if self.blocks[block].terminator == "RTS":
+                    for site in sites:
+                        if site not in self.blocks:
+                            continue
+                        edge = Edge(block, site, RETURN)
+                        self.edges.append(edge)
+                        self.successors[block].append(edge)
+                        self.predecessors[site].append(edge)
+
+
+    def reachable(self, root: int, kinds=INTRAPROCEDURAL) -> set:
+        """ Find the blocks reachable from root along edges of some kinds """
+        seen = {root}
+        work = [root]
+        while work:
+            for edge in self.successors[work.pop()]:
+                if edge.kind in kinds and edge.target not in seen:
+                    seen.add(edge.target)
+                    work.append(edge.target)
+        return seen
+
+
+    def dominators(self, function: int) -> dict:
+        """
+        Compute a function's dominator tree.
+
+        Uses the iterative algorithm of Cooper, Harvey, and Kennedy over the
+        intraprocedural edges.
+
+        Parameters:
+        function: the function's entry block
+
+        Return:
+        A mapping from each of the function's blocks to its immediate
+        dominator; the entry maps to None.
+        """
+        # reverse postorder, without recursion: big programs have deep paths
+        order = []
+        seen = {function}
+        stack = [(function, iter(self._intra_successors(function)))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if child not in seen:
+                    seen.add(child)
+                    stack.append((child, iter(self._intra_successors(child))))
+                    break
+            else:
+                order.append(node)
+                stack.pop()
+        order.reverse()
+        index = {node: i for i, node in enumerate(order)}
+
+        idom = {function: function}
+        def intersect(a, b):
+            while a != b:
+                while index[a] > index[b]:
+                    a = idom[a]
+                while index[b] > index[a]:
+                    b = idom[b]
+            return a
+
+        changed = True
+        while changed:
+            changed = False
+            for node in order[1:]:
+                preds = [e.source for e in self.predecessors[node]
+                         if e.kind in INTRAPROCEDURAL and e.source in idom]
+                new = preds[0]
+                for pred in preds[1:]:
+                    new = intersect(pred, new)
+                if idom.get(node) != new:
+                    idom[node] = new
+                    changed = True
+        idom[function] = None
+        return idom
+
+
+    def _intra_successors(self, block: int) -> [int]:
+        return [e.target for e in self.successors[block]
+                if e.kind in INTRAPROCEDURAL]
+
+
+    def loops(self) -> [Loop]:
+        """
+        Find the natural loops of every function.
+
+        Return:
+        One Loop per loop header, with each loop followed by the loops nested
+        in it.  Back edges to the same header are merged into one loop.
+        """
+        found = {}
+        for function in self.functions:
+            idom = self.dominators(function)
+            def dominates(a, b):
+                while b is not None and b != a:
+                    b = idom[b]
+                return b == a
+            for block in idom:
+                for target in self._intra_successors(block):
+                    if target in idom and dominates(target, block):
+                        body, back = found.get(target, (set(), []))
+                        body |= self._loop_body(target, block)
+                        back.append((block, target))
+                        found[target] = (body, back)
+        loops = []
+        order = {}
+        for header, (body, back) in found.items():
+            outer = sorted((len(other_body), other)
+                           for other, (other_body, _) in found.items()
+                           if other != header and body < other_body)
+            loops.append(Loop(header, frozenset(body), tuple(sorted(back)),
+                              len(outer) + 1))
+            order[header] = [other for _, other in reversed(outer)] + [header]
+        loops.sort(key=lambda loop: order[loop.header])
+        return loops
+
+
+    def _loop_body(self, header: int, tail: int) -> set:
+        """ The blocks that reach tail without passing through header """
+        body = {header, tail}
+        work = [tail] if tail != header else []
+        while work:
+            for edge in self.predecessors[work.pop()]:
+                if (edge.kind in INTRAPROCEDURAL and edge.source not in body):
+                    body.add(edge.source)
+                    work.append(edge.source)
+        return body
+
+
+    def instructions(self, block: int) -> [str]:
+        """ Disassemble a block """
+        b = self.blocks[block]
+        return ac_dis.instructions(self.memory[b.start:b.end])
+
+
+    def to_json(self) -> dict:
+        """
+        Describe the graph in a form json.dumps() accepts.
+
+        Return:
+        A dict with the entry point, the blocks (each with its instructions
+        and successors), the functions, and the loops.
+        """
+        return {
+            "entry": self.entry,
+            "blocks": [{
+                "start": b.start, "end": b.end, "terminator": b.terminator,
+                "instructions": self.instructions(b.start),
+                "successors": [{"target": e.target, "kind": e.kind}
+                               for e in self.successors[b.start]]
+            } for b in self.blocks.values()],
+            "functions": [{"entry": entry, "blocks": members}
+                          for entry, members in self.functions.items()],
+            "loops": [{"header": loop.header, "blocks": sorted(loop.blocks),
+                       "back_edges": [list(edge) for edge in loop.back_edges],
+                       "depth": loop.depth} for loop in self.loops()]
+        }
+
+
+    def to_dot(self) -> str:
+        """
+        Describe the graph in Graphviz's DOT language.
+
+        Each function is a cluster, loop headers are drawn with a double
+        border, and call and return edges are dashed.
+        """
+        headers = {loop.header for loop in self.loops()}
+        out = ["digraph cfg {", '    node [shape=box fontname="monospace"];']
+        for i, (entry, members) in enumerate(self.functions.items()):
+            out.append(f"    subgraph cluster_{i} {{")
+            out.append(f'        label="0x{entry:04x}";')
+            for block in members:
+                text = "\\l".join([f"0x{block:04x}:"]
+                                  + self.instructions(block)) + "\\l"
+                style = " peripheries=2" if block in headers else ""
+                out.append(f'        b{block:04x} [label="{text}"{style}];')
+            out.append("    }")
+        for edge in self.edges:
+            style = {CALL: " [style=dashed]", RETURN: " [style=dashed]",
+                     AFTER_CALL: " [style=dotted]", BRANCH: ' [label="T"]'}
+            out.append(f"    b{edge.source:04x} -> b{edge.target:04x}"
+                       f"{style.get(edge.kind, '')};")
+        out.append("}")
+        return "\n".join(out) + "\n"
+
+
+def format_summary(graph: ControlFlowGraph) -> str:
+    """ Summarize a graph's functions and loops for the terminal """
+    loops = graph.loops()
+    rows = [f"{len(graph.blocks)} blocks, {len(graph.edges)} edges, "
+            f"{len(graph.functions)} function(s), {len(loops)} loop(s)"]
+    for loop in loops:
+        instructions = sum(len(graph.blocks[b].addresses) for b in loop.blocks)
+        rows.append(f"{'  ' * loop.depth}loop at 0x{loop.header:04x}: "
+                    f"{len(loop.blocks)} block(s), {instructions} "
+                    f"instruction(s)")
+    return "\n".join(rows)
+
+
+def setup_parser(parser) -> None:
+    """ Set up ArgumentParser """
+    parser.add_argument("binary", help="AC100 binary to analyze")
+    parser.add_argument("--json", metavar="file",
+                        help="write the graph as JSON")
+    parser.add_argument("--dot", metavar="file",
+                        help="write the graph in Graphviz's DOT language")
+    parser.add_argument("-l", "--loglevel", default="warning",
+                        choices=["debug", "info", "warning", "error"],
+                        metavar="level", help="logging level")
+
+
+def setup_logger(level) -> None:
+    """
+    Set up logger
+
+    Parameters:
+    level: the level to use
+    """
+    format = "[%(levelname)s] %(name)s:%(funcName)s():%(lineno)d: %(message)s"
+    logging.basicConfig(format=format, level=logging.getLevelName(level))
+
+
+def main():
+    setup_parser(parser)
+    args = parser.parse_args()
+    setup_logger(args.loglevel.upper())
+    try:
+        with open(args.binary, "rb") as f:
+            graph = ControlFlowGraph.from_program(f.read())
+        if args.json is not None:
+            with open(args.json, "w") as f:
+                json.dump(graph.to_json(), f, indent=1)
+        if args.dot is not None:
+            with open(args.dot, "w") as f:
+                f.write(graph.to_dot())
+    except (OSError, ac_exc.ImageFormatError) as e:
+        logger.error(e)
+        sys.exit(1)
+    print(format_summary(graph))
+
+
+if __name__ == "__main__":
+    main()
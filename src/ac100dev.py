@@ -0,0 +1,329 @@
+# Memory-mapped devices for the AC100
+#
+# Each device is an ac100bus.Device; map it onto an AC100's bus with
+# machine.bus.map_device().  The emulator's command line maps them at the
+# addresses in src.definitions.
+
+import mmap
+import sys
+import threading
+import typing
+
+import src.ac100bus as ac_bus
+import src.definitions as defs
+
+# Buffered console output.  Bytes stored into the data register are collected
+# on the host and written out a chunk at a time, when the machine stops, or
+# when the program stores into the flush register.
+#
+#   offset 0x00, 0x01   data: each byte stored is output, so ST outputs two
+#                       bytes, high byte first, and STL outputs one
+#   offset 0x02         flush: any store writes out what's buffered
+#
+# Reads return 0.
+class Console(ac_bus.Device):
+    DATA: int = 0x00
+    FLUSH: int = 0x02
+    DEFAULT_CHUNK_SIZE: int = 64 * 1024
+
+    def __init__(self, stream: typing.BinaryIO = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Parameters:
+        - stream: where output goes (default: standard output)
+        - chunk_size: write out once this many bytes are buffered; None
+          buffers everything until a flush
+        """
+        self.stream = stream if stream is not None else sys.stdout.buffer
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+
+
+    def write(self, offset: int, value: int) -> None:
+        if offset <= self.DATA + 1:
+            self.buffer.append(value)
+            if (self.chunk_size is not None
+                    and len(self.buffer) >= self.chunk_size):
+                self.flush()
+        elif offset == self.FLUSH:
+            self.flush()
+
+
+    def flush(self) -> None:
+        if self.buffer:
+            self.stream.write(self.buffer)
+            self.buffer.clear()
+        self.stream.flush()
+
+
+# Block storage backed by a host file, which is mapped into the host's memory
+# with mmap, so a transfer is one slice assignment between it and RAM.
+# Registers are big-endian words:
+#
+#   offset 0x00   sector number
+#   offset 0x02   RAM address to transfer to or from
+#   offset 0x04   status (read): STATUS_OK or what went wrong with the last
+#                 command; command (write): a store to 0x05 -- the low byte,
+#                 so ST works -- runs READ_SECTOR or WRITE_SECTOR
+#   offset 0x06   number of sectors (read-only)
+#
+# The sector is copied in full before the command's store completes.
+class Disk(ac_bus.Device):
+    SECTOR_SIZE: int = 512
+
+    SECTOR: int = 0x00
+    ADDRESS: int = 0x02
+    COMMAND: int = 0x05
+    STATUS: int = 0x04
+    SECTORS: int = 0x06
+
+    # commands
+    READ_SECTOR: int = 0x01     # disk to RAM
+    WRITE_SECTOR: int = 0x02    # RAM to disk
+
+    # status values
+    STATUS_OK: int = 0x00
+    STATUS_BAD_SECTOR: int = 0x01
+    STATUS_BAD_ADDRESS: int = 0x02  # not all RAM the transfer may use
+    STATUS_BAD_COMMAND: int = 0x03
+
+    def __init__(self, machine, path: str):
+        """
+        Parameters:
+        - machine: the AC100 whose RAM the disk transfers to and from
+        - path: the host file, whose size is a whole number of sectors.
+          Raises ValueError if it isn't, or OSError if it can't be opened.
+        """
+        self.machine = machine
+        self.file = open(path, "r+b")
+        try:
+            size = self.file.seek(0, 2)
+            if size == 0 or size % self.SECTOR_SIZE != 0:
+                raise ValueError(f"{path}: size {size} isn't a whole number "
+                                 f"of {self.SECTOR_SIZE}-byte sectors")
+            self.sectors = min(size // self.SECTOR_SIZE, 2 ** defs.WORD_SIZE)
+            self.map = mmap.mmap(self.file.fileno(), 0)
+            self.view = memoryview(self.map)
+        except BaseException:
+            self.file.close()
+            raise
+        self.registers = bytearray(8)
+        self.registers[self.SECTORS] = self.sectors >> 8 & 0xff
+        self.registers[self.SECTORS + 1] = self.sectors & 0xff
+
+
+    def read(self, offset: int) -> int:
+        return self.registers[offset] if offset < len(self.registers) else 0
+
+
+    def write(self, offset: int, value: int) -> None:
+        if offset == self.COMMAND:
+            self.registers[self.STATUS + 1] = self._run(value)
+        elif offset < self.STATUS:
+            self.registers[offset] = value
+
+
+    def _word(self, offset: int) -> int:
+        return self.registers[offset] << 8 | self.registers[offset + 1]
+
+
+    def _run(self, command: int) -> int:
+        """ Run a command; return the status """
+        sector = self._word(self.SECTOR)
+        address = self._word(self.ADDRESS)
+        n = self.SECTOR_SIZE
+        if command not in (self.READ_SECTOR, self.WRITE_SECTOR):
+            return self.STATUS_BAD_COMMAND
+        if sector >= self.sectors:
+            return self.STATUS_BAD_SECTOR
+        # the whole range must be plain RAM that the program could have
+        # loaded from or stored to itself
+        needed = ac_bus.WRITE if command == self.READ_SECTOR else ac_bus.READ
+        if (address < defs.STACK_MIN
+                or not self.machine.bus.plain(address, n, needed)):
+            return self.STATUS_BAD_ADDRESS
+
+        start = sector * n
+        if command == self.READ_SECTOR:
+            self.machine.RAM[address:address + n] = self.view[start:start + n]
+            self.machine.invalidate_code(address, n)
+        else:
+            self.view[start:start + n] = memoryview(self.machine.RAM)[
+                address:address + n]
+        return self.STATUS_OK
+
+
+    def flush(self) -> None:
+        self.map.flush()
+
+
+    def close(self) -> None:
+        """ Write back and unmap the file """
+        self.map.flush()
+        self.view.release()
+        self.map.close()
+        self.file.close()
+
+
+# Interrupt controller.  Devices raise one of eight lines; a line that is
+# pending and enabled interrupts the machine the next time it checks, which is
+# just after a jump, branch, JSR, RTS, or RTI.  The machine then pushes PC and
+# PS and jumps to the line's vector; the lowest-numbered line goes first.
+# Registers are big-endian words, of which the enable and pending registers
+# only use the low byte:
+#
+#   offset 0x00   enable: bit n set lets line n interrupt
+#   offset 0x02   pending (read): the lines raised and not yet taken;
+#                 storing 1 bits to 0x03 drops those lines
+#   offset 0x10   vectors: the handler address for line n is at 0x10 + 2n
+#
+# The machine only asks update() about interrupts once its instruction count
+# reaches due, which devices keep up to date, so a machine with nothing
+# pending or about to happen pays one comparison per check.
+#
+# Timers run on the controller's clock: the instructions retired plus idle,
+# the time spent waiting in WAIT, in instructions.
+class InterruptController(ac_bus.Device):
+    LINES: int = 8
+
+    ENABLE: int = 0x01
+    PENDING: int = 0x03
+    VECTORS: int = 0x10
+
+    NEVER: int = 2 ** 63            # due when nothing will happen
+
+    def __init__(self):
+        self.enabled = 0
+        self.pending = 0
+        self.vectors = [0] * self.LINES
+        self.timers: list = []      # updated each time update() is called
+        self.due = self.NEVER
+        self.idle = 0
+        self.event = threading.Event()  # set when a line is raised
+
+
+    def read(self, offset: int) -> int:
+        if offset == self.ENABLE:
+            return self.enabled
+        if offset == self.PENDING:
+            return self.pending
+        if self.VECTORS <= offset < self.VECTORS + 2 * self.LINES:
+            vector = self.vectors[(offset - self.VECTORS) // 2]
+            return vector & 0xff if offset % 2 else vector >> 8
+        return 0
+
+
+    def write(self, offset: int, value: int) -> None:
+        if offset == self.ENABLE:
+            self.enabled = value
+        elif offset == self.PENDING:
+            self.pending &= ~value
+        elif self.VECTORS <= offset < self.VECTORS + 2 * self.LINES:
+            line = (offset - self.VECTORS) // 2
+            if offset % 2:
+                self.vectors[line] = self.vectors[line] & 0xff00 | value
+            else:
+                self.vectors[line] = value << 8 | self.vectors[line] & 0xff
+        self.due = 0
+
+
+    def raise_line(self, line: int) -> None:
+        """ Mark a line pending """
+        self.pending |= 1 << line
+        self.due = 0
+        self.event.set()
+
+
+    def update(self, retired: int) -> bool:
+        """
+        Bring the timers up to date and work out when next to check.
+
+        Parameters:
+        retired: the number of instructions the machine has retired
+
+        Return:
+        True if an enabled line is pending
+        """
+        now = retired + self.idle
+        self.due = self.NEVER
+        for timer in self.timers:
+            timer.update(now)
+            if timer.deadline is not None:
+                self.due = min(self.due, timer.deadline - self.idle)
+        if self.pending & self.enabled:
+            self.due = 0
+            return True
+        return False
+
+
+    def can_wake(self) -> bool:
+        """ Check whether a running timer will raise an enabled line """
+        return any(timer.deadline is not None and self.enabled >> timer.line & 1
+                   for timer in self.timers)
+
+
+    def acknowledge(self) -> (int, int):
+        """
+        Drop the lowest-numbered enabled pending line.
+
+        Return:
+        The line and its vector
+        """
+        lines = self.pending & self.enabled
+        line = (lines & -lines).bit_length() - 1
+        self.pending &= ~(1 << line)
+        return line, self.vectors[line]
+
+
+# Programmable interval timer, which raises its interrupt line every period
+# instructions.  One register, a big-endian word:
+#
+#   offset 0x00   period: a store to the low byte at 0x01 -- so ST works --
+#                 restarts the timer, which first fires period instructions
+#                 after the next check; 0 stops it
+#
+# Ticks that pass while the machine isn't checking, such as inside a long
+# block, are merged into one.
+class Timer(ac_bus.Device):
+    PERIOD: int = 0x00
+
+    def __init__(self, controller: InterruptController, line: int = 0):
+        """
+        Parameters:
+        - controller: where the timer raises its interrupt
+        - line: which line it raises
+        """
+        self.controller = controller
+        self.line = line
+        self.period = 0
+        self.deadline = None        # the clock at the next tick
+        self.restart = False
+        controller.timers.append(self)
+
+
+    def read(self, offset: int) -> int:
+        if offset == self.PERIOD:
+            return self.period >> 8
+        if offset == self.PERIOD + 1:
+            return self.period & 0xff
+        return 0
+
+
+    def write(self, offset: int, value: int) -> None:
+        if offset == self.PERIOD:
+            self.period = value << 8 | self.period & 0xff
+        elif offset == self.PERIOD + 1:
+            self.period = self.period & 0xff00 | value
+            self.restart = True
+            self.controller.due = 0
+
+
+    def update(self, now: int) -> None:
+        """ Start or tick the timer; now is the controller's clock """
+        if self.restart:
+            self.restart = False
+            self.deadline = now + self.period if self.period else None
+        elif self.deadline is not None and now >= self.deadline:
+            self.controller.raise_line(self.line)
+            missed = (now - self.deadline) // self.period
+            self.deadline += (missed + 1) * self.period
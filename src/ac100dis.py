@@ -0,0 +1,263 @@
+# Disassembler for AC100 binaries
+#
+#   python -m src.ac100dis prog.bin [-o prog.s]
+#
+# The binary is viewed as an (N, 4) array of instruction words and decoded all
+# at once with numpy: opcodes and operands are looked up in tables indexed by
+# byte value instead of one instruction at a time, so even a full 64 KiB image
+# takes milliseconds.
+#
+# The output assembles back into the same bytes.  Words that aren't valid
+# instructions, or that the assembler would encode differently (say, with
+# nonzero unused bytes), come out as .word data; jump targets get labels named
+# after their address, like L0210.  A sparse image's segments are separated
+# with .org.
+
+import argparse
+import functools
+import logging
+import sys
+
+import numpy as np
+
+import src.ac100map as ac_map
+import src.definitions as defs
+import src.exceptions as ac_exc
+
+logger = logging.getLogger("ac100dis")
+parser = argparse.ArgumentParser()
+
+# the operand formats of definitions.INSTRUCTION_FORMATS; decode() numbers
+# them by index
+_FORMATS = ["", "r imm", "r r", "r mem", "r", "addr", "r r r", "r idx",
+            "r inc"]
+_INVALID = -1
+
+# bytes 1-3 of the instructions that take no operands, as the assembler
+# writes them
+_NO_OPERANDS = {"RTS": 0x000000, "RTI": 0x000000, "WAIT": 0x000000,
+                "HALT": 0xfffeff, "NOP": 0xffffff}
+
+
+@functools.cache
+def _tables() -> dict:
+    """ Lookup tables indexed by byte or word value, built on first use """
+    formats = np.full(2 ** defs.BYTE, _INVALID, dtype=np.int8)
+    canonical = np.full(2 ** defs.BYTE, -1, dtype=np.int64)
+    for opcode, (mnemonic, form) in defs.INSTRUCTION_FORMATS.items():
+        formats[opcode] = _FORMATS.index(form)
+        canonical[opcode] = _NO_OPERANDS.get(mnemonic, -1)
+    registers = [f"R{r + 1}" for r in range(2 ** defs.BYTE)]
+    hexes = [f"0x{w:04x}" for w in range(defs.ADDRESS_SIZE)]
+    # the start of each line, indexed by bytes 0 and 1 of the word: the
+    # mnemonic and register of an instruction, or the first word of a .word
+    words = [".word " + h + " " for h in hexes]
+    prefixes = list(words)
+    for word in range(defs.ADDRESS_SIZE):
+        opcode, reg = word >> 8, word & 0xff
+        if opcode not in defs.INSTRUCTION_FORMATS:
+            continue
+        mnemonic, form = defs.INSTRUCTION_FORMATS[opcode]
+        match form:
+            case "r imm" | "r r" | "r mem" | "r r r" | "r idx" | "r inc":
+                prefixes[word] = f"{mnemonic} {registers[reg]} "
+            case "r": prefixes[word] = f"{mnemonic} {registers[reg]}"
+            case "addr": prefixes[word] = f"{mnemonic} "
+            case "": prefixes[word] = mnemonic
+    memory = [f"[{registers[w]}]" if w < 0x10 else hexes[w]
+              for w in range(defs.ADDRESS_SIZE)]
+    return {
+        "formats": formats, "canonical": canonical,
+        "hex": np.array(hexes, dtype=object),
+        "bytes": np.array([f"0x{b:02x}" for b in range(2 ** defs.BYTE)],
+                          dtype=object),
+        "registers": np.array(registers, dtype=object),
+        "prefixes": np.array(prefixes, dtype=object),
+        "words": np.array(words, dtype=object),
+        "memory": np.array(memory, dtype=object),
+    }
+
+
+def decode(data: bytes) -> dict:
+    """
+    Decode a run of instruction words.
+
+    Parameters:
+    data: the bytes; any bytes past the last whole word are ignored
+
+    Return:
+    A dict of arrays with one element per word: opcode, reg (byte 1), hi
+    (byte 2), operand (bytes 2 and 3), format (an index into _FORMATS, or
+    _INVALID), and valid, which is True where the word is an instruction the
+    assembler would encode the same way.
+    """
+    tables = _tables()
+    n = len(data) // 4
+    words = np.frombuffer(data, dtype=np.uint8, count=4 * n).reshape(n, 4)
+    opcode = words[:, 0]
+    reg = words[:, 1]
+    hi = words[:, 2]
+    lo = words[:, 3]
+    operand = hi.astype(np.int64) << 8 | lo
+    form = tables["formats"][opcode]
+    registers = defs.NUM_REGISTERS
+
+    valid = np.zeros(n, dtype=bool)
+    valid |= (form == _FORMATS.index("r imm")) & (reg < registers)
+    valid |= ((form == _FORMATS.index("r r")) & (reg < registers)
+              & (hi < registers) & (lo == 0))
+    valid |= ((form == _FORMATS.index("r r r")) & (reg < registers)
+              & (hi < registers) & (lo < registers))
+    valid |= (form == _FORMATS.index("r mem")) & (reg < registers)
+    valid |= ((form == _FORMATS.index("r idx")) & (reg < registers)
+              & (hi < registers))
+    valid |= ((form == _FORMATS.index("r inc")) & (reg < registers)
+              & (hi < registers) & (lo == 0))
+    valid |= (form == _FORMATS.index("r")) & (reg < registers) & (operand == 0)
+    # the assembler refuses jumps into the stack or to unaligned addresses
+    valid |= ((form == _FORMATS.index("addr")) & (reg == 0)
+              & (operand >= defs.STACK_MIN) & (operand % 4 == 0))
+    rest = reg.astype(np.int64) << 16 | operand
+    valid |= (form == _FORMATS.index("")) & (rest == tables["canonical"][opcode])
+    return {"opcode": opcode, "reg": reg, "hi": hi, "operand": operand,
+            "format": form, "valid": valid}
+
+
+def _segment_lines(address: int, data: bytes, labels: np.ndarray) -> [str]:
+    """ Disassemble one segment, given the addresses that need labels """
+    tables = _tables()
+    n = len(data) // 4 if address % 4 == 0 else 0
+    d = decode(data[:4 * n])
+    operand, form, valid = d["operand"], d["format"], d["valid"]
+    form = np.where(valid, form, _INVALID)
+
+    first = d["opcode"].astype(np.int64) << 8 | d["reg"]
+    prefix = tables["prefixes"][first]
+    names = tables["hex"].copy()    # jump targets
+    names[labels] = [f"L{a:04x}" for a in labels]
+    # the rest of each line, for the formats that have more
+    operands = {"r imm": tables["hex"], "r mem": tables["memory"],
+                "addr": names}
+    text = prefix.copy()
+    for name, table in operands.items():
+        mask = form == _FORMATS.index(name)
+        text[mask] = prefix[mask] + table[operand[mask]]
+    mask = form == _FORMATS.index("r r")
+    text[mask] = prefix[mask] + tables["registers"][d["hi"][mask]]
+    mask = form == _FORMATS.index("r r r")
+    text[mask] = (prefix[mask] + tables["registers"][d["hi"][mask]] + " "
+                  + tables["registers"][d["operand"][mask] & 0xff])
+    mask = form == _FORMATS.index("r idx")
+    text[mask] = (prefix[mask] + "[" + tables["registers"][d["hi"][mask]]
+                  + "+" + tables["bytes"][d["operand"][mask] & 0xff] + "]")
+    mask = form == _FORMATS.index("r inc")
+    text[mask] = prefix[mask] + "[" + tables["registers"][d["hi"][mask]] + "]+"
+    mask = form == _INVALID
+    text[mask] = tables["words"][first[mask]] + tables["hex"][operand[mask]]
+
+    # each label goes on its own line, just before its instruction
+    addresses = address + 4 * np.arange(n)
+    labelled = np.isin(addresses, labels)
+    rows = np.flatnonzero(labelled)
+    lines = np.empty(n + len(rows), dtype=object)
+    lines[np.arange(n) + np.cumsum(labelled)] = text
+    lines[rows + np.arange(len(rows))] = names[addresses[rows]] + ":"
+    lines = lines.tolist()
+    tail = data[4 * n:]
+    if tail:
+        lines.append(".byte " + " ".join(f"0x{b:02x}" for b in tail))
+    return lines
+
+
+def instructions(data: bytes) -> [str]:
+    """
+    Disassemble instruction words on their own, without labels.
+
+    Parameters:
+    data: the words, which must be 4-byte aligned in memory
+
+    Return:
+    One line per word, plus a .byte line for any trailing bytes.
+    """
+    return _segment_lines(0, data, np.array([], dtype=np.int64))
+
+
+def disassemble(program: bytes) -> [str]:
+    """
+    Disassemble a program.
+
+    Parameters:
+    program: a flat binary, which loads at CODE_START, or a sparse image.
+    Raises ImageFormatError if a sparse image is malformed.
+
+    Return:
+    The source lines.
+    """
+    segments = [(address, data) for address, data in
+                ac_map.memory_segments(program) if data]
+    # label every valid jump target that is the start of an instruction word
+    targets = []
+    starts = []
+    for address, data in segments:
+        if address % 4 != 0:
+            continue
+        d = decode(data)
+        jumps = d["valid"] & (d["format"] == _FORMATS.index("addr"))
+        targets.append(d["operand"][jumps])
+        starts.append((address, address + 4 * len(d["valid"])))
+    targets = (np.unique(np.concatenate(targets)) if targets
+               else np.array([], dtype=np.int64))
+    in_code = np.zeros(len(targets), dtype=bool)
+    for start, end in starts:
+        in_code |= (targets >= start) & (targets < end)
+    labels = targets[in_code]
+
+    lines = []
+    for i, (address, data) in enumerate(segments):
+        if i > 0 or address != defs.CODE_START:
+            lines.append(f".org 0x{address:04x}")
+        lines.extend(_segment_lines(address, data, labels))
+    return lines
+
+
+def setup_parser(parser) -> None:
+    """ Set up ArgumentParser """
+    parser.add_argument("binary", help="AC100 binary to disassemble")
+    parser.add_argument("-o", "--output", metavar="file",
+                        help="write the source here instead of to standard "
+                        "output")
+    parser.add_argument("-l", "--loglevel", default="warning",
+                        choices=["debug", "info", "warning", "error"],
+                        metavar="level", help="logging level")
+
+
+def setup_logger(level) -> None:
+    """
+    Set up logger
+
+    Parameters:
+    level: the level to use
+    """
+    format = "[%(levelname)s] %(name)s:%(funcName)s():%(lineno)d: %(message)s"
+    logging.basicConfig(format=format, level=logging.getLevelName(level))
+
+
+def main():
+    setup_parser(parser)
+    args = parser.parse_args()
+    setup_logger(args.loglevel.upper())
+    try:
+        with open(args.binary, "rb") as f:
+            source = "\n".join(disassemble(f.read())) + "\n"
+        if args.output is None:
+            sys.stdout.write(source)
+        else:
+            with open(args.output, "w") as f:
+                f.write(source)
+    except (OSError, ac_exc.ImageFormatError) as e:
+        logger.error(e)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+# Benchmark history and regression gate
+#
+#   python -m src.ac100history add results.json
+#   python -m src.ac100history compare results.json [--baseline commit]
+#
+# Results written by src.ac100bench -o are appended to a history file, one
+# JSON report per line, each tagged with the commit it was measured on.
+# compare checks a new report against a baseline commit from the history and
+# exits with status 1 if any benchmark got slower by more than the threshold.
+#
+# Timings are noisy, so each benchmark is judged by the median of its
+# repeated runs, with a distribution-free confidence interval for that median.
+# A slowdown only counts as a regression when the medians differ by more than
+# the threshold and the two intervals don't overlap; run the benchmarks with
+# a higher --repeat for tighter intervals.
+
+import argparse
+import json
+import logging
+import math
+import statistics
+import sys
+import typing
+
+logger = logging.getLogger("ac100history")
+parser = argparse.ArgumentParser()
+
+DEFAULT_HISTORY: str = "bench_history.jsonl"
+DEFAULT_THRESHOLD: float = 5.0  # percent
+DEFAULT_CONFIDENCE: float = 0.95
+
+
+class Estimate(typing.NamedTuple):
+    low: float
+    median: float
+    high: float
+
+
+class Comparison(typing.NamedTuple):
+    metric: str
+    baseline: Estimate
+    current: Estimate
+    change: float               # percent; negative is slower
+    status: str                 # "ok", "faster", "slower", or "noisy"
+
+
+def median_interval(samples: [float],
+                    confidence: float = DEFAULT_CONFIDENCE) -> Estimate:
+    """
+    Estimate the median of some samples, with a confidence interval.
+
+    The interval is bounded by order statistics, so it assumes nothing about
+    how the samples are distributed.  With too few samples to reach the
+    requested confidence, it spans all of them.
+
+    Parameters:
+    - samples: the measurements
+    - confidence: the probability that the interval contains the true median
+
+    Return:
+    An Estimate (low, median, high).
+    """
+    xs = sorted(samples)
+    n = len(xs)
+    median = statistics.median(xs)
+    # the number of samples below the true median is Binomial(n, 1/2), so
+    # [xs[j], xs[n - 1 - j]] contains it with probability
+    # sum(C(n, i) for i in j + 1 .. n - 1 - j) / 2**n
+    best = 0
+    for j in range(n // 2):
+        coverage = sum(math.comb(n, i) for i in range(j + 1, n - j)) / 2 ** n
+        if coverage < confidence:
+            break
+        best = j
+    return Estimate(xs[best], median, xs[n - 1 - best])
+
+
+def metrics(report: dict) -> dict:
+    """
+    Extract comparable throughput figures from a benchmark report.
+
+    Parameters:
+    report: a report written by src.ac100bench
+
+    Return:
+    A mapping from metric name to a list of samples, each in lines or
+    instructions per second, so that bigger is always better.
+    """
+    found = {}
+    for result in report.get("results", []):
+        match result.get("benchmark"):
+            case "asm":
+                name = f"asm/{result['phase']}/{result['lines']}"
+                work = result["lines"]
+            case "emu":
+                name = f"emu/{result['program']}"
+                work = result["instructions"]
+            case _:
+                continue
+        samples = result.get("samples") or [result["seconds"]]
+        found.setdefault(name, []).extend(work / s for s in samples if s > 0)
+    return found
+
+
+def load_history(path: str) -> [dict]:
+    """
+    Read a history file.
+
+    Parameters:
+    path: the history file
+
+    Return:
+    The reports in it, oldest first.  A missing file is an empty history;
+    lines that aren't valid JSON are skipped with a warning.
+    """
+    reports = []
+    try:
+        with open(path) as f:
+            for lineno, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    reports.append(json.loads(line))
+                except ValueError as e:
+                    logger.warning(f"{path}:{lineno}: skipping bad entry: {e}")
+    except FileNotFoundError:
+        pass
+    return reports
+
+
+def append_history(path: str, report: dict) -> None:
+    """ Append a report to a history file. """
+    with open(path, "a") as f:
+        f.write(json.dumps(report, separators=(",", ":")) + "\n")
+
+
+def baseline_samples(history: [dict], commit: str = None,
+                     exclude: str = None) -> (str, dict):
+    """
+    Collect the samples for a baseline commit.
+
+    Every report in the history for the commit is pooled, so measuring a
+    baseline several times narrows its intervals.
+
+    Parameters:
+    - history: the reports, oldest first
+    - commit: the baseline commit, or a prefix of it; by default, the most
+      recent commit in the history other than exclude
+    - exclude: the commit being compared, when choosing a default baseline
+
+    Return:
+    A 2-tuple (commit, samples), samples being a mapping like metrics()
+    returns.  If there is no such commit in the history, return None.
+    """
+    if commit is None:
+        for report in reversed(history):
+            if report.get("commit") and report["commit"] != exclude:
+                commit = report["commit"]
+                break
+        else:
+            return None
+    matching = [r for r in history
+                if r.get("commit") and r["commit"].startswith(commit)]
+    if not matching:
+        return None
+    if len({r["commit"] for r in matching}) > 1:
+        logger.warning(f"Commit prefix '{commit}' is ambiguous; using "
+                       f"{matching[-1]['commit']}")
+        matching = [r for r in matching if r["commit"] == matching[-1]["commit"]]
+    pooled = {}
+    for report in matching:
+        for name, samples in metrics(report).items():
+            pooled.setdefault(name, []).extend(samples)
+    return (matching[-1]["commit"], pooled)
+
+
+def compare(baseline: dict, current: dict,
+            threshold: float = DEFAULT_THRESHOLD,
+            confidence: float = DEFAULT_CONFIDENCE) -> [Comparison]:
+    """
+    Compare two sets of samples metric by metric.
+
+    Parameters:
+    - baseline: samples by metric, as returned by metrics()
+    - current: the same for the run being checked
+    - threshold: the percentage change in median that counts
+    - confidence: the confidence level of the intervals
+
+    Return:
+    One Comparison per metric found in both.  Its status is "slower" or
+    "faster" if the medians differ by more than threshold and the intervals
+    don't overlap, "noisy" if the medians differ by more than threshold but
+    the intervals overlap, and "ok" otherwise.
+    """
+    comparisons = []
+    for name in sorted(baseline.keys() & current.keys()):
+        if not baseline[name] or not current[name]:
+            continue
+        before = median_interval(baseline[name], confidence)
+        after = median_interval(current[name], confidence)
+        change = (after.median - before.median) / before.median * 100
+        if abs(change) <= threshold:
+            status = "ok"
+        elif change < 0 and after.high < before.low:
+            status = "slower"
+        elif change > 0 and after.low > before.high:
+            status = "faster"
+        else:
+            status = "noisy"
+        comparisons.append(Comparison(name, before, after, change, status))
+    return comparisons
+
+
+def format_comparisons(comparisons: [Comparison]) -> str:
+    """ Format comparisons as a table for the terminal """
+    rows = [f"{'metric':<24} {'baseline':>12} {'current':>12} {'change':>8}  "
+            "status"]
+    for c in comparisons:
+        rows.append(f"{c.metric:<24} {c.baseline.median:>12.0f} "
+                    f"{c.current.median:>12.0f} {c.change:>+7.1f}%  {c.status}")
+    return "\n".join(rows)
+
+
+def setup_parser(parser) -> None:
+    """ Set up ArgumentParser """
+    parser.add_argument("-l", "--loglevel", default="warning",
+                        choices=["debug", "info", "warning", "error"],
+                        metavar="level", help="logging level")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, metavar="file",
+                        help="history file (default: %(default)s)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = subparsers.add_parser("add", help="append results to the "
+                                       "history")
+    add_parser.add_argument("results", help="JSON written by src.ac100bench -o")
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="check results against a baseline; exit 1 on a "
+        "regression")
+    compare_parser.add_argument("results",
+                                help="JSON written by src.ac100bench -o")
+    compare_parser.add_argument("--baseline", metavar="commit",
+                                help="commit to compare against (default: "
+                                "the latest other commit in the history)")
+    compare_parser.add_argument("--threshold", type=float,
+                                default=DEFAULT_THRESHOLD, metavar="percent",
+                                help="slowdown that counts as a regression "
+                                "(default: %(default)s)")
+    compare_parser.add_argument("--confidence", type=float,
+                                default=DEFAULT_CONFIDENCE, metavar="level",
+                                help="confidence level of the intervals "
+                                "around each median (default: %(default)s)")
+    compare_parser.add_argument("--add", action="store_true",
+                                help="also append the results to the history")
+
+
+def setup_logger(level) -> None:
+    """
+    Set up logger
+
+    Parameters:
+    level: the level to use
+    """
+    format = "[%(levelname)s] %(name)s:%(funcName)s():%(lineno)d: %(message)s"
+    logging.basicConfig(format=format, level=logging.getLevelName(level))
+
+
+def main():
+    setup_parser(parser)
+    args = parser.parse_args()
+    setup_logger(args.loglevel.upper())
+    try:
+        with open(args.results) as f:
+            report = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not read {args.results}: {e}")
+        sys.exit(2)
+
+    if args.command == "add":
+        append_history(args.history, report)
+        return
+
+    history = load_history(args.history)
+    baseline = baseline_samples(history, args.baseline, report.get("commit"))
+    if args.add:
+        append_history(args.history, report)
+    if baseline is None:
+        if args.baseline is not None:
+            logger.error(f"No results for commit {args.baseline} in "
+                         f"{args.history}")
+            sys.exit(2)
+        print("No baseline in the history to compare with")
+        return
+    commit, samples = baseline
+    comparisons = compare(samples, metrics(report), args.threshold,
+                          args.confidence)
+    print(f"Baseline: {commit}")
+    print(format_comparisons(comparisons))
+    regressions = [c for c in comparisons if c.status == "slower"]
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower than the baseline by "
+              f"more than {args.threshold}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# Sparse memory image format for the AC100
+#
+# A flat binary is loaded at CODE_START.  Programs that place data elsewhere
+# (with .org) are written in this format instead, so that the gaps between
+# their pieces don't have to be stored as zeros.  All multi-byte fields are
+# big-endian.
+#
+#   magic            4 bytes   b"AC1S"
+#   segment count    2 bytes
+#   segments         <segment count> x (address: 2 bytes, length: 2 bytes,
+#                    data: <length> bytes)
+#
+# A flat binary that happens to start with the magic number, say from
+# .ascii "AC1S", would be taken for an image, so it is written as an image
+# with one segment at CODE_START instead (see from_flat()).
+
+import struct
+
+import src.definitions as defs
+import src.exceptions as ac_exc
+
+MAGIC: bytes = b"AC1S"
+
+_HEADER = struct.Struct(">4sH")
+_SEGMENT = struct.Struct(">HH")
+
+
+def is_image(data: bytes) -> bool:
+    """ Whether data is a sparse image rather than a flat binary """
+    return data[:len(MAGIC)] == MAGIC
+
+
+def from_flat(bytecode: bytes) -> bytes:
+    """
+    Make a flat binary safe to load.
+
+    Parameters:
+    bytecode: the binary, which loads at CODE_START
+
+    Return:
+    bytecode itself, or, if it starts with the magic number, an image that
+    loads the same bytes.
+    """
+    if is_image(bytecode):
+        return pack([(defs.CODE_START, bytecode)])
+    return bytecode
+
+
+def pack(segments: [(int, bytes)]) -> bytes:
+    """
+    Build a sparse image.
+
+    Parameters:
+    segments: (address, data) pairs; empty segments are left out
+
+    Return:
+    The image.  Raises ValueError if a segment runs past the end of memory.
+    """
+    segments = [(address, data) for address, data in segments if data]
+    out = bytearray(_HEADER.pack(MAGIC, len(segments)))
+    for address, data in segments:
+        if address + len(data) > defs.ADDRESS_SIZE:
+            raise ValueError(f"Segment at 0x{address:04x} ({len(data)} bytes) "
+                             "runs past the end of memory")
+        out += _SEGMENT.pack(address, len(data))
+        out += data
+    return bytes(out)
+
+
+def unpack(data: bytes) -> [(int, bytes)]:
+    """
+    Parse a sparse image.
+
+    Parameters:
+    data: the raw image
+
+    Return:
+    A list of (address, data) pairs.  Raises ImageFormatError if data is
+    malformed.
+    """
+    if len(data) < _HEADER.size:
+        raise ac_exc.ImageFormatError("truncated header")
+    magic, count = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ac_exc.ImageFormatError("bad magic number")
+    segments = []
+    pos = _HEADER.size
+    for _ in range(count):
+        if pos + _SEGMENT.size > len(data):
+            raise ac_exc.ImageFormatError("truncated segment header")
+        address, length = _SEGMENT.unpack_from(data, pos)
+        pos += _SEGMENT.size
+        segment = data[pos:pos + length]
+        if len(segment) != length:
+            raise ac_exc.ImageFormatError("truncated segment")
+        if address + length > defs.ADDRESS_SIZE:
+            raise ac_exc.ImageFormatError(f"segment at 0x{address:04x} runs "
+                                          "past the end of memory")
+        segments.append((address, segment))
+        pos += length
+    return segments
@@ -0,0 +1,183 @@
+import argparse
+import logging
+import sys
+
+import src.ac100img as ac_img
+import src.ac100obj as ac_obj
+import src.definitions as defs
+import src.exceptions as ac_exc
+
+logger = logging.getLogger("ac100ld")
+parser = argparse.ArgumentParser()
+
+DEFAULT_OUTPUT: str = "out.bin"
+
+# Linker for AC100 relocatable objects
+class AC100LD:
+    objects: [ac_obj.ObjectFile]
+
+    def __init__(self):
+        self.objects = []
+        self.base: int = defs.CODE_START # first object is placed here
+        self.symbols: dict = {}          # symbol name -> absolute address
+        self.bases: [int] = []           # load address of each object
+
+
+    def add_object(self, obj: ac_obj.ObjectFile) -> None:
+        """ Add an object to the link, after any objects already added. """
+        self.objects.append(obj)
+
+
+    def _layout(self) -> [int]:
+        """
+        Assign a load address to each object, in the order they were added.
+
+        Every object starts on a four-byte boundary so that the instructions in
+        it stay aligned.
+
+        Return:
+        The load address of each object.
+        """
+        bases = []
+        address = self.base
+        for obj in self.objects:
+            bases.append(address)
+            address += len(obj.code)
+            address += -address % 4
+        return bases
+
+
+    def resolve_symbols(self, bases: [int]) -> dict:
+        """
+        Build the global symbol table.
+
+        Parameters:
+        bases: the load address of each object
+
+        Return:
+        A mapping from symbol name to absolute address.  Raises
+        DuplicateSymbolError if two objects export the same symbol.
+        """
+        symbols = {}
+        for obj, base in zip(self.objects, bases):
+            for name, offset in obj.symbols.items():
+                if name in symbols:
+                    raise ac_exc.DuplicateSymbolError(name)
+                symbols[name] = base + offset
+        return symbols
+
+
+    def _valid_jump(self, address: int) -> bool:
+        """
+        Check a resolved jump target the way the assembler checks local ones.
+
+        Parameters:
+        address: the absolute address the jump was linked to
+
+        Return:
+        True if the target may be jumped to.  Otherwise log why and return
+        False.
+        """
+        if address < defs.STACK_MIN:
+            logger.error("Programs may not jump into stack space "
+                         f"([0x{defs.STACK_MAX:04x}, "
+                         f"0x{defs.STACK_MIN:04x}])")
+            return False
+        if address % 4 != 0:
+            logger.error(f"Address 0x{address:04x} not 4-byte aligned")
+            return False
+        return True
+
+
+    def link(self) -> bytes:
+        """
+        Link all added objects into a flat binary.
+
+        Return:
+        On success, return a binary suitable for AC100.load_ram(), which
+        loads at CODE_START; it is a sparse image if it would otherwise start
+        with the image magic number.  On failure, return None.
+        """
+        bases = self.bases = self._layout()
+        try:
+            self.symbols = self.resolve_symbols(bases)
+        except ac_exc.DuplicateSymbolError as e:
+            logger.error(e)
+            return None
+
+        image = bytearray()
+        for obj, base in zip(self.objects, bases):
+            image += b"\x00" * (base - self.base - len(image)) # alignment
+            code = bytearray(obj.code)
+            for reloc in obj.relocations:
+                if reloc.symbol == "":
+                    address = base + reloc.addend
+                elif reloc.symbol in self.symbols:
+                    address = self.symbols[reloc.symbol] + reloc.addend
+                else:
+                    logger.error(ac_exc.UndefinedSymbolError(reloc.symbol))
+                    return None
+                if reloc.offset + 2 > len(code):
+                    logger.error(f"Relocation at 0x{reloc.offset:04x} is "
+                                 "outside the object's code")
+                    return None
+                if reloc.kind == ac_obj.RELOC_JUMP \
+                        and not self._valid_jump(address):
+                    return None
+                code[reloc.offset] = (address >> 8) & 0xff
+                code[reloc.offset + 1] = address & 0xff
+            image += code
+
+        if self.base + len(image) > defs.VRAM_START:
+            logger.error(f"Linked program ({len(image)} bytes) overlaps VRAM "
+                         f"at 0x{defs.VRAM_START:04x}")
+            return None
+        return ac_img.from_flat(bytes(image))
+
+
+def setup_parser(parser) -> None:
+    """ Set up ArgumentParser """
+    parser.add_argument("objects", nargs="+", metavar="object",
+                        help="objects to link, in load order")
+    parser.add_argument("-l", "--loglevel", default="error",
+                        choices=["debug", "info", "warning", "error"],
+                        metavar="level", help="logging level")
+    parser.add_argument("-o", "--outfile", default=DEFAULT_OUTPUT,
+                        metavar="file",
+                        help="name to use for output file (default: %(default)s)")
+
+
+def setup_logger(level) -> None:
+    """
+    Set up logger
+
+    Parameters:
+    level: the level to use
+    """
+    format = "[%(levelname)s] %(name)s:%(funcName)s():%(lineno)d: %(message)s"
+    logging.basicConfig(format=format, level=logging.getLevelName(level))
+
+
+def main():
+    linker = AC100LD()
+    setup_parser(parser)
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+    args = parser.parse_args()
+    setup_logger(args.loglevel.upper())
+    for path in args.objects:
+        try:
+            linker.add_object(ac_obj.ObjectFile.read(path))
+        except ac_exc.ObjectFormatError as e:
+            logger.error(f"{path}: {e}")
+            sys.exit(1)
+    binary = linker.link()
+    if binary is None:
+        sys.exit(1)
+    with open(args.outfile, "wb") as f:
+        f.write(binary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+# Listings and source maps for assembled AC100 programs
+#
+# Both are built after assembly from the assembler's line map (source line ->
+# first address) and its output, so producing them costs nothing while
+# assembling and works just as well for output that came from the cache.
+#
+# Source map format; all multi-byte fields are big-endian:
+#
+#   magic            4 bytes   b"AC1M"
+#   version          1 byte
+#   file count       2 bytes
+#   entry count      4 bytes
+#   label count      2 bytes
+#   files            <file count> x (name length: 2 bytes, UTF-8 name)
+#   entries          <entry count> x (address: 2 bytes, length: 2 bytes,
+#                    file index: 2 bytes, line: 4 bytes), sorted by address
+#   labels           <label count> x (file index: 2 bytes, name length: 1 byte,
+#                    name, address: 2 bytes)
+#
+# Labels are kept per file, since separately assembled files may each define
+# a local label with the same name.
+
+import bisect
+import struct
+import typing
+
+import src.ac100img as ac_img
+import src.definitions as defs
+import src.exceptions as ac_exc
+
+MAGIC: bytes = b"AC1M"
+VERSION: int = 2
+LISTING_BYTES_PER_ROW: int = 4
+
+_HEADER = struct.Struct(">4sBHIH")
+_ENTRY = struct.Struct(">HHHI")
+_SHORT = struct.Struct(">H")
+
+
+class MapEntry(typing.NamedTuple):
+    address: int
+    length: int                 # bytes produced by the line
+    file: int                   # index into SourceMap.files
+    line: int                   # 1-based source line number
+
+
+def memory_segments(output: bytes) -> [(int, bytes)]:
+    """
+    Split assembler output into the pieces that get loaded into memory.
+
+    Parameters:
+    output: a flat binary, which loads at CODE_START, or a sparse image
+
+    Return:
+    A list of (address, data) pairs in address order.
+    """
+    if ac_img.is_image(output):
+        return sorted(ac_img.unpack(output))
+    return [(defs.CODE_START, output)]
+
+
+def line_ranges(line_map: dict, segments: [(int, bytes)]) -> [(int, int, int)]:
+    """
+    Work out which bytes each source line produced.
+
+    A line's bytes run from its address up to the next line's address, or to
+    the end of its segment, so a macro invocation or repeat block covers
+    everything it expanded to.
+
+    Parameters:
+    - line_map: source line number -> first address, from the assembler
+    - segments: the output, as returned by memory_segments()
+
+    Return:
+    A list of (address, end, line) triples, sorted by address.
+    """
+    starts = sorted((address, line) for line, address in line_map.items())
+    segment_starts = [address for address, _ in segments]
+    ranges = []
+    for i, (address, line) in enumerate(starts):
+        index = bisect.bisect_right(segment_starts, address) - 1
+        if index < 0:
+            continue
+        seg_address, data = segments[index]
+        end = seg_address + len(data)
+        if i + 1 < len(starts):
+            end = min(end, starts[i + 1][0])
+        if address < end:
+            ranges.append((address, end, line))
+    return ranges
+
+
+def make_listing(source_lines: [str], line_map: dict,
+                 segments: [(int, bytes)], shift: int = 0) -> [str]:
+    """
+    Build an assembler listing.
+
+    Parameters:
+    - source_lines: the source, one line per element
+    - line_map: source line number -> first address, from the assembler
+    - segments: the output, as returned by memory_segments()
+    - shift: added to every address shown, e.g. where the linker put the code
+
+    Return:
+    The listing's lines: address, bytes, line number, and source text, with
+    further rows for lines that produced more than LISTING_BYTES_PER_ROW bytes.
+    """
+    memory = {}
+    for address, data in segments:
+        memory[address] = data
+    by_line = {line: (address, end)
+               for address, end, line in line_ranges(line_map, segments)}
+    segment_starts = sorted(memory)
+    width = 3 * LISTING_BYTES_PER_ROW - 1
+
+    listing = []
+    for lineno, text in enumerate(source_lines, start=1):
+        text = text.rstrip("\r\n")
+        if lineno not in by_line:
+            listing.append(f"{'':4}  {'':{width}}  {lineno:5d}  {text}")
+            continue
+        address, end = by_line[lineno]
+        seg_address = segment_starts[
+            bisect.bisect_right(segment_starts, address) - 1]
+        data = memory[seg_address][address - seg_address:end - seg_address]
+        for row in range(0, len(data), LISTING_BYTES_PER_ROW):
+            chunk = data[row:row + LISTING_BYTES_PER_ROW].hex(" ")
+            prefix = f"{address + shift + row:04x}  {chunk:{width}}"
+            if row == 0:
+                listing.append(f"{prefix}  {lineno:5d}  {text}")
+            else:
+                listing.append(prefix.rstrip())
+    return listing
+
+
+# Maps addresses in a loaded program back to source lines
+class SourceMap:
+    def __init__(self):
+        self.files: [str] = []
+        self.entries: [MapEntry] = []  # sorted by address
+        self.labels: dict = {}         # (file index, label) -> address
+
+
+    def add_file(self, path: str, line_map: dict, labels: dict,
+                 segments: [(int, bytes)], shift: int = 0) -> None:
+        """
+        Add the lines and labels of one assembled source file.
+
+        Parameters:
+        - path: the source file's name, as it should be reported
+        - line_map: source line number -> first address, from the assembler
+        - labels: label -> address, from the assembler
+        - segments: the output, as returned by memory_segments()
+        - shift: added to every address, e.g. where the linker put the code
+        """
+        index = len(self.files)
+        self.files.append(path)
+        for address, end, line in line_ranges(line_map, segments):
+            self.entries.append(MapEntry(address + shift, end - address,
+                                         index, line))
+        self.entries.sort()
+        for name, address in labels.items():
+            self.labels[(index, name)] = address + shift
+
+
+    def lookup(self, address: int) -> (str, int):
+        """
+        Find the source line that produced the byte at an address.
+
+        Parameters:
+        address: e.g. a program counter value
+
+        Return:
+        A 2-tuple (file, line), or None if no source line produced that byte.
+        """
+        i = bisect.bisect_right(self.entries, address,
+                                key=lambda entry: entry.address) - 1
+        if i < 0:
+            return None
+        entry = self.entries[i]
+        if address >= entry.address + entry.length:
+            return None
+        return (self.files[entry.file], entry.line)
+
+
+    def to_bytes(self) -> bytes:
+        """ Serialize the map into the on-disk format. """
+        out = bytearray(_HEADER.pack(MAGIC, VERSION, len(self.files),
+                                     len(self.entries), len(self.labels)))
+        for path in self.files:
+            encoded = path.encode("utf-8")
+            out += _SHORT.pack(len(encoded))
+            out += encoded
+        for entry in self.entries:
+            out += _ENTRY.pack(*entry)
+        for (index, name), address in self.labels.items():
+            encoded = name.encode("ascii")
+            out += _SHORT.pack(index)
+            out += bytes([len(encoded)]) + encoded
+            out += _SHORT.pack(address)
+        return bytes(out)
+
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "SourceMap":
+        """
+        Parse a map from its on-disk format.
+
+        Parameters:
+        data: the raw map file contents
+
+        Return:
+        The parsed map.  Raises SourceMapFormatError if data is malformed.
+        """
+        if len(data) < _HEADER.size:
+            raise ac_exc.SourceMapFormatError("truncated header")
+        magic, version, n_files, n_entries, n_labels = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ac_exc.SourceMapFormatError("bad magic number")
+        if version != VERSION:
+            raise ac_exc.SourceMapFormatError(f"unsupported version {version}")
+
+        source_map = cls()
+        pos = _HEADER.size
+        try:
+            for _ in range(n_files):
+                (length,) = _SHORT.unpack_from(data, pos)
+                pos += _SHORT.size
+                name = data[pos:pos + length]
+                if len(name) != length:
+                    raise struct.error("truncated file name")
+                source_map.files.append(name.decode("utf-8"))
+                pos += length
+            for _ in range(n_entries):
+                source_map.entries.append(
+                    MapEntry(*_ENTRY.unpack_from(data, pos)))
+                pos += _ENTRY.size
+            for _ in range(n_labels):
+                (index,) = _SHORT.unpack_from(data, pos)
+                pos += _SHORT.size
+                length = data[pos]
+                name = data[pos + 1:pos + 1 + length]
+                if len(name) != length:
+                    raise struct.error("truncated label")
+                pos += 1 + length
+                (address,) = _SHORT.unpack_from(data, pos)
+                pos += _SHORT.size
+                source_map.labels[(index, name.decode("ascii"))] = address
+        except (struct.error, IndexError, UnicodeError):
+            raise ac_exc.SourceMapFormatError("truncated or corrupt tables")
+        if any(entry.file >= n_files for entry in source_map.entries):
+            raise ac_exc.SourceMapFormatError("entry refers to a missing file")
+        if any(index >= n_files for index, _ in source_map.labels):
+            raise ac_exc.SourceMapFormatError("label refers to a missing file")
+        return source_map
+
+
+    def write(self, path) -> None:
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+
+    @classmethod
+    def read(cls, path) -> "SourceMap":
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
@@ -0,0 +1,147 @@
+# Relocatable object file format for the AC100
+#
+# All multi-byte fields are big-endian, like the AC100 itself.
+#
+#   magic            4 bytes   b"AC1O"
+#   version          1 byte
+#   code length      2 bytes
+#   symbol count     2 bytes
+#   relocation count 2 bytes
+#   code             <code length> bytes
+#   symbols          <symbol count> x (name length: 1 byte, name, offset: 2 bytes)
+#   relocations      <relocation count> x (offset: 2 bytes, kind: 1 byte,
+#                    name length: 1 byte, name, addend: 2 bytes)
+#
+# Symbol offsets and relocation addends are relative to the start of the
+# object's code.  A relocation with an empty symbol name is relative to the
+# object itself; otherwise it refers to a symbol exported by some object.
+# A relocation's kind says whether it patches the target of a jump, which the
+# linker checks once it's resolved, or any other address.
+
+import struct
+import typing
+
+import src.exceptions as ac_exc
+
+MAGIC: bytes = b"AC1O"
+VERSION: int = 2
+
+# kinds of relocation
+RELOC_DATA: int = 0             # an address used as data or a memory operand
+RELOC_JUMP: int = 1             # the target of a jump or JSR
+_KINDS = (RELOC_DATA, RELOC_JUMP)
+
+_HEADER = struct.Struct(">4sBHHH")
+_WORD = struct.Struct(">H")
+
+
+class Relocation(typing.NamedTuple):
+    offset: int                 # offset of the 2-byte address field in code
+    symbol: str                 # "" for object-relative relocations
+    addend: int                 # added to the symbol (or object) address
+    kind: int = RELOC_DATA      # RELOC_DATA or RELOC_JUMP
+
+
+class ObjectFile:
+    code: bytes
+    symbols: dict
+    relocations: [Relocation]
+
+    def __init__(self, code: bytes = b"", symbols: dict = None,
+                 relocations: [Relocation] = None):
+        self.code = bytes(code)
+        self.symbols = dict(symbols) if symbols is not None else {}
+        self.relocations = list(relocations) if relocations is not None else []
+
+
+    def to_bytes(self) -> bytes:
+        """ Serialize the object into the on-disk format. """
+        out = bytearray(_HEADER.pack(MAGIC, VERSION, len(self.code),
+                                     len(self.symbols), len(self.relocations)))
+        out += self.code
+        for name, offset in self.symbols.items():
+            out += _pack_name(name)
+            out += _WORD.pack(offset)
+        for reloc in self.relocations:
+            out += _WORD.pack(reloc.offset)
+            out.append(reloc.kind)
+            out += _pack_name(reloc.symbol)
+            out += _WORD.pack(reloc.addend)
+        return bytes(out)
+
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ObjectFile":
+        """
+        Parse an object from its on-disk format.
+
+        Parameters:
+        data: the raw object file contents
+
+        Return:
+        The parsed object.  Raises ObjectFormatError if data is malformed.
+        """
+        if len(data) < _HEADER.size:
+            raise ac_exc.ObjectFormatError("truncated header")
+        magic, version, code_len, n_syms, n_relocs = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ac_exc.ObjectFormatError("bad magic number")
+        if version != VERSION:
+            raise ac_exc.ObjectFormatError(f"unsupported version {version}")
+
+        pos = _HEADER.size
+        code = data[pos:pos + code_len]
+        if len(code) != code_len:
+            raise ac_exc.ObjectFormatError("truncated code section")
+        pos += code_len
+
+        try:
+            symbols = {}
+            for _ in range(n_syms):
+                name, pos = _unpack_name(data, pos)
+                (offset,) = _WORD.unpack_from(data, pos)
+                pos += _WORD.size
+                symbols[name] = offset
+
+            relocations = []
+            for _ in range(n_relocs):
+                (offset,) = _WORD.unpack_from(data, pos)
+                kind = data[pos + _WORD.size]
+                pos += _WORD.size + 1
+                name, pos = _unpack_name(data, pos)
+                (addend,) = _WORD.unpack_from(data, pos)
+                pos += _WORD.size
+                if kind not in _KINDS:
+                    raise ac_exc.ObjectFormatError(
+                        f"unknown relocation kind {kind}")
+                relocations.append(Relocation(offset, name, addend, kind))
+        except (struct.error, IndexError):
+            raise ac_exc.ObjectFormatError("truncated symbol or relocation table")
+
+        return cls(code, symbols, relocations)
+
+
+    def write(self, path) -> None:
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+
+    @classmethod
+    def read(cls, path) -> "ObjectFile":
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+def _pack_name(name: str) -> bytes:
+    encoded = name.encode("ascii")
+    if len(encoded) > 0xff:
+        raise ValueError(f"Symbol name '{name}' longer than 255 characters")
+    return bytes([len(encoded)]) + encoded
+
+
+def _unpack_name(data: bytes, pos: int) -> (str, int):
+    length = data[pos]
+    name = data[pos + 1:pos + 1 + length]
+    if len(name) != length:
+        raise struct.error("truncated name")
+    return name.decode("ascii"), pos + 1 + length
@@ -0,0 +1,296 @@
+# Peephole optimizer for assembled AC100 bytecode
+
+import logging
+
+import src.ac100obj as ac_obj
+import src.definitions as defs
+
+logger = logging.getLogger("ac100asm")
+
+OP_LDR: int = 0x01
+OP_JMP: int = 0x38
+OP_ADDI: int = 0x40
+OP_INC: int = 0x42
+OP_RTS: int = 0xE2
+OP_RTI: int = 0xE3
+OP_HALT: int = 0xFE
+OP_NOP: int = 0xFF
+
+JUMP_OPCODES = range(0x30, 0x3A) # JZ--JSR
+# control never falls through to the next instruction after these
+TERMINATORS = {OP_JMP, OP_RTS, OP_RTI, OP_HALT}
+
+# same bit values as the emulator's PS register
+FLAG_CARRY: int = 0x1
+FLAG_ZERO: int = 0x2
+FLAG_OVERFLOW: int = 0x4
+FLAG_NEGATIVE: int = 0x8
+ALL_FLAGS: int = FLAG_CARRY | FLAG_ZERO | FLAG_OVERFLOW | FLAG_NEGATIVE
+
+# flags each opcode overwrites; opcodes missing here are assumed to do
+# anything, so flag liveness analysis stops at them
+FLAGS_WRITTEN = {
+    0x00: FLAG_ZERO | FLAG_NEGATIVE,  # LDI
+    0x01: FLAG_ZERO | FLAG_NEGATIVE,  # LDR
+    0x02: FLAG_ZERO | FLAG_NEGATIVE,  # LDM
+    0x03: FLAG_ZERO,                  # LDBM
+    0x04: FLAG_ZERO | FLAG_NEGATIVE,  # LDMX
+    0x05: FLAG_ZERO | FLAG_NEGATIVE,  # LDMP
+    0x06: FLAG_ZERO, 0x07: FLAG_ZERO, # LDBMX, LDBMP
+    0x10: 0, 0x11: 0, 0x12: 0,        # ST, STH, STL
+    0x13: 0, 0x14: 0,                 # MEMCPY, MEMSET
+    0x15: 0, 0x16: 0,                 # STX, STP
+    0x17: 0, 0x18: 0,                 # STLX, STLP
+    0x20: FLAG_CARRY | FLAG_ZERO | FLAG_NEGATIVE, # CMR
+    0x21: FLAG_CARRY | FLAG_ZERO | FLAG_NEGATIVE, # CMI
+    0x40: ALL_FLAGS, 0x41: ALL_FLAGS, # ADDI, ADDR
+    0x42: FLAG_ZERO | FLAG_NEGATIVE,  # INC
+    0x43: ALL_FLAGS, 0x44: ALL_FLAGS, # SUBI, SUBR
+    0x45: FLAG_ZERO | FLAG_NEGATIVE,  # DEC
+    0x46: ALL_FLAGS, 0x47: ALL_FLAGS, 0x48: ALL_FLAGS, # MUL, DIVU, MOD
+    0x49: ALL_FLAGS, 0x4A: ALL_FLAGS, 0x4B: ALL_FLAGS, # LSL, LSR, ASR
+    **{opcode: ALL_FLAGS for opcode in range(0x50, 0x59)}, # ANDR--TSTI
+    0xE0: 0, 0xE1: 0,                 # PUSH, POP
+    OP_HALT: 0, OP_NOP: 0
+}
+
+# flag each conditional jump reads
+FLAGS_READ = {
+    0x30: FLAG_ZERO, 0x31: FLAG_ZERO,         # JZ, JNZ
+    0x32: FLAG_CARRY, 0x33: FLAG_CARRY,       # JC, JNC
+    0x34: FLAG_NEGATIVE, 0x35: FLAG_NEGATIVE, # JN, JP
+    0x36: FLAG_OVERFLOW, 0x37: FLAG_OVERFLOW  # JV, JNV
+}
+
+
+class _Instruction:
+    def __init__(self, address: int, code: bytes):
+        self.address = address  # address before optimization
+        self.code = bytearray(code)
+        self.deleted = False
+        self.relocation: ac_obj.Relocation = None # for bytes 2, 3
+
+
+    @property
+    def opcode(self) -> int:
+        return self.code[0]
+
+
+    @property
+    def operand(self) -> int:
+        return self.code[2] << 8 | self.code[3]
+
+
+    @operand.setter
+    def operand(self, value: int) -> None:
+        self.code[2] = (value >> 8) & 0xff
+        self.code[3] = value & 0xff
+
+
+    @property
+    def external(self) -> bool:
+        """ Whether the operand is a symbol only the linker can resolve """
+        return self.relocation is not None and self.relocation.symbol != ""
+
+
+# Peephole optimizer for the AC100
+class PeepholeOptimizer:
+    """
+    Shrink assembled code without changing what it does.
+
+    The optimizer runs these rewrites until none of them applies:
+    - jumps to an unconditional JMP are redirected to that JMP's target
+    - ADDI Rn 0 and LDR Rn Rn are deleted, and ADDI Rn 1 becomes INC Rn, as
+      long as no later instruction reads the flags they would have set
+    - NOPs that are not jump targets are deleted
+    - code following JMP, RTS, or HALT is deleted up to the next jump target
+
+    Labels, jump operands, and relocations are then moved to the new
+    addresses.  Every label is treated as a jump target, since it may be
+    reached through another object or used as a data address.
+    """
+    def __init__(self, bytecode: bytes, labels: dict,
+                 relocations: [ac_obj.Relocation] = (),
+                 base: int = defs.CODE_START):
+        self.base = base
+        self.end = base + len(bytecode)
+        self.instructions = [_Instruction(base + i, bytecode[i:i + 4])
+                             for i in range(0, len(bytecode), 4)]
+        self.labels = dict(labels)
+        self.relocations = list(relocations)
+        for reloc in self.relocations:
+            self.instructions[reloc.offset // 4].relocation = reloc
+        self.by_address = {inst.address: inst for inst in self.instructions}
+        # old -> new address of each instruction kept; filled by optimize()
+        self.address_map: dict = {}
+
+
+    def _live(self) -> [_Instruction]:
+        return [inst for inst in self.instructions if not inst.deleted]
+
+
+    def _static_target(self, inst: _Instruction) -> int:
+        """ Return the in-program address a jump goes to, or None """
+        if inst.opcode not in JUMP_OPCODES or inst.external:
+            return None
+        if self.base <= inst.operand < self.end:
+            return inst.operand
+        return None
+
+
+    def _targets(self) -> set:
+        """ Addresses that control may reach other than by falling through """
+        targets = {self.base}
+        targets.update(self.labels.values())
+        for inst in self._live():
+            target = self._static_target(inst)
+            if target is not None:
+                targets.add(target)
+        return targets
+
+
+    def _flags_dead(self, live: [_Instruction], index: int, flags: int) -> bool:
+        """
+        Check that flags set by live[index] are overwritten before being read.
+
+        Only straight-line code is followed; any jump or RTS that could lead
+        to a reader of the flags counts as a read.
+        """
+        for inst in live[index + 1:]:
+            opcode = inst.opcode
+            if opcode in FLAGS_READ and FLAGS_READ[opcode] & flags:
+                return False
+            if opcode == OP_HALT:
+                return True
+            if opcode in JUMP_OPCODES or opcode not in FLAGS_WRITTEN:
+                return False
+            flags &= ~FLAGS_WRITTEN[opcode]
+            if flags == 0:
+                return True
+        return False            # fell off the end of the program
+
+
+    def _thread_jumps(self) -> bool:
+        changed = False
+        for inst in self._live():
+            target = self._static_target(inst)
+            seen = {inst.address}
+            while target is not None and target not in seen:
+                seen.add(target)
+                next_inst = self.by_address.get(target)
+                if next_inst is None or next_inst.deleted \
+                   or next_inst.opcode != OP_JMP:
+                    break
+                next_target = self._static_target(next_inst)
+                if next_target is None:
+                    break
+                logger.debug(f"Threading jump at 0x{inst.address:04x} "
+                             f"through 0x{target:04x} to 0x{next_target:04x}")
+                inst.operand = next_target
+                target = next_target
+                changed = True
+        return changed
+
+
+    def _fold(self) -> bool:
+        changed = False
+        live = self._live()
+        for i, inst in enumerate(live):
+            code = inst.code
+            if code[0] == OP_ADDI and inst.relocation is None \
+               and inst.operand == 0:
+                if self._flags_dead(live, i, ALL_FLAGS):
+                    inst.deleted = changed = True
+            elif code[0] == OP_LDR and code[1] == code[2]:
+                if self._flags_dead(live, i, FLAG_ZERO | FLAG_NEGATIVE):
+                    inst.deleted = changed = True
+            elif code[0] == OP_ADDI and inst.relocation is None \
+                 and inst.operand == 1:
+                # INC sets Z and N the same way, but leaves C and V alone
+                if self._flags_dead(live, i, FLAG_CARRY | FLAG_OVERFLOW):
+                    inst.code[:] = bytes([OP_INC, code[1], 0x00, 0x00])
+                    changed = True
+        return changed
+
+
+    def _remove_nops(self, targets: set) -> bool:
+        changed = False
+        for inst in self._live():
+            if inst.opcode == OP_NOP and inst.address not in targets:
+                inst.deleted = changed = True
+        return changed
+
+
+    def _remove_unreachable(self, targets: set) -> bool:
+        changed = False
+        reachable = True
+        for inst in self._live():
+            if inst.address in targets:
+                reachable = True
+            if not reachable:
+                inst.deleted = changed = True
+            elif inst.opcode in TERMINATORS:
+                reachable = False
+        return changed
+
+
+    def _relocate(self) -> bytes:
+        """ Lay out the remaining code and fix up every address into it """
+        new_address = {}
+        pending = []            # deleted; they map to the next live address
+        address = self.base
+        for inst in self.instructions:
+            pending.append(inst.address)
+            if not inst.deleted:
+                for old in pending:
+                    new_address[old] = address
+                pending = []
+                address += 4
+        pending.append(self.end)
+        for old in pending:
+            new_address[old] = address
+
+        bytecode = bytearray()
+        relocations = []
+        for inst in self._live():
+            if inst.relocation is not None and not inst.external:
+                inst.operand = new_address.get(inst.operand, inst.operand)
+            elif self._static_target(inst) is not None:
+                inst.operand = new_address.get(inst.operand, inst.operand)
+            if inst.relocation is not None:
+                offset = len(bytecode) + 2
+                addend = inst.relocation.addend
+                if not inst.external:
+                    addend = inst.operand - self.base
+                relocations.append(inst.relocation._replace(
+                    offset=offset, addend=addend))
+            bytecode += inst.code
+
+        self.address_map = {inst.address: new_address[inst.address]
+                            for inst in self._live()}
+        self.labels = {name: new_address.get(offset, offset)
+                       for name, offset in self.labels.items()}
+        self.relocations = relocations
+        return bytes(bytecode)
+
+
+    def optimize(self) -> bytes:
+        """
+        Optimize the bytecode.
+
+        Return:
+        The optimized bytecode.  labels and relocations are updated to match.
+        """
+        changed = True
+        while changed:
+            changed = self._thread_jumps()
+            changed |= self._fold()
+            targets = self._targets()
+            changed |= self._remove_nops(targets)
+            changed |= self._remove_unreachable(targets)
+
+        before = len(self.instructions)
+        bytecode = self._relocate()
+        logger.info(f"Peephole optimizer removed {before - len(bytecode) // 4} "
+                    f"of {before} instructions")
+        return bytecode
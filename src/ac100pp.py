@@ -0,0 +1,234 @@
+# Macro preprocessor for AC100 assembly
+#
+#   .macro NAME [param...]      define a macro; in its body, \param is
+#   ...                         replaced by the matching argument
+#   .endm
+#
+#   NAME [arg...]               expand a macro
+#
+#   .rept COUNT                 repeat the body COUNT times
+#   ...
+#   .endr
+#
+# In a macro or repeat body, \@ is replaced by a number unique to each
+# expansion (or repetition), so labels like loop\@ don't clash.
+#
+# A macro may not be named after an instruction: it would silently replace
+# that instruction everywhere.
+#
+# Output is produced lazily, one line at a time, so a large repeat count
+# never exists in memory all at once.  Each macro's expansion for a given set
+# of arguments is computed once and reused.
+
+import re
+import typing
+
+import src.definitions as defs
+import src.exceptions as ac_exc
+
+LOCAL_MARKER: str = "\\@"
+MAX_DEPTH: int = 64             # nested macro invocations and repeat blocks
+
+_PARAM = re.compile(r"\\(\w+)")
+_NAME = re.compile(r"^[a-zA-Z]\w*$")
+_DIRECTIVES = (".macro", ".endm", ".rept", ".endr")
+_MNEMONICS = frozenset(name for name, _ in defs.INSTRUCTION_FORMATS.values())
+
+
+class _Line(typing.NamedTuple):
+    text: str
+    has_local: bool             # contains \@
+    plain: bool                 # can be emitted without further processing
+
+
+class Macro:
+    def __init__(self, name: str, params: [str], body: [str]):
+        self.name = name
+        self.params = tuple(params)
+        self.body = tuple(body)
+        self.expansions: dict = {} # args -> [_Line]
+
+
+    def expand(self, args: tuple, classify) -> [_Line]:
+        """
+        Substitute arguments into the body, reusing earlier expansions.
+
+        Parameters:
+        - args: one argument per parameter
+        - classify: turns each substituted line into a _Line
+
+        Return:
+        The body with parameters replaced; \\@ is left for the caller.
+        """
+        lines = self.expansions.get(args)
+        if lines is None:
+            values = dict(zip(self.params, args))
+            def substitute(m):
+                return values.get(m.group(1), m.group(0))
+            lines = [classify(_PARAM.sub(substitute, text))
+                     for text in self.body]
+            self.expansions[args] = lines
+        return lines
+
+
+# Preprocessor for the AC100 assembler
+class Preprocessor:
+    def __init__(self):
+        self.macros: dict = {}
+        self.source_lineno: int = 0 # source line of the last line produced
+        self._counter: int = 0      # for \@
+
+
+    def expand(self, lines: typing.Iterable[str]) -> "Expansion":
+        """
+        Expand macros and repeat blocks.
+
+        Parameters:
+        lines: the source lines
+
+        Return:
+        An iterator over the expanded lines.  Its source_lineno attribute is
+        the source line each produced line came from: the line itself, or the
+        invocation of the macro that produced it.  Raises PreprocessorError
+        while iterating if the source is malformed.
+        """
+        self._counter = 0
+        numbered = iter(enumerate(lines, start=1))
+        return Expansion(self, self._process(numbered, 0, True))
+
+
+    def _classify(self, text: str) -> _Line:
+        head = text.split(None, 1)[0] if text.strip() else ""
+        plain = head not in _DIRECTIVES and head not in self.macros
+        return _Line(text, LOCAL_MARKER in text, plain)
+
+
+    def _collect(self, numbered, start: int, opener: str,
+                 closer: str) -> [(int, str)]:
+        """ Consume the lines of a block up to its closing directive """
+        body = []
+        depth = 1
+        for lineno, text in numbered:
+            head = text.split(None, 1)[0] if text.strip() else ""
+            if head == opener:
+                depth += 1
+            elif head == closer:
+                depth -= 1
+                if depth == 0:
+                    return body
+            body.append((lineno, text))
+        raise ac_exc.PreprocessorError(start, f"{opener} without {closer}")
+
+
+    def _define(self, tokens: [str], numbered, lineno: int) -> None:
+        if len(tokens) < 2 or not _NAME.match(tokens[1]):
+            raise ac_exc.PreprocessorError(lineno, "invalid .macro directive")
+        name = tokens[1]
+        if name in _MNEMONICS:
+            raise ac_exc.PreprocessorError(
+                lineno, f"macro '{name}' has the name of an instruction")
+        params = tokens[2:]
+        for param in params:
+            if not re.match(r"^\w+$", param):
+                raise ac_exc.PreprocessorError(lineno,
+                                               f"invalid parameter '{param}'")
+        body = [text for _, text in
+                self._collect(numbered, lineno, ".macro", ".endm")]
+        if any(text.split(None, 1)[0] == ".macro"
+               for text in body if text.strip()):
+            raise ac_exc.PreprocessorError(lineno,
+                                           "macros may not define macros")
+        existing = self.macros.get(name)
+        if existing is not None:
+            if existing.params == tuple(params) and existing.body == tuple(body):
+                return          # same definition seen on an earlier pass
+            raise ac_exc.PreprocessorError(lineno,
+                                           f"macro '{name}' already defined")
+        self.macros[name] = Macro(name, params, body)
+        # cached expansions were classified without knowing about this macro
+        for macro in self.macros.values():
+            macro.expansions.clear()
+
+
+    def _repeat_count(self, tokens: [str], lineno: int) -> int:
+        try:
+            if len(tokens) != 2:
+                raise ValueError
+            count = int(tokens[1], 0)
+            if count < 0:
+                raise ValueError
+        except ValueError:
+            raise ac_exc.PreprocessorError(lineno, "invalid .rept count")
+        return count
+
+
+    def _emit(self, lines: [_Line], linenos: [int], depth: int, track: bool):
+        """ Produce one expansion of a macro or repeat body """
+        self._counter += 1
+        local = str(self._counter)
+        texts = (line.text.replace(LOCAL_MARKER, local) if line.has_local
+                 else line.text for line in lines)
+        if all(line.plain for line in lines):
+            if not track:
+                yield from texts
+                return
+            for lineno, text in zip(linenos, texts):
+                self.source_lineno = lineno
+                yield text
+        else:                   # directives may span several lines
+            yield from self._process(zip(linenos, texts), depth, track)
+
+
+    def _process(self, numbered, depth: int, track: bool):
+        if depth > MAX_DEPTH:
+            raise ac_exc.PreprocessorError(self.source_lineno,
+                                           "macros nested too deeply")
+        for lineno, text in numbered:
+            if track:
+                self.source_lineno = lineno
+            tokens = text.split()
+            head = tokens[0] if tokens else ""
+            if head == ".macro":
+                self._define(tokens, numbered, lineno)
+            elif head == ".rept":
+                count = self._repeat_count(tokens, lineno)
+                block = self._collect(numbered, lineno, ".rept", ".endr")
+                lines = [self._classify(body_text) for _, body_text in block]
+                linenos = [body_lineno for body_lineno, _ in block]
+                for _ in range(count):
+                    yield from self._emit(lines, linenos, depth + 1, track)
+            elif head in (".endm", ".endr"):
+                raise ac_exc.PreprocessorError(lineno, f"unmatched {head}")
+            elif head in self.macros:
+                macro = self.macros[head]
+                args = tuple(tokens[1:])
+                if len(args) != len(macro.params):
+                    raise ac_exc.PreprocessorError(
+                        lineno, f"macro '{head}' takes {len(macro.params)} "
+                        f"argument(s), got {len(args)}")
+                lines = macro.expand(args, self._classify)
+                # lines from a macro map back to the line that invoked it
+                yield from self._emit(lines, [lineno] * len(lines), depth + 1,
+                                      False)
+            else:
+                yield text
+
+
+class Expansion:
+    """ Iterator over preprocessed lines that knows where each came from """
+    def __init__(self, preprocessor: Preprocessor, lines):
+        self._preprocessor = preprocessor
+        self._lines = lines
+
+
+    def __iter__(self):
+        return self
+
+
+    def __next__(self) -> str:
+        return next(self._lines)
+
+
+    @property
+    def source_lineno(self) -> int:
+        return self._preprocessor.source_lineno
@@ -0,0 +1,174 @@
+# Load-time verifier for AC100 binaries
+#
+#   python -m src.ac100verify prog.bin
+#
+# Walks every instruction reachable from the entry point once, following
+# fallthrough and static jump targets, and checks what the interpreter would
+# otherwise check each time the instruction runs: that the opcode exists,
+# that register fields name a register, that jump targets are inside the code
+# area and 4-byte aligned, and that direct stores stay out of the stack.
+# Bytes that no path reaches, like data, aren't checked.
+#
+# Instructions that pass are reported as verified; the emulator skips its
+# runtime jump checks for them until something stores over them.
+
+import argparse
+import logging
+import sys
+import typing
+
+import src.ac100map as ac_map
+import src.definitions as defs
+import src.exceptions as ac_exc
+
+logger = logging.getLogger("ac100verify")
+parser = argparse.ArgumentParser()
+
+# control never reaches the next instruction after these
+_NO_FALLTHROUGH = {"JMP", "RTS", "RTI", "HALT"}
+_STORES = {"ST", "STH", "STL"}
+
+
+class Diagnostic(typing.NamedTuple):
+    address: int
+    severity: str               # "error" or "warning"
+    message: str
+
+    def __str__(self) -> str:
+        return f"0x{self.address:04x}: {self.severity}: {self.message}"
+
+
+class Verification(typing.NamedTuple):
+    diagnostics: [Diagnostic]   # in address order
+    verified: [int]             # addresses of instructions that passed
+
+    @property
+    def ok(self) -> bool:
+        return not any(d.severity == "error" for d in self.diagnostics)
+
+
+def check_instruction(code: bytes, address: int) -> [Diagnostic]:
+    """
+    Check one instruction on its own.
+
+    Parameters:
+    - code: the instruction's 4 bytes
+    - address: where it is in memory
+
+    Return:
+    A list of problems; an empty list if there are none.
+    """
+    opcode, reg, hi, lo = code
+    operand = hi << 8 | lo
+    if opcode not in defs.INSTRUCTION_FORMATS:
+        return [Diagnostic(address, "error", f"unknown opcode 0x{opcode:02x}")]
+    mnemonic, form = defs.INSTRUCTION_FORMATS[opcode]
+    problems = []
+    def error(message):
+        problems.append(Diagnostic(address, "error", f"{mnemonic}: {message}"))
+
+    if form.startswith("r") and reg >= defs.NUM_REGISTERS:
+        error(f"no register with index {reg}")
+    if form in ("r r", "r r r", "r idx", "r inc") and hi >= defs.NUM_REGISTERS:
+        error(f"no register with index {hi}")
+    if form == "r r r" and lo >= defs.NUM_REGISTERS:
+        error(f"no register with index {lo}")
+    if form == "r mem" and mnemonic in _STORES and 0x10 <= operand < defs.STACK_MIN:
+        error(f"store to 0x{operand:04x} in the stack")
+    if form == "addr":
+        if operand < defs.STACK_MIN:
+            error(f"jump to 0x{operand:04x} in the stack")
+        elif operand >= defs.VRAM_START:
+            error(f"jump to 0x{operand:04x} in VRAM")
+        elif operand % 4 != 0:
+            error(f"jump to 0x{operand:04x}, which is not 4-byte aligned")
+    return problems
+
+
+def verify(program: bytes, entry: int = defs.CODE_START) -> Verification:
+    """
+    Verify the reachable code of a program.
+
+    Parameters:
+    - program: a flat binary, which loads at CODE_START, or a sparse image.
+      Raises ImageFormatError if a sparse image is malformed.
+    - entry: where execution starts
+
+    Return:
+    A Verification.  Paths aren't followed past an instruction with errors.
+    Running past the end of the program is a warning, since the emulator
+    carries on through whatever memory holds.
+    """
+    memory = bytearray(defs.ADDRESS_SIZE)
+    loaded = []
+    for address, data in ac_map.memory_segments(program):
+        memory[address:address + len(data)] = data
+        loaded.append((address, address + len(data)))
+
+    diagnostics = []
+    verified = []
+    visited = set()
+    work = [entry]
+    while work:
+        pc = work.pop()
+        while pc not in visited and pc < defs.VRAM_START:
+            visited.add(pc)
+            if not any(start <= pc and pc + 4 <= end for start, end in loaded):
+                diagnostics.append(Diagnostic(
+                    pc, "warning", "execution can run past the end of the "
+                    "program"))
+                break
+            code = memory[pc:pc + 4]
+            problems = check_instruction(code, pc)
+            if problems:
+                diagnostics.extend(problems)
+                break
+            verified.append(pc)
+            mnemonic, form = defs.INSTRUCTION_FORMATS[code[0]]
+            if form == "addr":
+                work.append(code[2] << 8 | code[3])
+            if mnemonic in _NO_FALLTHROUGH:
+                break
+            pc += 4
+    diagnostics.sort()
+    return Verification(diagnostics, sorted(verified))
+
+
+def setup_parser(parser) -> None:
+    """ Set up ArgumentParser """
+    parser.add_argument("binary", help="AC100 binary to verify")
+    parser.add_argument("-l", "--loglevel", default="warning",
+                        choices=["debug", "info", "warning", "error"],
+                        metavar="level", help="logging level")
+
+
+def setup_logger(level) -> None:
+    """
+    Set up logger
+
+    Parameters:
+    level: the level to use
+    """
+    format = "[%(levelname)s] %(name)s:%(funcName)s():%(lineno)d: %(message)s"
+    logging.basicConfig(format=format, level=logging.getLevelName(level))
+
+
+def main():
+    setup_parser(parser)
+    args = parser.parse_args()
+    setup_logger(args.loglevel.upper())
+    try:
+        with open(args.binary, "rb") as f:
+            result = verify(f.read())
+    except (OSError, ac_exc.ImageFormatError) as e:
+        logger.error(e)
+        sys.exit(2)
+    for diagnostic in result.diagnostics:
+        print(f"{args.binary}:{diagnostic}")
+    print(f"{len(result.verified)} instruction(s) verified")
+    if not result.ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
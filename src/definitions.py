@@ -25,5 +25,48 @@ VIDEO_ROWS: int = 24
 VRAM_START: int = ADDRESS_MAX - \
     (VIDEO_COLUMNS * VIDEO_ROWS)
 
+# pages of memory-mapped devices, just below VRAM
+CONSOLE_START: int = 0xf800
+DISK_START: int = 0xf900
+INTC_START: int = 0xfa00
+TIMER_START: int = 0xfb00
+
+# the instruction set, as opcode -> (assembler mnemonic, operand format), for
+# the tools that decode binaries and the preprocessor; operand formats:
+#   "r imm"   register, 16-bit immediate
+#   "r r"     two registers, in bytes 1 and 2
+#   "r mem"   register, address or register-indirect operand
+#   "r idx"   register, [register+offset]: a register in byte 2 and an
+#             unsigned offset in byte 3
+#   "r inc"   register, [register]+: a register in byte 2
+#   "r r r"   three registers, in bytes 1, 2, and 3
+#   "r"       register
+#   "addr"    jump target
+#   ""        no operands
+INSTRUCTION_FORMATS: dict = {
+    0x00: ("LDI", "r imm"), 0x01: ("LDR", "r r"), 0x02: ("LDM", "r mem"),
+    0x03: ("LDBM", "r mem"), 0x04: ("LDM", "r idx"), 0x05: ("LDM", "r inc"),
+    0x06: ("LDBM", "r idx"), 0x07: ("LDBM", "r inc"),
+    0x10: ("ST", "r mem"), 0x11: ("STH", "r mem"), 0x12: ("STL", "r mem"),
+    0x13: ("MEMCPY", "r r r"), 0x14: ("MEMSET", "r r r"),
+    0x15: ("ST", "r idx"), 0x16: ("ST", "r inc"), 0x17: ("STL", "r idx"),
+    0x18: ("STL", "r inc"),
+    0x20: ("CMR", "r r"), 0x21: ("CMI", "r imm"),
+    0x30: ("JZ", "addr"), 0x31: ("JNZ", "addr"), 0x32: ("JC", "addr"),
+    0x33: ("JNC", "addr"), 0x34: ("JN", "addr"), 0x35: ("JP", "addr"),
+    0x36: ("JV", "addr"), 0x37: ("JNV", "addr"), 0x38: ("JMP", "addr"),
+    0x39: ("JSR", "addr"),
+    0x40: ("ADDI", "r imm"), 0x41: ("ADDR", "r r"), 0x42: ("INC", "r"),
+    0x43: ("SUBI", "r imm"), 0x44: ("SUBR", "r r"), 0x45: ("DEC", "r"),
+    0x46: ("MUL", "r r r"), 0x47: ("DIVU", "r r"), 0x48: ("MOD", "r r"),
+    0x49: ("LSL", "r imm"), 0x4A: ("LSR", "r imm"), 0x4B: ("ASR", "r imm"),
+    0x50: ("ANDR", "r r"), 0x51: ("ANDI", "r imm"), 0x52: ("ORR", "r r"),
+    0x53: ("ORI", "r imm"), 0x54: ("XORR", "r r"), 0x55: ("XORI", "r imm"),
+    0x56: ("NOT", "r"), 0x57: ("TSTR", "r r"), 0x58: ("TSTI", "r imm"),
+    0xE0: ("PUSH", "r"), 0xE1: ("POP", "r"), 0xE2: ("RTS", ""),
+    0xE3: ("RTI", ""), 0xE4: ("WAIT", ""),
+    0xFE: ("HALT", ""), 0xFF: ("NOP", "")
+}
+
 BINARY_PREFIX: str = "0b"
 HEX_PREFIX: str = "0x"
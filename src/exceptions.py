@@ -65,3 +65,75 @@ class PcAlignmentError(Exception):
     def __init__(self, address):
         msg = f"Program counter @ 0x{address:04x} not on four-byte boundary"
         super().__init__(msg)
+
+
+class ObjectFormatError(Exception):
+    """ Exception raised when an object file cannot be parsed """
+    def __init__(self, reason):
+        super().__init__(f"Malformed AC100 object file: {reason}")
+
+
+class UndefinedSymbolError(Exception):
+    """ Exception raised if the linker cannot resolve a symbol """
+    def __init__(self, symbol):
+        self.symbol = symbol
+        super().__init__(f"Undefined symbol '{symbol}'")
+
+
+class DuplicateSymbolError(Exception):
+    """ Exception raised if more than one object exports the same symbol """
+    def __init__(self, symbol):
+        self.symbol = symbol
+        super().__init__(f"Symbol '{symbol}' defined more than once")
+
+
+class PreprocessorError(Exception):
+    """ Exception raised for malformed macro or repeat blocks """
+    def __init__(self, lineno, reason):
+        self.lineno = lineno
+        super().__init__(f"line {lineno}: {reason}")
+
+
+class ImageFormatError(Exception):
+    """ Exception raised when a sparse memory image cannot be parsed """
+    def __init__(self, reason):
+        super().__init__(f"Malformed AC100 memory image: {reason}")
+
+
+class SourceMapFormatError(Exception):
+    """ Exception raised when a source map file cannot be parsed """
+    def __init__(self, reason):
+        super().__init__(f"Malformed AC100 source map: {reason}")
+
+
+class MemoryProtectionError(Exception):
+    """ Exception raised if memory is accessed in a way its page forbids """
+    def __init__(self, address, access):
+        self.address = address
+        msg = f"Memory at 0x{address:04x} is not {access}"
+        super().__init__(msg)
+
+
+class InterruptVectorError(Exception):
+    """ Exception raised if an interrupt's vector isn't executable code """
+    def __init__(self, line, address):
+        self.address = address
+        msg = f"Vector for interrupt line {line} (0x{address:04x}) is not "
+        msg += "a 4-byte aligned address in executable memory"
+        super().__init__(msg)
+
+
+class WaitForeverError(Exception):
+    """ Exception raised if WAIT runs when no interrupt could ever come """
+    def __init__(self, address):
+        self.address = address
+        msg = f"WAIT at 0x{address:04x} would wait forever: no timer is "
+        msg += "running on an enabled line, or interrupts are held off"
+        super().__init__(msg)
+
+
+class DivideByZeroError(Exception):
+    """ Exception raised by DIVU or MOD with a divisor of zero """
+    def __init__(self, address):
+        self.address = address
+        super().__init__(f"Division by zero at 0x{address:04x}")
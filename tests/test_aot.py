@@ -0,0 +1,224 @@
+import io
+import random
+import pytest
+
+import src.ac100 as emu
+import src.ac100aot as aot
+import src.ac100asm as asm
+import src.exceptions as ac_exc
+import src.ac100bench as bench
+import src.ac100dev as dev
+import src.definitions as defs
+
+def run(program: bytes, backend=None, max_instructions: int = None,
+        console: bool = False):
+    """ Run a program; return the outcome and the machine's final state """
+    machine = emu.AC100()
+    machine.load_ram(program)
+    if console:
+        machine.bus.map_device(defs.CONSOLE_START, dev.Console(io.BytesIO()))
+    machine.backend = backend
+    try:
+        outcome = machine.run_headless(max_instructions)
+    except (Exception, SystemExit) as e:
+        outcome = type(e)
+    state = (machine.REGS, bytes(machine.RAM), machine.PS, machine.SP,
+             machine.PC, machine.halted, machine.instruction_count)
+    return outcome, state
+
+
+def assert_same(program: bytes, cache_dir, max_instructions: int = None):
+    expected = run(program, None, max_instructions)
+    backend = aot.load(program, cache_dir)
+    assert run(program, backend, max_instructions) == expected
+    return backend
+
+
+class TestTranslate:
+    @pytest.mark.parametrize("name", list(bench.EMU_PROGRAMS))
+    def test_bench_programs(self, tmp_path, name):
+        program = asm.assemble_source(bench.emu_source(name, 0.05)).bytecode
+        backend = assert_same(program, tmp_path)
+        assert not backend.self_modified
+
+    @pytest.mark.parametrize("seed", range(40))
+    def test_random_programs(self, tmp_path, seed):
+        lines = bench.generate_unit(300, random.Random(seed))
+        program = asm.assemble_source(lines).bytecode
+        assert_same(program, tmp_path, max_instructions=2000)
+
+    @pytest.mark.parametrize("limit", [0, 1, 5, 6, 7, 100])
+    def test_max_instructions(self, tmp_path, limit):
+        program = asm.assemble_source(bench.emu_source("count", 0)).bytecode
+        assert_same(program, tmp_path, max_instructions=limit)
+
+    def test_self_modifying(self, tmp_path):
+        # overwrite the INC below with DEC R2 before it runs
+        source = """
+LDI R1 0x4501
+LDI R2 0
+ST R1 patch
+patch:
+INC R2
+HALT
+"""
+        program = asm.assemble_source(source).bytecode
+        backend = assert_same(program, tmp_path)
+        assert backend.self_modified
+        machine = emu.AC100()
+        machine.load_ram(program)
+        machine.backend = backend
+        machine.run_headless()
+        assert machine.REGS[1] == [0xff, 0xff]
+
+    def test_indirect_store_into_code(self, tmp_path):
+        source = "LDI R1 0x4501\nLDI R3 0x020c\nST R1 [R3]\npatch:\nINC R2\nHALT"
+        program = asm.assemble_source(source).bytecode
+        assert assert_same(program, tmp_path).self_modified
+
+    def test_reused_after_self_modifying(self, tmp_path):
+        # stores into its own code only if flag is nonzero
+        source = ("LDM R1 flag\nCMI R1 0\nJZ done\nST R1 patch\npatch:\nNOP\n"
+                  "done:\nHALT\nflag:\n.word 0")
+        result = asm.assemble_source(source)
+        program, flag = result.bytecode, result.labels["flag"]
+        backend = aot.load(program, tmp_path)
+        machine = emu.AC100()
+        machine.load_ram(program)
+        machine.RAM[flag:flag + 2] = b"\xff\xff"
+        machine.backend = backend
+        assert machine.run_headless() == 0 and backend.self_modified
+        # reloading the program, or running another machine, starts afresh
+        machine.load_ram(program)
+        assert not backend.self_modified
+        machine.PC, machine.halted = defs.CODE_START, False
+        machine.RAM[flag:flag + 2] = b"\xff\xff"
+        assert machine.run_headless() == 0 and backend.self_modified
+        assert run(program, backend) == run(program)
+        assert not backend.self_modified
+
+    @pytest.mark.parametrize("source", [
+        "LDI R1 1\nPOP R1\nHALT",
+        "LDI R1 0x0100\nST R1 [R1]\nHALT",
+        "LDI R1 1\nRTS",
+    ])
+    def test_errors_match(self, tmp_path, source):
+        program = asm.assemble_source(source).bytecode
+        assert_same(program, tmp_path)
+
+    @pytest.mark.parametrize("source", [
+        # fill, then copy overlapping the fill
+        "LDI R1 0x0041\nLDI R2 0x1000\nLDI R3 0x0100\nMEMSET R1 R2 R3\n"
+        "LDI R4 0x1080\nMEMCPY R2 R4 R3\nHALT",
+        "LDI R1 0x0100\nLDI R2 4\nMEMSET R1 R1 R2\nHALT",      # into the stack
+        "LDI R1 0xff00\nLDI R2 0x0200\nMEMSET R1 R1 R2\nHALT", # past the top
+        "LDI R1 0x0100\nLDI R2 0\nMEMCPY R1 R1 R2\nHALT",      # zero length
+        "LDI R1 0x0200\nLDI R2 0x0210\nLDI R3 4\nMEMCPY R1 R2 R3\nHALT\n"
+        "INC R5\nHALT",                                         # into code
+    ])
+    def test_block_ops(self, tmp_path, source):
+        program = asm.assemble_source(source).bytecode
+        assert_same(program, tmp_path)
+
+    @pytest.mark.parametrize("source, r1", [
+        ("LDI R1 0x8000\nLDI R2 3\nMUL R1 R2 R1\nHALT", 0x0001),
+        ("LDI R1 0x1234\nLDI R2 0x0100\nMUL R1 R2 R2\nHALT", 0x3400),
+        ("LDI R1 0x1234\nMUL R1 R1 R1\nHALT", 0x014b),
+    ])
+    def test_mul_aliased(self, tmp_path, source, r1):
+        program = asm.assemble_source(source).bytecode
+        outcome, state = run(program, aot.load(program, tmp_path))
+        assert (outcome, state) == run(program)
+        assert outcome == 0 and state[0][0] == [r1 >> 8, r1 & 0xff]
+
+    @pytest.mark.parametrize("seed", range(20))
+    def test_mul_div_shift(self, tmp_path, seed):
+        rng = random.Random(seed)
+        reg = lambda: f"R{rng.randint(1, 4)}"
+        values = [0, 1, 0x8000, 0xffff, rng.randrange(0x10000)]
+        lines = [f"LDI R{n} 0x{rng.choice(values):04x}" for n in range(1, 5)]
+        for _ in range(12):
+            match rng.choice(["MUL", "DIVU", "MOD", "LSL", "LSR", "ASR"]):
+                case "MUL": lines.append(f"MUL {reg()} {reg()} {reg()}")
+                case "DIVU" | "MOD" as op:
+                    lines.append(f"{op} {reg()} {reg()}")
+                case op:
+                    count = rng.choice([0, 1, 15, 16, 17])
+                    lines.append(f"{op} {reg()} {count}")
+        program = asm.assemble_source("\n".join(lines + ["HALT"])).bytecode
+        assert_same(program, tmp_path)
+
+    @pytest.mark.parametrize("seed", range(10))
+    def test_logic(self, tmp_path, seed):
+        rng = random.Random(seed)
+        reg = lambda: f"R{rng.randint(1, 4)}"
+        lines = [f"LDI R{n} 0x{rng.randrange(0x10000):04x}" for n in range(1, 5)]
+        for _ in range(12):
+            op = rng.choice(["ANDR", "ANDI", "ORR", "ORI", "XORR", "XORI",
+                             "NOT", "TSTR", "TSTI"])
+            if op == "NOT":
+                lines.append(f"NOT {reg()}")
+            elif op.endswith("I"):
+                lines.append(f"{op} {reg()} 0x{rng.randrange(0x10000):04x}")
+            else:
+                lines.append(f"{op} {reg()} {reg()}")
+        program = asm.assemble_source("\n".join(lines + ["HALT"])).bytecode
+        assert_same(program, tmp_path)
+
+    @pytest.mark.parametrize("source", [
+        # copy an array with post-increment, then read it back by offset
+        "LDI R1 0x1000\nLDI R2 0x2000\nLDI R3 8\nLDI R4 0x1234\n"
+        "fill:\nST R4 [R1]+\nINC R4\nDEC R3\nJNZ fill\n"
+        "LDI R1 0x1000\nLDI R3 8\ncopy:\nLDM R4 [R1]+\nST R4 [R2]+\n"
+        "DEC R3\nJNZ copy\nLDM R5 [R2+0x02]\nLDM R6 [R1+0xfe]\nHALT",
+        "LDI R1 0x1000\nLDM R1 [R1]+\nST R1 [R1]+\nHALT", # base is the data
+        "LDI R1 0xfff0\nLDM R2 [R1+0x0f]\nHALT",     # past the top
+        "LDI R1 0x0100\nST R1 [R1+0x10]\nHALT",      # into the stack
+        "LDI R1 0x020c\nLDI R2 0x4501\nST R2 [R1]+\nINC R3\nHALT", # code
+        # copy a string a byte at a time, up to and including its NUL
+        "LDI R2 0x0224\nLDI R3 0x1000\ncopy:\nLDBM R1 [R2]+\nSTL R1 [R3]+\n"
+        "JNZ copy\nLDBM R4 [R3+0xfc]\nLDBM R5 0xfc3f\nLDBM R6 [R2]\n"
+        "HALT\ndata:\n.ascii \"hello\"\n.byte 0",
+        "LDI R1 0xffff\nLDBM R2 [R1]+\nLDBM R3 [R1+0x10]\nHALT",
+        "LDI R1 0x021c\nLDI R2 0x0045\nSTL R2 [R1+0x01]\nHALT\nINC R3\n"
+        "HALT",                                         # into code
+    ])
+    def test_indexed(self, tmp_path, source):
+        program = asm.assemble_source(source).bytecode
+        assert_same(program, tmp_path)
+
+    @pytest.mark.parametrize("jump", ["JMP", "JSR", "JZ", "JNZ"])
+    def test_jump_into_device(self, tmp_path, jump):
+        program = asm.assemble_source(f"LDI R1 1\n{jump} 0xf800\nHALT").bytecode
+        expected = run(program, console=True)
+        assert expected[0] is ac_exc.MemoryProtectionError
+        backend = aot.load(program, tmp_path)
+        assert run(program, backend, console=True) == expected
+
+    def test_misaligned_jump(self, tmp_path):
+        program = bytes.fromhex("ff000000" "38000202")
+        assert_same(program, tmp_path)
+
+    def test_unknown_opcode(self, tmp_path):
+        program = bytes.fromhex("00000001" "99000000" "fefffeff")
+        assert run(program, aot.load(program, tmp_path))[0] == -1
+
+
+class TestCache:
+    def test_reused(self, tmp_path):
+        program = asm.assemble_source("LDI R1 1\nHALT").bytecode
+        aot.load(program, tmp_path)
+        (path,) = tmp_path.glob("ac100aot_*.py")
+        path.write_text(path.read_text().replace("0x1\n", "0x2\n", 1))
+        outcome, state = run(program, aot.load(program, tmp_path))
+        assert state[0][0] == [0x00, 0x02]
+
+    def test_keyed_by_program(self, tmp_path):
+        aot.load(asm.assemble_source("HALT").bytecode, tmp_path)
+        aot.load(asm.assemble_source("NOP\nHALT").bytecode, tmp_path)
+        assert len(list(tmp_path.glob("ac100aot_*.py"))) == 2
+
+    def test_sparse_image(self, tmp_path):
+        source = "JMP main\n.org 0x1000\nmain:\nLDI R1 7\nST R1 0x2000\nHALT"
+        program = asm.assemble_source(source).bytecode
+        assert_same(program, tmp_path)
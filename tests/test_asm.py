@@ -4,6 +4,9 @@ import pytest
 import src.definitions as defs
 import src.exceptions as ac_exc
 import src.ac100asm as asm
+import src.ac100 as emu
+import src.ac100img as ac_img
+import src.ac100obj as ac_obj
 
 @pytest.fixture
 def assembler():
@@ -214,3 +217,109 @@ class TestParseAddress:
         token = "0b10101010"
         with pytest.raises(ValueError):
             assembler.parse_address(token)
+
+
+class TestAssembleFiles:
+    @pytest.mark.parametrize("jobs", [1, 2])
+    def test_results_in_input_order(self, jobs):
+        paths = [str(pathlib.Path(test_srcd, name)) for name in
+                 ["halt-test01", "nop-test01", "ldi-test-hex03"]]
+        results = asm.assemble_files(paths, jobs=jobs)
+        assert [r.path for r in results] == paths
+        assert [r.output for r in results] == [b"\xfe\xff\xfe\xff",
+                                               b"\xff\xff\xff\xff",
+                                               b"\x00\x00\x07\x28"]
+        assert all(r.diagnostics == [] for r in results)
+
+    def test_diagnostics_per_file(self):
+        paths = [str(pathlib.Path(test_srcd, "halt-test01")),
+                 str(pathlib.Path("asm_tests_failing", "ldi_tests", "test01"))]
+        results = asm.assemble_files(paths, jobs=2)
+        assert results[0].output is not None and results[0].diagnostics == []
+        assert results[1].output is None
+        assert len(results[1].diagnostics) > 0
+        assert all(r.levelname == "ERROR" for r in results[1].diagnostics)
+
+
+class TestAssembleSource:
+    source = "; count down\nstart:\nLDI R1 2\n\nloop:\nDEC R1\nJNZ loop\nHALT\n"
+    expected = b"\x00\x00\x00\x02\x45\x00\x00\x00\x31\x00\x02\x04"\
+        b"\xfe\xff\xfe\xff"
+
+    def test_string(self):
+        result = asm.assemble_source(self.source)
+        assert result.bytecode == self.expected
+        assert result.labels == {"start": 0x0200, "loop": 0x0204}
+        assert result.line_map == {3: 0x0200, 6: 0x0204, 7: 0x0208, 8: 0x020c}
+
+    def test_lines(self):
+        lines = (line for line in self.source.splitlines(keepends=True))
+        result = asm.assemble_source(lines)
+        assert result.bytecode == self.expected
+
+    def test_failure(self):
+        assert asm.assemble_source("LDI R20 1\n") is None
+        assert asm.assemble_source("FOO R1 1\nHALT\n") is None
+
+    def test_optimized_line_map(self):
+        result = asm.assemble_source("LDI R1 1\nNOP\nHALT\n", optimize=True)
+        assert result.bytecode == b"\x00\x00\x00\x01\xfe\xff\xfe\xff"
+        assert result.line_map == {1: 0x0200, 3: 0x0204}
+
+    def test_assemble_and_load(self):
+        machine = emu.AC100()
+        result = asm.assemble_and_load(machine, self.source)
+        assert result is not None
+        assert machine.RAM[0x0200:0x0210] == self.expected
+
+
+class TestDataDirectives:
+    def test_data(self):
+        source = 'HALT\nmsg:\n.ascii "Hi \\"you\\"\\n"\n' \
+            ".byte 1 -1 0xff\n.fill 2 7\ntable:\n.word 0x1234 msg\n"
+        result = asm.assemble_source(source)
+        assert result.bytecode == b"\xfe\xff\xfe\xff" + b'Hi "you"\n' \
+            + b"\x01\xff\xff\x07\x07\x12\x34\x02\x04"
+        assert result.labels == {"msg": 0x0204, "table": 0x0212}
+
+    def test_org(self):
+        source = 'HALT\n.org 0xfc3f\n.ascii "Hello, world"\n'
+        result = asm.assemble_source(source)
+        assert ac_img.unpack(result.bytecode) == [
+            (0x0200, b"\xfe\xff\xfe\xff"), (0xfc3f, b"Hello, world")]
+        machine = emu.AC100()
+        machine.load_ram(result.bytecode)
+        assert machine.RAM[0x0200:0x0204] == b"\xfe\xff\xfe\xff"
+        assert machine.RAM[0xfc3f:0xfc4b] == b"Hello, world"
+
+    def test_starts_with_magic(self):
+        result = asm.assemble_source('.ascii "AC1S"\nHALT\n')
+        assert ac_img.unpack(result.bytecode) == [
+            (0x0200, b"AC1S\xfe\xff\xfe\xff")]
+        machine = emu.AC100()
+        machine.load_ram(result.bytecode)
+        assert machine.RAM[0x0200:0x0208] == b"AC1S\xfe\xff\xfe\xff"
+
+    @pytest.mark.parametrize("source", [
+        ".byte 1\nHALT\n",            # misaligned instruction
+        ".byte 256\n",
+        ".ascii Hi\n",
+        ".fill -1\n",
+        ".word\n",
+        "HALT\n.org 0x0200\nHALT\n",  # moves backwards
+        ".org 0xffff\n.word 1\n",     # past the end of memory
+    ])
+    def test_invalid(self, source):
+        assert asm.assemble_source(source) is None
+
+    def test_optimizer_skipped(self):
+        result = asm.assemble_source("NOP\nHALT\n.byte 1\n", optimize=True)
+        assert result.bytecode == b"\xff\xff\xff\xff\xfe\xff\xfe\xff\x01"
+
+    def test_relocatable(self):
+        assembler = asm.AC100ASM()
+        assembler.relocatable = True
+        assert assembler.assemble_lines(["HALT", "tbl:", ".word tbl ext"])
+        assert assembler.relocations == [ac_obj.Relocation(4, "", 4),
+                                         ac_obj.Relocation(6, "ext", 0)]
+        assert assembler.assemble_lines([".org 0x0400"]) is None
@@ -55,7 +55,11 @@ class TestLdmFailures:
             ("test02", "LDM assembly should fail if dest register > 16"),
             ("test03", "LDM assembly should fail if dest register missing prefix"),
             ("test04", "LDM assembly should fail if src address given in decimal"),
-            ("test05", "LDM assembly should fail if hex address < 16 bits wide")
+            ("test05", "LDM assembly should fail if hex address < 16 bits wide"),
+            ("test06", "LDM assembly should fail if offset > 8 bits wide"),
+            ("test07", "LDM assembly should fail if base register > 16"),
+            ("test08", "LDM assembly should fail if the offset is missing"),
+            ("test09", "LDM assembly should fail if ']' is missing")
         ])
     def test_ldm_failures(self, src_file, assert_msg):
         with open(pathlib.Path(ldm_tests, src_file), "r") as f:
@@ -71,7 +75,9 @@ class TestStFailures:
             ("test03", "ST assembly should fail if src register missing prefix"),
             ("test04", "ST assembly should fail if address is missing hex prefix"),
             ("test05", "ST assembly should fail if hex address not 16 bits wide"),
-            ("test06", "ST assembly should fail if hex address > 16 bits wide")
+            ("test06", "ST assembly should fail if hex address > 16 bits wide"),
+            ("test07", "STH assembly should fail with a post-increment operand"),
+            ("test08", "ST assembly should fail if ']' is missing")
         ])
     def test_st_failures(self, src_file, assert_msg):
         source_file = pathlib.Path(st_tests, src_file)
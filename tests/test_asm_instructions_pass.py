@@ -113,10 +113,39 @@ class TestAssemblerPasses:
             ("pop-decimal-test01",
              b"\x00\x00\x00\x2a\xe0\x00\x00\x00\xe1\x01\x00\x00", 3, 0x20c,
              "POP assembly failed"),
+            ("memcpy-memset-test01", b"\x13\x00\x01\x02\x14\x0f\x03\x04", 2,
+             0x208, "MEMCPY or MEMSET assembly failed"),
+            ("mul-div-shift-test01",
+             b"\x46\x00\x01\x02\x47\x03\x04\x00\x48\x05\x06\x00\x49\x07\x00\x04"
+             b"\x4a\x08\x00\x01\x4b\x09\x00\x0f", 6, 0x218,
+             "MUL, DIVU, MOD, or shift assembly failed"),
+            ("and-test01",
+             b"\x00\x00\x0f\x0f\x50\x00\x01\x00\x51\x00\x00\xff", 3, 0x20c,
+             "ANDR or ANDI assembly failed"),
+            ("or-test01", b"\x52\x02\x03\x00\x53\x02\x80\x00", 2, 0x208,
+             "ORR or ORI assembly failed"),
+            ("xor-test01", b"\x54\x04\x05\x00\x55\x04\xff\xff", 2, 0x208,
+             "XORR or XORI assembly failed"),
+            ("not-test01", b"\x56\x0f\x00\x00", 1, 0x204, "NOT assembly failed"),
+            ("tst-test01", b"\x57\x00\x01\x00\x58\x00\x00\x01", 2, 0x208,
+             "TSTR or TSTI assembly failed"),
+            ("indexed-test01",
+             b"\x00\x01\x40\x00\x15\x00\x01\x02\x16\x00\x01\x00"
+             b"\x04\x02\x01\x04\x05\x03\x01\x00", 5, 0x214,
+             "[Rn+offset] or [Rn]+ assembly failed"),
+            ("ldbm-test01",
+             b"\x03\x00\xfc\x3f\x03\x01\x00\x02\x06\x03\x04\x10\x07\x05\x06\x00"
+             b"\x17\x00\x01\x01\x18\x00\x01\x00", 6, 0x218,
+             "LDBM or byte [Rn+offset] or [Rn]+ assembly failed"),
             ("rts-test01",
              b"\x39\x00\x02\x10\x00\x00\x00\x2a\x42\x00\x00\x00\x38\x00\x02\x14"
-             b"\xe2\x00\x00\x00\xfe\xff\xfe\xff", 8, 0x214,
+             b"\xe2\x00\x00\x00\xfe\xff\xfe\xff", 8, 0x218,
              "RTS assembly failed"),
+            ("rti-test01",
+             b"\x38\x00\x02\x08\xe3\x00\x00\x00\xfe\xff\xfe\xff", 5, 0x20c,
+             "RTI assembly failed"),
+            ("wait-test01", b"\xe4\x00\x00\x00\xfe\xff\xfe\xff", 2, 0x208,
+             "WAIT assembly failed"),
             ("nop-test01", b"\xff\xff\xff\xff", 1, 0x204, "NOP assembly failed")
         ])
     def test_instruction(self, assembler, name, expected, lineno,
@@ -0,0 +1,43 @@
+import src.ac100asm as asm
+import src.ac100bench as bench
+
+class TestAsmBench:
+    def test_generate_source(self):
+        units = bench.generate_source(2500, seed=1)
+        assert len(units) == 1
+        assert units == bench.generate_source(2500, seed=1)
+        for unit in units:
+            assert asm.assemble_source(unit) is not None
+
+    def test_split_into_units(self):
+        units = bench.generate_source(bench.UNIT_LINES + 1)
+        assert len(units) == 2
+
+    def test_bench_asm(self):
+        results = bench.bench_asm([200], repeat=1)
+        assert [r["phase"] for r in results] == ["find_labels", "assemble",
+                                                 "main", "main_object"]
+        assert all(r["lines"] >= 200 and r["peak_bytes"] > 0 for r in results)
+
+
+class TestEmuBench:
+    def test_programs_assemble(self):
+        for name in bench.EMU_PROGRAMS:
+            assert asm.assemble_source(bench.emu_source(name)) is not None
+
+    def test_sieve(self):
+        machine = bench._load(bench.emu_source("sieve", scale=0))
+        assert machine.run_headless() == 0 and machine.halted
+        composite = [machine.RAM[0x4000 + 2 * n + 1] for n in range(2000)]
+        primes = [n for n in range(2, 2000) if not composite[n]]
+        assert primes[:6] == [2, 3, 5, 7, 11, 13]
+        assert len(primes) == 303
+
+    def test_bench_emu(self):
+        results = bench.bench_emu(["count", "screen"], scale=0.01, repeat=1,
+                                  isolate=False)
+        assert [r["program"] for r in results] == ["count", "screen"]
+        count = results[0]
+        assert count["instructions"] == 2005
+        assert count["opcode_classes"]["jump"]["count"] == 1001
+        assert count["peak_rss_kib"] > 0
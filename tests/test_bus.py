@@ -0,0 +1,104 @@
+import pytest
+
+import src.ac100 as emu
+import src.ac100aot as aot
+import src.ac100asm as asm
+import src.ac100bus as ac_bus
+import src.exceptions as ac_exc
+
+class Recorder(ac_bus.Device):
+    """ Logs stores; reads return the low byte of the offset """
+    def __init__(self):
+        self.writes = []
+
+    def read(self, offset):
+        return offset
+
+    def write(self, offset, value):
+        self.writes.append((offset, value))
+
+
+def machine_for(source: str) -> emu.AC100:
+    machine = emu.AC100()
+    machine.load_ram(asm.assemble_source(source).bytecode)
+    return machine
+
+
+class TestMemoryBus:
+    def test_default_permissions(self):
+        bus = ac_bus.MemoryBus(bytearray(0x10000))
+        assert bus.access[0x01fe] == ac_bus.READ
+        assert bus.access[0x0200] == ac_bus.READ | ac_bus.WRITE | ac_bus.EXECUTE
+        assert bus.access[0xfc3e] & ac_bus.EXECUTE
+        assert bus.access[0xfc3f] == ac_bus.READ | ac_bus.WRITE
+        assert bus.access[0x10000] == bus.access[0xffff]
+
+    def test_map_device(self):
+        bus = ac_bus.MemoryBus(bytearray(0x10000))
+        device = Recorder()
+        bus.map_device(0xf800, device, pages=2, permissions=ac_bus.WRITE)
+        assert bus.device_at(0xf9ff) is device
+        assert bus.device_at(0xfa00) is None
+        bus.write_word(0xf9fe, 0x1234)
+        assert device.writes == [(0x1fe, 0x12), (0x1ff, 0x34)]
+        with pytest.raises(ac_exc.MemoryProtectionError):
+            bus.read(0xf800)
+
+    @pytest.mark.parametrize("address", [0xf801, 0x0100, 0xff00 + 0x100])
+    def test_map_device_errors(self, address):
+        with pytest.raises(ValueError):
+            ac_bus.MemoryBus(bytearray(0x10000)).map_device(
+                address, ac_bus.Device(), pages=1 if address < 0xff00 else 2)
+
+
+class TestMappedExecution:
+    def test_store_and_load(self):
+        machine = machine_for("LDI R1 0x4142\nST R1 0xf810\nSTL R1 0xf800\n"
+                              "LDM R2 0xf820\nLDI R3 0xf8ff\nLDM R4 [R3]\n"
+                              "ST R1 0x1000\nHALT")
+        device = Recorder()
+        machine.bus.map_device(0xf800, device)
+        assert machine.run_headless() == 0
+        assert device.writes == [(0x10, 0x41), (0x11, 0x42), (0x00, 0x42)]
+        assert machine.REGS[1] == [0x20, 0x21]
+        assert machine.REGS[3] == [0xff, 0x00]   # 0xf900 is RAM
+        assert machine.RAM[0xf810] == 0 and machine.RAM[0x1000] == 0x41
+
+    def test_ram_skips_the_bus(self, monkeypatch):
+        machine = machine_for("LDI R1 7\nST R1 0x1000\nLDM R2 0x1000\nHALT")
+        def fail(*args):
+            raise AssertionError("slow path taken")
+        monkeypatch.setattr(machine.bus, "read", fail)
+        monkeypatch.setattr(machine.bus, "write", fail)
+        assert machine.run_headless() == 0
+        assert machine.REGS[1] == [0, 7]
+
+    def test_write_protected(self):
+        machine = machine_for("LDI R1 1\nST R1 0x0400\nHALT")
+        machine.bus.protect(0x0400, 0x0500, ac_bus.READ)
+        with pytest.raises(ac_exc.MemoryProtectionError):
+            machine.run_headless()
+        assert machine.PC == 0x204
+
+    def test_not_executable(self):
+        machine = machine_for("JMP 0x0400")
+        machine.bus.protect(0x0400, 0x0500, ac_bus.READ | ac_bus.WRITE)
+        with pytest.raises(ac_exc.MemoryProtectionError):
+            machine.run_headless()
+
+    def test_translated(self, tmp_path):
+        source = ("LDI R1 0xf800\nLDI R2 3\nloop:\nST R2 [R1]\nLDM R3 [R1]\n"
+                  "ADDI R1 2\nDEC R2\nJNZ loop\nHALT")
+        program = asm.assemble_source(source).bytecode
+        results = []
+        for backend in (None, aot.load(program, tmp_path)):
+            machine = emu.AC100()
+            machine.load_ram(program)
+            machine.backend = backend
+            device = Recorder()
+            machine.bus.map_device(0xf800, device)
+            assert machine.run_headless() == 0
+            results.append((device.writes, machine.REGS, machine.PC,
+                            machine.instruction_count))
+        assert results[0] == results[1]
+        assert results[0][0][:2] == [(0, 0), (1, 3)]
@@ -0,0 +1,68 @@
+import os
+import pathlib
+import pytest
+
+import src.ac100asm as asm
+import src.ac100cache as ac_cache
+
+test_srcd = pathlib.Path("asm_tests_passing")
+
+@pytest.fixture
+def cache(tmp_path):
+    return ac_cache.AssemblyCache(tmp_path)
+
+
+class TestAssemblyCache:
+    def test_put_get(self, cache):
+        key = ac_cache.make_key("1", "LDI R1 1")
+        assert cache.get(key) is None
+        cache.put(key, b"\x00\x00\x00\x01", {"labels": {"start": 512}})
+        assert cache.get(key) == (b"\x00\x00\x00\x01",
+                                  {"labels": {"start": 512}})
+
+    def test_key_parts_distinct(self):
+        assert ac_cache.make_key("ab", "c") != ac_cache.make_key("a", "bc")
+
+    def test_lru_eviction(self, tmp_path):
+        cache = ac_cache.AssemblyCache(tmp_path, max_bytes=250)
+        keys = [ac_cache.make_key(str(i)) for i in range(3)]
+        for i, key in enumerate(keys):
+            cache.put(key, bytes(64), {})
+            # make the order unambiguous on coarse-grained filesystems
+            os.utime(cache._path(key), ns=(i * 10**9, i * 10**9))
+        cache.get(keys[0])      # now the most recently used
+        cache.put(ac_cache.make_key("3"), bytes(64), {})
+        assert cache.get(keys[0]) is not None
+        assert cache.get(keys[1]) is None
+
+    def test_corrupt_entry(self, cache):
+        key = ac_cache.make_key("x")
+        cache._path(key).write_bytes(b"\xff\xff")
+        assert cache.get(key) is None
+
+
+class TestCachedAssembly:
+    source = "start:\nLDI R1 1\nJMP start\n"
+
+    def test_hit_skips_parsing(self, cache, monkeypatch):
+        first = asm.assemble_source(self.source, cache=cache)
+        def fail(*args):
+            raise AssertionError("source parsed on a cache hit")
+        monkeypatch.setattr(asm.AC100ASM, "find_labels", fail)
+        second = asm.assemble_source(self.source, cache=cache)
+        assert second == first
+        assert second.line_map == {2: 0x0200, 3: 0x0204}
+
+    def test_options_in_key(self, cache):
+        plain = asm.assemble_source("LDI R1 1\nNOP\nHALT\n", cache=cache)
+        optimized = asm.assemble_source("LDI R1 1\nNOP\nHALT\n", optimize=True,
+                                        cache=cache)
+        assert plain.bytecode != optimized.bytecode
+
+    def test_assemble_file(self, tmp_path):
+        path = str(pathlib.Path(test_srcd, "rts-test01"))
+        first = asm.assemble_file(path, cache_dir=tmp_path)
+        second = asm.assemble_file(path, cache_dir=tmp_path)
+        assert first.output == second.output
+        assert second.labels == {"putchar": 0x0210, "done": 0x0214}
+        assert len(list(tmp_path.iterdir())) == 1
@@ -0,0 +1,99 @@
+import json
+import pytest
+
+import src.ac100asm as asm
+import src.ac100bench as bench
+import src.ac100cfg as cfg
+
+def graph_of(source: str) -> cfg.ControlFlowGraph:
+    return cfg.ControlFlowGraph.from_program(asm.assemble_source(source).bytecode)
+
+
+def edges_of(graph: cfg.ControlFlowGraph) -> set:
+    return {(e.source, e.target, e.kind) for e in graph.edges}
+
+
+class TestBlocks:
+    def test_split_at_targets_and_branches(self):
+        graph = graph_of("LDI R1 3\nloop:\nDEC R1\nJNZ loop\nHALT")
+        assert [(b.start, b.end, b.terminator)
+                for b in graph.blocks.values()] == [
+            (0x200, 0x204, None), (0x204, 0x20c, "JNZ"), (0x20c, 0x210, "HALT")]
+        assert edges_of(graph) == {
+            (0x200, 0x204, cfg.FALLTHROUGH), (0x204, 0x204, cfg.BRANCH),
+            (0x204, 0x20c, cfg.FALLTHROUGH)}
+        assert graph.instructions(0x204) == ["DEC R1", "JNZ 0x0204"]
+
+    def test_calls_and_returns(self):
+        graph = graph_of("JSR sub\nJSR sub\nHALT\nsub:\nINC R1\nRTS")
+        assert graph.functions == {0x200: [0x200, 0x204, 0x208],
+                                   0x20c: [0x20c]}
+        assert edges_of(graph) == {
+            (0x200, 0x20c, cfg.CALL), (0x200, 0x204, cfg.AFTER_CALL),
+            (0x204, 0x20c, cfg.CALL), (0x204, 0x208, cfg.AFTER_CALL),
+            (0x20c, 0x204, cfg.RETURN), (0x20c, 0x208, cfg.RETURN)}
+
+    def test_wait_ends_block(self):
+        graph = graph_of("INC R1\nWAIT\nINC R1\nHALT")
+        assert [(b.start, b.end, b.terminator)
+                for b in graph.blocks.values()] == [
+            (0x200, 0x208, "WAIT"), (0x208, 0x210, "HALT")]
+        assert edges_of(graph) == {(0x200, 0x208, cfg.FALLTHROUGH)}
+
+    def test_invalid_instruction_ends_block(self):
+        graph = cfg.ControlFlowGraph.from_program(
+            bytes.fromhex("42000000" "99000000" "fefffeff"))
+        assert list(graph.blocks.values()) == [
+            cfg.BasicBlock(0x200, 0x208, "invalid")]
+
+    def test_empty_and_out_of_range(self):
+        assert cfg.ControlFlowGraph.from_program(b"").blocks == {}
+        graph = graph_of("JSR 0x1000\nJMP 0x2000")
+        assert edges_of(graph) == {(0x200, 0x204, cfg.AFTER_CALL)}
+        assert graph.functions == {0x200: [0x200, 0x204]}
+
+
+class TestAnalysis:
+    def test_dominators(self):
+        graph = graph_of("CMI R1 0\nJZ else\nINC R1\nJMP end\n"
+                         "else:\nDEC R1\nend:\nHALT")
+        assert graph.dominators(0x200) == {
+            0x200: None, 0x208: 0x200, 0x210: 0x200, 0x214: 0x200}
+
+    def test_nested_loops(self):
+        graph = graph_of(bench.emu_source("count"))
+        assert graph.loops() == [
+            cfg.Loop(0x204, frozenset({0x204, 0x208, 0x210}),
+                     ((0x210, 0x204),), 1),
+            cfg.Loop(0x208, frozenset({0x208}), ((0x208, 0x208),), 2)]
+
+    def test_recursion_is_not_a_loop(self):
+        graph = graph_of(bench.emu_source("recursion"))
+        (loop,) = graph.loops()
+        assert loop.header == 0x204 and loop.blocks == {0x204, 0x210}
+
+    @pytest.mark.parametrize("name", list(bench.EMU_PROGRAMS))
+    def test_bench_programs(self, name):
+        graph = graph_of(bench.emu_source(name))
+        assert graph.loops()
+        for entry, members in graph.functions.items():
+            assert set(graph.dominators(entry)) == set(members)
+
+
+class TestExport:
+    def test_json(self):
+        graph = graph_of("loop:\nJSR sub\nJMP loop\nsub:\nRTS")
+        data = json.loads(json.dumps(graph.to_json()))
+        assert data["entry"] == 0x200
+        assert data["blocks"][0]["instructions"] == ["JSR 0x0208"]
+        assert data["functions"] == [{"entry": 0x200, "blocks": [0x200, 0x204]},
+                                     {"entry": 0x208, "blocks": [0x208]}]
+        assert data["loops"] == [{"header": 0x200, "blocks": [0x200, 0x204],
+                                  "back_edges": [[0x204, 0x200]], "depth": 1}]
+
+    def test_dot(self):
+        dot = graph_of("loop:\nDEC R1\nJNZ loop\nHALT").to_dot()
+        assert dot.startswith("digraph cfg {")
+        assert 'b0200 [label="0x0200:\\lDEC R1\\lJNZ 0x0200\\l" peripheries=2];' in dot
+        assert 'b0200 -> b0200 [label="T"];' in dot
+        assert "b0200 -> b0208;" in dot
@@ -0,0 +1,305 @@
+import io
+import time
+import pytest
+
+import src.ac100 as emu
+import src.ac100aot as aot
+import src.ac100asm as asm
+import src.ac100dev as dev
+import src.definitions as defs
+import src.exceptions as ac_exc
+
+def run(source: str, backend_dir=None, **devices) -> emu.AC100:
+    program = asm.assemble_source(source).bytecode
+    machine = emu.AC100()
+    machine.load_ram(program)
+    if backend_dir is not None:
+        machine.backend = aot.load(program, backend_dir)
+    for address, device in devices.values():
+        machine.bus.map_device(address, device)
+    assert machine.run_headless() == 0
+    return machine
+
+
+def putc(text: str) -> str:
+    return "".join(f"LDI R1 0x{ord(c):04x}\nSTL R1 0xf800\n" for c in text)
+
+
+class TestConsole:
+    def test_lines(self):
+        out = io.BytesIO()
+        console = dev.Console(out)
+        run(putc("hi\nok\n") + "HALT", console=(defs.CONSOLE_START, console))
+        assert out.getvalue().decode().splitlines() == ["hi", "ok"]
+
+    def test_word_store(self):
+        out = io.BytesIO()
+        run("LDI R1 0x4142\nST R1 0xf800\nHALT",
+            console=(defs.CONSOLE_START, dev.Console(out)))
+        assert out.getvalue() == b"AB"
+
+    def test_buffered(self):
+        out = io.BytesIO()
+        console = dev.Console(out, chunk_size=4)
+        machine = emu.AC100()
+        machine.load_ram(asm.assemble_source(putc("abcdef") + "STL R1 0xf802\n"
+                                             + putc("g") + "HALT").bytecode)
+        machine.bus.map_device(defs.CONSOLE_START, console)
+        machine.interpret(8)
+        assert out.getvalue() == b"abcd"
+        machine.interpret(5)
+        assert out.getvalue() == b"abcdef"
+        machine.interpret(2)
+        assert out.getvalue() == b"abcdef" and console.buffer == b"g"
+        machine.run_headless()
+        assert out.getvalue() == b"abcdefg"
+
+    def test_translated(self, tmp_path):
+        source = ("LDI R1 0x0030\nLDI R2 10\nloop:\nSTL R1 0xf800\nINC R1\n"
+                  "DEC R2\nJNZ loop\nHALT")
+        outputs = []
+        for backend_dir in (None, tmp_path):
+            out = io.BytesIO()
+            run(source, backend_dir, console=(defs.CONSOLE_START,
+                                              dev.Console(out)))
+            outputs.append(out.getvalue())
+        assert outputs == [b"0123456789"] * 2
+
+
+def disk_file(tmp_path, sectors: int = 2) -> str:
+    path = tmp_path / "disk.img"
+    path.write_bytes(bytes(range(256)) * 2 * sectors)
+    return str(path)
+
+
+def transfer(sector: int, address: int, command: int) -> str:
+    """ Source that runs a disk command and loads the status into R2 """
+    return (f"LDI R1 0x{sector:04x}\nST R1 0xf900\nLDI R1 0x{address:04x}\n"
+            f"ST R1 0xf902\nLDI R1 0x{command:04x}\nST R1 0xf904\n"
+            "LDM R2 0xf904\n")
+
+
+class TestDisk:
+    def machine_for(self, source: str, path: str) -> (emu.AC100, dev.Disk):
+        machine = emu.AC100()
+        machine.load_ram(asm.assemble_source(source).bytecode)
+        disk = dev.Disk(machine, path)
+        machine.bus.map_device(defs.DISK_START, disk)
+        return machine, disk
+
+    def test_read_sector(self, tmp_path):
+        machine, disk = self.machine_for(
+            transfer(1, 0x1000, dev.Disk.READ_SECTOR) + "LDM R3 0xf906\nHALT",
+            disk_file(tmp_path))
+        assert machine.run_headless() == 0
+        assert machine.REGS[1] == [0, dev.Disk.STATUS_OK]
+        assert machine.REGS[2] == [0, 2]
+        assert machine.RAM[0x1000:0x1200] == bytes(range(256)) * 2
+        disk.close()
+
+    def test_write_sector(self, tmp_path):
+        path = disk_file(tmp_path)
+        machine, disk = self.machine_for(
+            "LDI R1 0xbeef\nST R1 0x2000\n"
+            + transfer(0, 0x2000, dev.Disk.WRITE_SECTOR) + "HALT", path)
+        assert machine.run_headless() == 0
+        disk.close()
+        with open(path, "rb") as f:
+            assert f.read(4) == b"\xbe\xef\x00\x00"
+            assert f.read(1) == b"\x00"
+            f.seek(512)
+            assert f.read(2) == b"\x00\x01"
+
+    @pytest.mark.parametrize("sector, address, command, status", [
+        (2, 0x1000, dev.Disk.READ_SECTOR, dev.Disk.STATUS_BAD_SECTOR),
+        (0, 0x0100, dev.Disk.READ_SECTOR, dev.Disk.STATUS_BAD_ADDRESS),
+        (0, 0xfe01, dev.Disk.READ_SECTOR, dev.Disk.STATUS_BAD_ADDRESS),
+        (0, 0xf800, dev.Disk.WRITE_SECTOR, dev.Disk.STATUS_BAD_ADDRESS),
+        (0, 0x1000, 0x07, dev.Disk.STATUS_BAD_COMMAND),
+    ])
+    def test_errors(self, tmp_path, sector, address, command, status):
+        machine, disk = self.machine_for(
+            transfer(sector, address, command) + "HALT", disk_file(tmp_path))
+        machine.bus.map_device(defs.CONSOLE_START, dev.Console(io.BytesIO()))
+        assert machine.run_headless() == 0
+        assert machine.REGS[1] == [0, status]
+        assert machine.RAM[0x1000] == 0
+        disk.close()
+
+    def test_bad_size(self, tmp_path):
+        path = tmp_path / "disk.img"
+        path.write_bytes(bytes(100))
+        with pytest.raises(ValueError):
+            dev.Disk(emu.AC100(), str(path))
+
+    def test_read_over_code(self, tmp_path):
+        # the transfer replaces the HALT that follows it
+        image = asm.assemble_source("LDI R5 0x0077\nHALT").bytecode
+        path = tmp_path / "disk.img"
+        path.write_bytes(image.ljust(512, b"\0"))
+        source = transfer(0, 0x21c, dev.Disk.READ_SECTOR) + "HALT"
+        program = asm.assemble_source(source).bytecode
+        results = []
+        for backend in (None, aot.load(program, tmp_path / "cache")):
+            machine, disk = self.machine_for(source, str(path))
+            machine.mark_verified(range(0x200, 0x220, 4))
+            machine.backend = backend
+            assert machine.run_headless() == 0
+            assert not machine.verified[0x21c]
+            results.append((machine.REGS[4], machine.PC,
+                            machine.instruction_count))
+            disk.close()
+        assert results[0] == results[1] == ([0, 0x77], 0x220, 9)
+
+
+def with_interrupts(machine: emu.AC100) -> dev.InterruptController:
+    machine.interrupts = dev.InterruptController()
+    machine.bus.map_device(defs.INTC_START, machine.interrupts)
+    machine.bus.map_device(defs.TIMER_START, dev.Timer(machine.interrupts))
+    return machine.interrupts
+
+
+# counts timer ticks in R5 while R2 counts down from 200
+TICKS = """
+LDM R1 vector
+ST R1 0xfa10
+LDI R1 {enable}
+ST R1 0xfa00
+LDI R1 10
+ST R1 0xfb00
+LDI R2 200
+loop:
+DEC R2
+JNZ loop
+LDM R3 0xfa02
+HALT
+handler:
+INC R5
+RTI
+vector:
+.word handler
+"""
+
+
+class TestInterrupts:
+    def test_timer(self, tmp_path):
+        program = asm.assemble_source(TICKS.format(enable=1)).bytecode
+        results = []
+        for backend in (None, aot.load(program, tmp_path)):
+            machine = emu.AC100()
+            machine.load_ram(program)
+            machine.backend = backend
+            with_interrupts(machine)
+            assert machine.run_headless() == 0
+            results.append((machine.REGS[4], machine.instruction_count,
+                            machine.SP, machine.PS))
+        assert results[0] == results[1]
+        assert results[0] == ([0, 49], 507, defs.STACK_MIN, emu.AC100.FLAG_ZERO)
+
+    def test_masked(self):
+        machine = emu.AC100()
+        machine.load_ram(asm.assemble_source(TICKS.format(enable=0)).bytecode)
+        with_interrupts(machine)
+        assert machine.run_headless() == 0
+        assert machine.REGS[4] == [0, 0]
+        assert machine.REGS[2] == [0, 1]  # pending, but never taken
+
+    def test_held_off(self):
+        machine = emu.AC100()
+        interrupts = with_interrupts(machine)
+        interrupts.vectors[2] = 0x400
+        interrupts.enabled = 0x04
+        interrupts.raise_line(2)
+        machine.PC = 0x300
+        machine.PS = machine.FLAG_INTERRUPT | machine.FLAG_CARRY
+        machine.poll_interrupts(0)
+        assert machine.PC == 0x300 and interrupts.pending == 0x04
+        machine.PS = machine.FLAG_CARRY
+        machine.poll_interrupts(0)
+        assert machine.PC == 0x400 and interrupts.pending == 0
+        assert machine.PS == machine.FLAG_INTERRUPT | machine.FLAG_CARRY
+        assert machine.RAM[machine.SP:defs.STACK_MIN] == b"\x00\x01\x03\x00"
+
+    def test_priority(self):
+        interrupts = dev.InterruptController()
+        interrupts.enabled = 0x0a
+        for line in (3, 2, 1):
+            interrupts.raise_line(line)
+        interrupts.vectors[1], interrupts.vectors[3] = 0x300, 0x400
+        assert interrupts.update(0)
+        assert interrupts.acknowledge() == (1, 0x300)
+        assert interrupts.acknowledge() == (3, 0x400)
+        assert not interrupts.update(0) and interrupts.pending == 0x04
+
+    def test_timer_coalesces(self):
+        interrupts = dev.InterruptController()
+        timer = dev.Timer(interrupts, line=1)
+        timer.write(dev.Timer.PERIOD, 0x00)
+        timer.write(dev.Timer.PERIOD + 1, 10)
+        assert interrupts.due == 0
+        interrupts.update(5)
+        assert timer.deadline == 15 and interrupts.due == 15
+        interrupts.update(47)
+        assert interrupts.pending == 0x02 and timer.deadline == 55
+
+    def test_bad_vector(self):
+        source = "LDI R1 1\nST R1 0xfa00\nST R1 0xfb00\nloop:\nJMP loop"
+        machine = emu.AC100()
+        machine.load_ram(asm.assemble_source(source).bytecode)
+        with_interrupts(machine)
+        with pytest.raises(ac_exc.InterruptVectorError):
+            machine.run_headless()
+
+    # takes five ticks of a 1000-instruction timer, idling in between
+    WAITS = """
+LDM R1 vector
+ST R1 0xfa10
+LDI R1 1
+ST R1 0xfa00
+LDI R1 1000
+ST R1 0xfb00
+loop:
+WAIT
+CMI R5 5
+JNZ loop
+HALT
+handler:
+INC R5
+RTI
+vector:
+.word handler
+"""
+
+    def test_wait(self, tmp_path):
+        program = asm.assemble_source(self.WAITS).bytecode
+        results = []
+        for backend in (None, aot.load(program, tmp_path)):
+            machine = emu.AC100()
+            machine.load_ram(program)
+            machine.backend = backend
+            interrupts = with_interrupts(machine)
+            assert machine.run_headless() == 0
+            results.append((machine.REGS[4], machine.instruction_count,
+                            interrupts.idle))
+        assert results[0] == results[1]
+        assert results[0][0] == [0, 5] and results[0][1] == 6 + 5 * 5 + 1
+        assert results[0][1] + results[0][2] >= 5000
+
+    def test_wait_paced(self, monkeypatch):
+        monkeypatch.setattr(emu.AC100, "DISPLAY_INSTRUCTION_TIME", 1e-5)
+        machine = emu.AC100()
+        machine.load_ram(asm.assemble_source(self.WAITS).bytecode)
+        interrupts = with_interrupts(machine)
+        machine.paced = True
+        start = time.monotonic()
+        assert machine.run_headless() == 0
+        assert time.monotonic() - start >= 4000 * 1e-5
+        assert machine.REGS[4] == [0, 5] and interrupts.idle >= 4000
+
+    def test_wait_forever(self):
+        machine = emu.AC100()
+        machine.load_ram(asm.assemble_source(
+            "LDI R1 100\nST R1 0xfb00\nWAIT\nHALT").bytecode)
+        with_interrupts(machine)
+        with pytest.raises(ac_exc.WaitForeverError):
+            machine.run_headless()
@@ -0,0 +1,78 @@
+import random
+import pytest
+
+import src.ac100asm as asm
+import src.ac100bench as bench
+import src.ac100dis as dis
+import src.ac100map as ac_map
+
+def round_trip(program: bytes) -> bytes:
+    result = asm.assemble_source(dis.disassemble(program))
+    assert result is not None
+    return result.bytecode
+
+
+class TestDisassemble:
+    def test_syntax(self):
+        source = ["LDI R1 0x0041", "LDR R2 R1", "LDM R3 [R2]", "ST R3 0xfc3f",
+                  "CMR R1 R2", "INC R16", "PUSH R1", "RTS", "NOP", "HALT"]
+        assert dis.disassemble(asm.assemble_source(source).bytecode) == source
+
+    def test_memory_operands(self):
+        source = ["LDBM R1 [R2]", "LDBM R1 0xfc3f", "LDM R1 [R2+0x04]",
+                  "LDM R1 [R2]+", "LDBM R3 [R16+0xff]", "LDBM R3 [R4]+",
+                  "ST R1 [R2+0x00]", "ST R1 [R2]+", "STL R1 [R2+0x01]",
+                  "STL R1 [R2]+"]
+        assert dis.disassemble(asm.assemble_source(source).bytecode) == source
+
+    def test_labels(self):
+        source = "start:\nDEC R1\nJNZ start\nJSR sub\nHALT\nsub:\nRTS"
+        assert dis.disassemble(asm.assemble_source(source).bytecode) == [
+            "L0200:", "DEC R1", "JNZ L0200", "JSR L0210", "HALT", "L0210:",
+            "RTS"]
+
+    def test_target_outside_program(self):
+        program = asm.assemble_source("JMP 0x1000").bytecode
+        assert dis.disassemble(program) == ["JMP 0x1000"]
+
+    @pytest.mark.parametrize("code, line", [
+        ("99000000", ".word 0x9900 0x0000"),
+        ("00100001", ".word 0x0010 0x0001"),  # no register R17
+        ("42000001", ".word 0x4200 0x0001"),  # INC with unused bytes set
+        ("38000202", ".word 0x3800 0x0202"),  # unaligned jump
+        ("fe000000", ".word 0xfe00 0x0000"),  # not how HALT is encoded
+    ])
+    def test_data(self, code, line):
+        program = bytes.fromhex(code)
+        assert dis.disassemble(program) == [line]
+        assert round_trip(program) == program
+
+    def test_trailing_bytes(self):
+        program = bytes.fromhex("ffffffff" "0102")
+        assert dis.disassemble(program) == ["NOP", ".byte 0x01 0x02"]
+        assert round_trip(program) == program
+
+    @pytest.mark.parametrize("name", list(bench.EMU_PROGRAMS))
+    def test_round_trip_programs(self, name):
+        program = asm.assemble_source(bench.emu_source(name)).bytecode
+        assert round_trip(program) == program
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_round_trip_generated(self, seed):
+        lines = bench.generate_unit(2000, random.Random(seed))
+        program = asm.assemble_source(lines).bytecode
+        assert round_trip(program) == program
+
+    def test_round_trip_random_bytes(self):
+        program = random.Random(0).randbytes(0xfc3f - 0x200)
+        assert round_trip(program) == program
+
+    def test_sparse_image(self):
+        source = ("JMP main\n.org 0x1000\nmain:\nHALT\n"
+                  ".org 0xfc3f\n.ascii \"hi\"")
+        program = asm.assemble_source(source).bytecode
+        lines = dis.disassemble(program)
+        assert lines == ["JMP L1000", ".org 0x1000", "L1000:", "HALT",
+                         ".org 0xfc3f", ".byte 0x68 0x69"]
+        assert (ac_map.memory_segments(round_trip(program))
+                == ac_map.memory_segments(program))
@@ -240,6 +240,38 @@ def test_ldm_indirect(emulator):
     assert emulator.REGS[2][1] == 0x2a
 
 
+def test_ldm_indexed(emulator):
+    emulator.RAM[0x0504:0x0506] = b"\x80\x2a"
+    emulator._exec_load(b"\x00\x01\x05\x00") # LDI R2 0x0500
+    emulator._exec_load(b"\x04\x00\x01\x04") # LDM R1 [R2+0x04]
+    assert emulator.REGS[0] == [0x80, 0x2a]
+    assert emulator.REGS[1] == [0x05, 0x00]
+    assert emulator.flag_read(emu.AC100.FLAG_NEGATIVE)
+
+
+def test_st_indexed_wraps(emulator):
+    emulator._exec_load(b"\x00\x00\xbe\xef") # LDI R1 0xbeef
+    emulator._exec_load(b"\x00\x01\xff\x10") # LDI R2 0xff10
+    with pytest.raises(ac_exc.MemoryProtectionError): # wraps into the stack
+        emulator._exec_store(b"\x15\x00\x01\xf0") # ST R1 [R2+0xf0]
+    emulator._exec_store(b"\x15\x00\x01\xe0") # ST R1 [R2+0xe0]
+    assert emulator.RAM[0xfff0:0xfff2] == b"\xbe\xef"
+
+
+def test_post_increment(emulator):
+    emulator._exec_load(b"\x00\x00\x12\x34") # LDI R1 0x1234
+    emulator._exec_load(b"\x00\x01\x05\x00") # LDI R2 0x0500
+    emulator._exec_store(b"\x16\x00\x01\x00") # ST R1 [R2]+
+    emulator._exec_store(b"\x16\x01\x01\x00") # ST R2 [R2]+
+    assert emulator.RAM[0x0500:0x0504] == b"\x12\x34\x05\x02"
+    assert emulator.REGS[1] == [0x05, 0x04]
+    emulator._exec_load(b"\x00\x01\x05\x00") # LDI R2 0x0500
+    emulator._exec_load(b"\x05\x02\x01\x00") # LDM R3 [R2]+
+    emulator._exec_load(b"\x05\x01\x01\x00") # LDM R2 [R2]+
+    assert emulator.REGS[2] == [0x12, 0x34]
+    assert emulator.REGS[1] == [0x05, 0x02]  # the loaded word wins
+
+
 def test_ldbm(emulator):
     emulator.RAM[0x0400] = 0xab
     emulator.RAM[0x0401] = 0xcd
@@ -261,6 +293,36 @@ def test_ldbm_indirect(emulator):
     assert emulator.REGS[1][1] == 0xad
 
 
+def test_ldbm_dispatch(emulator):
+    emulator.RAM[0x0400] = 0x41
+    emulator.PS = emulator.FLAG_ZERO
+    assert emulator.decode_execute_instruction(b"\x03\x00\x04\x00")
+    assert emulator.REGS[0] == [0x00, 0x41]
+    assert emulator.PS == 0
+    assert emulator.PC == defs.CODE_START + 4
+
+
+def test_byte_post_increment(emulator):
+    emulator.RAM[0x0400:0x0403] = b"hi\x00"
+    set_regs(emulator, 0x0000, 0x0400, 0x0500)
+    for _ in range(3):
+        emulator.decode_execute_instruction(b"\x07\x00\x01\x00") # LDBM R1 [R2]+
+        emulator.decode_execute_instruction(b"\x18\x00\x02\x00") # STL R1 [R3]+
+    assert emulator.RAM[0x0500:0x0504] == b"hi\x00\x00"
+    assert emulator.REGS[1] == [0x04, 0x03]
+    assert emulator.REGS[2] == [0x05, 0x03]
+    assert emulator.flag_read(emu.AC100.FLAG_ZERO)
+
+
+def test_byte_indexed(emulator):
+    emulator.RAM[0x04ff] = 0x7f
+    set_regs(emulator, 0x1234, 0x0400)
+    emulator.decode_execute_instruction(b"\x06\x02\x01\xff") # LDBM R3 [R2+0xff]
+    emulator.decode_execute_instruction(b"\x17\x00\x01\x10") # STL R1 [R2+0x10]
+    assert emulator.REGS[2] == [0x00, 0x7f]
+    assert emulator.RAM[0x040f:0x0412] == b"\x00\x34\x00"
+
+
 def test_ldm_z_flag_set(emulator):
     emulator._exec_load(b"\x00\x01\x00\x00") # LDI R2 0x0000
     emulator._exec_load(b"\x00\x00\xde\xad") # LDI R1 0xdead
@@ -305,7 +367,7 @@ def test_st_valid_destination(emulator):
 
 def test_st_invalid_destination(emulator):
     emulator._exec_load(b"\x00\x00\xbe\xef") # LDI R1 0xbeef
-    with pytest.raises(SystemExit):
+    with pytest.raises(ac_exc.MemoryProtectionError):
         emulator._exec_store(b"\x10\x00\x01\x00") # ST R1 0x0100; stack space
 
 
@@ -317,7 +379,7 @@ def test_sth(emulator):
 
 def test_sth_invalid_destination(emulator):
     emulator._exec_load(b"\x00\x00\xde\xad") # LDI R1 0xdead
-    with pytest.raises(SystemExit):
+    with pytest.raises(ac_exc.MemoryProtectionError):
         emulator._exec_store(b"\x11\x00\x01\x00") # STH R1 0x0100; stack space
 
 
@@ -329,7 +391,7 @@ def test_stl(emulator):
 
 def test_stl_invalid_destination(emulator):
     emulator._exec_load(b"\x00\x00\x7f\xff") # LDI R1 0x7fff
-    with pytest.raises(SystemExit):
+    with pytest.raises(ac_exc.MemoryProtectionError):
         emulator._exec_store(b"\x12\x00\x01\x00") # STL R1 0x0100; stack space
 
 
@@ -520,12 +582,12 @@ def test_jsr_stack_overflow(emulator, before, after):
         (0x0200, 0x0100, b"\x30"), (0xab40, 0x0040, b"\x30"),
         (0x0200, 0x01fc, b"\x30"), (0x0300, 0x0000, b"\x30")
     ])
-def test_jump_stack_jump_error(emulator, before, after, opcode):
+def test_jump_into_stack(emulator, before, after, opcode):
     emulator.PC = before
     emulator.flag_set(emu.AC100.FLAG_ZERO)
     address_code = after.to_bytes(2, byteorder='big')
     jump_code = opcode + b"\x00" + address_code
-    with pytest.raises(ac_exc.StackJumpError):
+    with pytest.raises(ac_exc.MemoryProtectionError):
         emulator._exec_jump(jump_code)
 
 
@@ -535,12 +597,12 @@ def test_jump_stack_jump_error(emulator, before, after, opcode):
         (0x0440, defs.ADDRESS_MAX, b"\x30"),
         (0xabc0, defs.ADDRESS_MAX - 10, b"\x30")
     ])
-def test_jump_vram_jump_error(emulator, before, after, opcode):
+def test_jump_into_vram(emulator, before, after, opcode):
     emulator.PC = before
     emulator.flag_set(emu.AC100.FLAG_ZERO)
     address_code = after.to_bytes(2, byteorder='big')
     jump_code = opcode + b"\x00" + address_code
-    with pytest.raises(ac_exc.VRAMJumpError):
+    with pytest.raises(ac_exc.MemoryProtectionError):
         emulator._exec_jump(jump_code)
 
 
@@ -760,3 +822,195 @@ def test_rts_stack_jump(emulator, before, target):
     emulator.RAM[emulator.SP + 1] = target & 0xff
     with pytest.raises(ac_exc.StackJumpError):
         emulator._exec_rts(b"\xe2\x00\x00\x00")
+
+
+def test_rti_ok(emulator):
+    emulator.PC = 0x0600
+    emulator.PS = emulator.FLAG_INTERRUPT
+    for value in (0x0404, 0x0003):  # PC, then PS
+        emulator._decrement_sp()
+        emulator.RAM[emulator.SP] = value >> 8 & 0xff
+        emulator.RAM[emulator.SP + 1] = value & 0xff
+    emulator._exec_rti(b"\xe3\x00\x00\x00")
+    assert emulator.PC == 0x0404
+    assert emulator.PS == emulator.FLAG_ZERO | emulator.FLAG_CARRY
+    assert emulator.SP == defs.STACK_MIN
+
+
+def test_rti_stack_empty(emulator):
+    emulator._decrement_sp()
+    with pytest.raises(ac_exc.StackEmptyError):
+        emulator._exec_rti(b"\xe3\x00\x00\x00")
+
+
+def test_rti_stack_jump(emulator):
+    emulator._decrement_sp()
+    emulator._decrement_sp()
+    with pytest.raises(ac_exc.StackJumpError):
+        emulator._exec_rti(b"\xe3\x00\x00\x00")
+
+
+def test_wait_without_interrupts(emulator):
+    with pytest.raises(ac_exc.WaitForeverError):
+        emulator.decode_execute_instruction(b"\xe4\x00\x00\x00")
+
+
+def set_regs(emulator, *values):
+    for n, value in enumerate(values):
+        emulator.REGS[n] = [value >> 8, value & 0xff]
+
+
+def test_memset(emulator):
+    set_regs(emulator, 0x1241, 0x1000, 0x0300)
+    emulator.decode_execute_instruction(b"\x14\x00\x01\x02")
+    assert emulator.RAM[0x0fff:0x1301] == b"\x00" + b"A" * 0x300 + b"\x00"
+    assert emulator.PC == defs.CODE_START + 4 and emulator.PS == 0
+
+
+@pytest.mark.parametrize("source, dest", [(0x1000, 0x1002), (0x1002, 0x1000)])
+def test_memcpy_overlapping(emulator, source, dest):
+    emulator.RAM[0x1000:0x1006] = b"abcdef"
+    set_regs(emulator, source, dest, 4)
+    emulator._exec_block(b"\x13\x00\x01\x02")
+    expected = bytearray(b"abcdef")
+    expected[dest - 0x1000:dest - 0x1000 + 4] = b"abcdef"[source - 0x1000:][:4]
+    assert emulator.RAM[0x1000:0x1006] == expected
+
+
+def test_memcpy_to_stack(emulator):
+    set_regs(emulator, 0x1000, 0x01fe, 4)
+    with pytest.raises(ac_exc.MemoryProtectionError):
+        emulator._exec_block(b"\x13\x00\x01\x02")
+
+
+def test_memcpy_past_top(emulator):
+    set_regs(emulator, 0xfff0, 0x1000, 0x20)
+    with pytest.raises(ac_exc.MemoryProtectionError):
+        emulator._exec_block(b"\x13\x00\x01\x02")
+
+
+@pytest.mark.parametrize("a, b, low, high, flags", [
+    (0x1234, 0x0100, 0x3400, 0x0012, 0x5),
+    (0x00ff, 0x0101, 0xffff, 0x0000, 0x8),
+    (0xffff, 0x0000, 0x0000, 0x0000, 0x2),
+])
+def test_mul(emulator, a, b, low, high, flags):
+    set_regs(emulator, a, b, 0x5555)
+    emulator.decode_execute_instruction(b"\x46\x00\x01\x02")  # MUL R1 R2 R3
+    assert emulator.REGS[0] == [low >> 8, low & 0xff]
+    assert emulator.REGS[2] == [high >> 8, high & 0xff]
+    assert emulator.PS == flags
+
+
+@pytest.mark.parametrize("a, b, code, regs, flags", [
+    # MUL R1 R2 R1: R1 gets the high word; N still describes the low one
+    (0x8000, 0x0003, b"\x46\x00\x01\x00", [0x0001, 0x0003], 0xd),
+    (0x1234, 0x0100, b"\x46\x00\x01\x01", [0x3400, 0x0012], 0x5), # R1 R2 R2
+    (0x1234, 0x0100, b"\x46\x00\x00\x00", [0x014b, 0x0100], 0x5), # R1 R1 R1
+])
+def test_mul_aliased(emulator, a, b, code, regs, flags):
+    set_regs(emulator, a, b, 0x5555)
+    emulator.decode_execute_instruction(code)
+    assert [emulator.REGS[r][0] << 8 | emulator.REGS[r][1]
+            for r in (0, 1)] == regs
+    assert emulator.PS == flags
+
+
+@pytest.mark.parametrize("opcode, a, b, result", [
+    (0x47, 100, 7, 14), (0x48, 100, 7, 2), (0x47, 0xffff, 2, 0x7fff),
+    (0x48, 6, 3, 0),
+])
+def test_div_mod(emulator, opcode, a, b, result):
+    set_regs(emulator, a, b)
+    emulator.PS = emulator.FLAG_CARRY | emulator.FLAG_OVERFLOW
+    emulator.decode_execute_instruction(bytes([opcode, 0, 1, 0]))
+    assert emulator.REGS[0] == [result >> 8, result & 0xff]
+    assert emulator.PS == (emulator.FLAG_ZERO if result == 0 else 0)
+
+
+def test_divide_by_zero(emulator):
+    set_regs(emulator, 5, 0)
+    with pytest.raises(ac_exc.DivideByZeroError):
+        emulator.decode_execute_instruction(b"\x48\x00\x01\x00")
+
+
+@pytest.mark.parametrize("opcode, value, count, result, flags", [
+    (0x49, 0x8001, 1, 0x0002, 0x1), (0x49, 0x0001, 15, 0x8000, 0x8),
+    (0x49, 0x0001, 16, 0x0000, 0x3), (0x49, 0xffff, 40, 0x0000, 0x2),
+    (0x4A, 0x8001, 1, 0x4000, 0x1), (0x4A, 0x8000, 16, 0x0000, 0x3),
+    (0x4B, 0x8000, 3, 0xf000, 0x8), (0x4B, 0x8000, 40, 0xffff, 0x9),
+    (0x4B, 0x4003, 1, 0x2001, 0x1), (0x4A, 0x1234, 0, 0x1234, 0x0),
+])
+def test_shift(emulator, opcode, value, count, result, flags):
+    set_regs(emulator, value)
+    emulator.PS = emulator.FLAG_CARRY | emulator.FLAG_OVERFLOW
+    emulator.decode_execute_instruction(bytes([opcode, 0, count >> 8, count]))
+    assert emulator.REGS[0] == [result >> 8, result & 0xff]
+    assert emulator.PS == flags
+
+
+@pytest.mark.parametrize("instruction, result, flags", [
+    (b"\x50\x00\x01\x00", 0x0004, 0x0),  # ANDR R1 R2
+    (b"\x51\x00\x80\x00", 0x8000, 0x8),  # ANDI R1 0x8000
+    (b"\x51\x00\x00\x00", 0x0000, 0x2),  # ANDI R1 0
+    (b"\x52\x00\x01\x00", 0xf7ff, 0x8),  # ORR R1 R2
+    (b"\x53\x00\x00\x0f", 0xf0ff, 0x8),  # ORI R1 0x000f
+    (b"\x54\x00\x01\x00", 0xf7fb, 0x8),  # XORR R1 R2
+    (b"\x55\x00\xf0\xf4", 0x0000, 0x2),  # XORI R1 0xf0f4
+    (b"\x56\x00\x00\x00", 0x0f0b, 0x0),  # NOT R1
+])
+def test_logic(emulator, instruction, result, flags):
+    set_regs(emulator, 0xf0f4, 0x070f)
+    emulator.PS = emulator.FLAG_CARRY | emulator.FLAG_OVERFLOW
+    emulator.decode_execute_instruction(instruction)
+    assert emulator.REGS[0] == [result >> 8, result & 0xff]
+    assert emulator.REGS[1] == [0x07, 0x0f]
+    assert emulator.PS == flags
+
+
+@pytest.mark.parametrize("instruction, flags", [
+    (b"\x57\x00\x01\x00", 0x0),          # TSTR R1 R2
+    (b"\x58\x00\x00\x0b", 0x2),          # TSTI R1 0x000b
+    (b"\x58\x00\x80\x00", 0x8),          # TSTI R1 0x8000
+])
+def test_tst(emulator, instruction, flags):
+    set_regs(emulator, 0xf0f4, 0x070f)
+    emulator.PS = emulator.FLAG_CARRY
+    emulator.decode_execute_instruction(instruction)
+    assert emulator.REGS[0] == [0xf0, 0xf4]
+    assert emulator.PS == flags
+
+
+def test_halt(emulator):
+    ok = emulator.decode_execute_instruction(b"\xfe\xff\xfe\xff")
+    assert ok and emulator.halted
+    assert emulator.PC == defs.CODE_START
+
+
+def test_addi_dispatch(emulator):
+    emulator.decode_execute_instruction(b"\x40\x00\x00\x05") # ADDI R1 5
+    emulator.decode_execute_instruction(b"\x43\x00\x00\x02") # SUBI R1 2
+    assert emulator.REGS[0] == [0x00, 0x03]
+    assert emulator.PC == defs.CODE_START + 8
+
+
+class TestRunHeadless:
+    source = "LDI R1 3\nloop:\nDEC R1\nJNZ loop\nHALT\n"
+
+    def test_runs_to_halt(self, emulator):
+        asm.assemble_and_load(emulator, self.source)
+        assert emulator.run_headless() == 0
+        assert emulator.halted
+        assert emulator.instruction_count == 8
+
+    def test_max_instructions(self, emulator):
+        asm.assemble_and_load(emulator, self.source)
+        assert emulator.run_headless(max_instructions=3) == 0
+        assert not emulator.halted
+        assert emulator.instruction_count == 3
+        emulator.run_headless()
+        assert emulator.instruction_count == 8
+
+    def test_failure(self, emulator):
+        emulator.load_ram(b"\x99\x00\x00\x00")
+        assert emulator.run_headless() == -1
@@ -0,0 +1,69 @@
+import json
+import sys
+import pytest
+
+import src.ac100history as history
+
+def report(commit: str, ips: [float], instructions: int = 1000) -> dict:
+    return {"commit": commit, "results": [{
+        "benchmark": "emu", "program": "count", "instructions": instructions,
+        "seconds": min(instructions / r for r in ips),
+        "samples": [instructions / r for r in ips]}]}
+
+
+class TestMedianInterval:
+    def test_small_sample_spans_all(self):
+        assert history.median_interval([3, 1, 2]) == (1, 2, 3)
+
+    def test_large_sample_narrows(self):
+        estimate = history.median_interval(list(range(100)))
+        assert estimate.median == 49.5
+        assert 35 < estimate.low < 49.5 < estimate.high < 65
+
+
+class TestCompare:
+    def test_metrics(self):
+        found = history.metrics(report("a", [100.0, 200.0]))
+        assert found == {"emu/count": pytest.approx([100.0, 200.0])}
+
+    @pytest.mark.parametrize("current, status", [
+        ([99, 100, 101], "ok"),
+        ([80, 81, 82], "slower"),
+        ([120, 121, 122], "faster"),
+        ([60, 90, 150], "noisy"),
+    ])
+    def test_status(self, current, status):
+        baseline = history.metrics(report("a", [99, 100, 101]))
+        comparisons = history.compare(baseline,
+                                      history.metrics(report("b", current)))
+        assert [c.status for c in comparisons] == [status]
+
+    def test_baseline_pools_commit(self):
+        reports = [report("aaa1", [100]), report("aaa1", [110]),
+                   report("bbb2", [50])]
+        commit, samples = history.baseline_samples(reports, exclude="bbb2")
+        assert commit == "aaa1"
+        assert samples["emu/count"] == pytest.approx([100, 110])
+        assert history.baseline_samples(reports, "bbb")[0] == "bbb2"
+        assert history.baseline_samples(reports, "ccc") is None
+
+
+class TestMain:
+    def run(self, monkeypatch, *argv):
+        monkeypatch.setattr(history, "parser", history.argparse.ArgumentParser())
+        monkeypatch.setattr(sys, "argv", ["ac100history", *argv])
+        history.main()
+
+    def test_gate(self, monkeypatch, tmp_path):
+        hist = str(tmp_path / "history.jsonl")
+        for name, ips in [("old", [99, 100, 101]), ("new", [70, 71, 72])]:
+            (tmp_path / f"{name}.json").write_text(json.dumps(report(name, ips)))
+        self.run(monkeypatch, "--history", hist, "add",
+                 str(tmp_path / "old.json"))
+        with pytest.raises(SystemExit) as e:
+            self.run(monkeypatch, "--history", hist, "compare",
+                     str(tmp_path / "new.json"))
+        assert e.value.code == 1
+        self.run(monkeypatch, "--history", hist, "compare", "--threshold", "40",
+                 str(tmp_path / "new.json"))
+        assert len(history.load_history(hist)) == 1
@@ -0,0 +1,80 @@
+import pathlib
+import pytest
+
+import src.ac100asm as asm
+import src.ac100ld as ld
+import src.ac100obj as ac_obj
+import src.exceptions as ac_exc
+
+test_srcd = pathlib.Path("ld_tests")
+
+def assemble_object(name):
+    assembler = asm.AC100ASM()
+    assembler.relocatable = True
+    with open(pathlib.Path(test_srcd, name), "r") as f:
+        assert assembler.find_labels(f)
+        bytecode = assembler.assemble(f)
+    assert bytecode is not None
+    return assembler.make_object(bytecode)
+
+
+class TestObjectFile:
+    def test_round_trip(self):
+        obj = assemble_object("main")
+        parsed = ac_obj.ObjectFile.from_bytes(obj.to_bytes())
+        assert parsed.code == obj.code
+        assert parsed.symbols == {"start": 0}
+        assert parsed.relocations == obj.relocations
+
+    def test_relocations(self):
+        obj = assemble_object("main")
+        assert obj.relocations == [
+            ac_obj.Relocation(6, "double", 0, ac_obj.RELOC_JUMP),
+            ac_obj.Relocation(10, "", 12, ac_obj.RELOC_JUMP)]
+        # unresolved external left for the linker
+        assert obj.code[4:8] == b"\x39\x00\x00\x00"
+
+    @pytest.mark.parametrize("data",
+        [b"", b"XXXX\x02\x00\x00\x00\x00\x00", b"AC1O\x03\x00\x00\x00\x00\x00",
+         b"AC1O\x02\x00\x04\x00\x00\x00\x00", b"AC1O\x02\x00\x00\x00\x01\x00",
+         b"AC1O\x02\x00\x00\x00\x00\x00\x01\x00\x00\x02\x00\x00\x00"])
+    def test_malformed(self, data):
+        with pytest.raises(ac_exc.ObjectFormatError):
+            ac_obj.ObjectFile.from_bytes(data)
+
+
+class TestLinker:
+    def test_link(self):
+        linker = ld.AC100LD()
+        linker.add_object(assemble_object("main"))
+        linker.add_object(assemble_object("lib"))
+        binary = linker.link()
+        assert linker.symbols == {"start": 0x0200, "double": 0x0210}
+        assert binary == b"\x00\x00\x00\x15\x39\x00\x02\x10"\
+            b"\x38\x00\x02\x0c\xfe\xff\xfe\xff"\
+            b"\x41\x00\x00\x00\x38\x00\x02\x18\xe2\x00\x00\x00"
+
+    def test_duplicate_symbol(self):
+        linker = ld.AC100LD()
+        linker.add_object(assemble_object("lib"))
+        linker.add_object(assemble_object("dup"))
+        assert linker.link() is None
+
+    def test_undefined_symbol(self):
+        linker = ld.AC100LD()
+        linker.add_object(assemble_object("undefined"))
+        assert linker.link() is None
+
+    def test_misaligned_jump(self):
+        linker = ld.AC100LD()
+        linker.add_object(assemble_object("jump_odd"))
+        linker.add_object(assemble_object("odd"))
+        assert linker.link() is None
+
+    def test_data_not_checked(self):
+        # the byte before the .word looks like a JMP opcode
+        linker = ld.AC100LD()
+        linker.add_object(assemble_object("data_odd"))
+        linker.add_object(assemble_object("odd"))
+        binary = linker.link()
+        assert binary is not None and binary[2:4] == b"\x02\x09"
@@ -0,0 +1,76 @@
+import pytest
+
+import src.ac100asm as asm
+import src.ac100map as ac_map
+import src.exceptions as ac_exc
+
+source = """; demo
+.macro PUTC c
+LDI R1 \\c
+ST R1 0xfc3f
+.endm
+start:
+PUTC 0x41
+msg:
+.ascii "Hi"
+.fill 2
+HALT
+.org 0xfc3f
+.byte 0x41
+"""
+
+@pytest.fixture
+def result():
+    return asm.assemble_source(source)
+
+
+class TestListing:
+    def test_listing(self, result):
+        segments = ac_map.memory_segments(result.bytecode)
+        listing = ac_map.make_listing(source.splitlines(), result.line_map,
+                                      segments)
+        assert listing[0] == f"{'':19}    1  ; demo"
+        assert listing[6] == "0200  00 00 00 41      7  PUTC 0x41"
+        assert listing[7] == "0204  10 00 fc 3f"
+        assert listing[9] == "0208  48 69            9  .ascii \"Hi\""
+        assert listing[-1] == "fc3f  41              13  .byte 0x41"
+
+    def test_ranges_stop_at_segment_end(self, result):
+        segments = ac_map.memory_segments(result.bytecode)
+        ranges = ac_map.line_ranges(result.line_map, segments)
+        assert (0x020c, 0x0210, 11) in ranges
+        assert (0xfc3f, 0xfc40, 13) in ranges
+
+
+class TestSourceMap:
+    def test_lookup(self, result):
+        source_map = ac_map.SourceMap()
+        source_map.add_file("demo.s", result.line_map, result.labels,
+                            ac_map.memory_segments(result.bytecode))
+        assert source_map.lookup(0x0204) == ("demo.s", 7)
+        assert source_map.lookup(0x0209) == ("demo.s", 9)
+        assert source_map.lookup(0x0210) is None
+        assert source_map.lookup(0x01fc) is None
+
+    def test_round_trip(self, result, tmp_path):
+        source_map = ac_map.SourceMap()
+        segments = ac_map.memory_segments(result.bytecode)
+        source_map.add_file("a.s", result.line_map, result.labels, segments)
+        source_map.add_file("b.s", result.line_map, {"start": 0x0200},
+                            segments, shift=0x20)
+        source_map.write(tmp_path / "out.map")
+        loaded = ac_map.SourceMap.read(tmp_path / "out.map")
+        assert loaded.files == ["a.s", "b.s"]
+        assert loaded.entries == source_map.entries
+        # each file keeps its own "start"
+        assert loaded.labels == {(0, "start"): 0x0200, (0, "msg"): 0x0208,
+                                 (1, "start"): 0x0220}
+        assert loaded.lookup(0x0220) == ("b.s", 7)
+
+    @pytest.mark.parametrize("data", [b"", b"AC1X" + bytes(9),
+                                      b"AC1M\x02\x00\x01\x00\x00\x00\x00\x00\x00",
+                                      b"AC1M\x02\x00\x00\x00\x00\x00\x00\x00\x01"
+                                      b"\x00\x05\x00\x02\x00"])
+    def test_malformed(self, data):
+        with pytest.raises(ac_exc.SourceMapFormatError):
+            ac_map.SourceMap.from_bytes(data)
@@ -0,0 +1,51 @@
+import pathlib
+import pytest
+
+import src.ac100asm as asm
+import src.ac100obj as ac_obj
+
+@pytest.fixture
+def assembler():
+    assembler = asm.AC100ASM()
+    assembler.optimize = True
+    return assembler
+
+test_srcd = pathlib.Path("opt_tests")
+
+class TestPeepholeOptimizer:
+    @pytest.mark.parametrize("name, expected, labels, fail_msg",
+        [
+            ("nop01", b"\x00\x00\x00\x01\xfe\xff\xfe\xff", {},
+             "NOP should have been removed"),
+            ("nop02", b"\x38\x00\x02\x04\xff\xff\xff\xff\x38\x00\x02\x04",
+             {"spin": 0x0204}, "NOP that is a jump target should be kept"),
+            ("thread01",
+             b"\x21\x00\x00\x00\x30\x00\x02\x10\xfe\xff\xfe\xff"
+             b"\x38\x00\x02\x10\xfe\xff\xfe\xff",
+             {"start": 0x0200, "hop": 0x020c, "done": 0x0210},
+             "Jump should be threaded and unreachable code removed"),
+            ("fold01",
+             b"\x00\x00\x00\x05\x42\x00\x00\x00\x43\x00\x00\x02"
+             b"\x40\x02\x00\x04\x40\x00\x00\x01\x32\x00\x02\x18"
+             b"\xfe\xff\xfe\xff",
+             {"end": 0x0218}, "Folds should only apply when flags are dead")
+        ])
+    def test_optimize(self, assembler, name, expected, labels, fail_msg):
+        with open(pathlib.Path(test_srcd, name), "r") as f:
+            assert assembler.find_labels(f)
+            bytecode = assembler.assemble(f)
+        assert bytecode == expected, fail_msg
+        assert assembler.labels == labels
+        assert assembler.offset == 0x0200 + len(expected)
+
+    def test_relocations_moved(self, assembler):
+        assembler.relocatable = True
+        with open(pathlib.Path(test_srcd, "reloc01"), "r") as f:
+            assert assembler.find_labels(f)
+            bytecode = assembler.assemble(f)
+        obj = assembler.make_object(bytecode)
+        assert obj.code == b"\x39\x00\x00\x00\x38\x00\x02\x08\xfe\xff\xfe\xff"
+        assert obj.symbols == {"start": 0}
+        assert obj.relocations == [
+            ac_obj.Relocation(2, "helper", 0, ac_obj.RELOC_JUMP),
+            ac_obj.Relocation(6, "", 8, ac_obj.RELOC_JUMP)]
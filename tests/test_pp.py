@@ -0,0 +1,98 @@
+import itertools
+import pytest
+
+import src.ac100asm as asm
+import src.ac100pp as ac_pp
+import src.exceptions as ac_exc
+
+@pytest.fixture
+def pp():
+    return ac_pp.Preprocessor()
+
+
+def expand(pp, source: str) -> [str]:
+    return list(pp.expand(source.splitlines()))
+
+
+class TestPreprocessor:
+    def test_no_directives(self, pp):
+        assert expand(pp, "LDI R1 1\nHALT") == ["LDI R1 1", "HALT"]
+
+    def test_macro_params(self, pp):
+        source = ".macro MOV dst src\nLDR \\dst \\src\n.endm\nMOV R1 R2"
+        assert expand(pp, source) == ["LDR R1 R2"]
+
+    def test_unique_locals(self, pp):
+        source = ".macro SPIN\nloop\\@:\nJMP loop\\@\n.endm\nSPIN\nSPIN"
+        lines = expand(pp, source)
+        assert lines[0] != lines[2]
+        assert lines[1] == "JMP " + lines[0][:-1]
+
+    def test_rept(self, pp):
+        assert expand(pp, ".rept 3\nINC R1\n.endr") == ["INC R1"] * 3
+
+    def test_rept_in_macro(self, pp):
+        source = ".macro PAD n\n.rept \\n\nNOP\n.endr\n.endm\nPAD 2\nHALT"
+        assert expand(pp, source) == ["NOP", "NOP", "HALT"]
+
+    def test_expansion_reused(self, pp):
+        source = ".macro CLR r\nLDI \\r 0\n.endm\nCLR R1\nCLR R1\nCLR R2"
+        assert expand(pp, source) == ["LDI R1 0", "LDI R1 0", "LDI R2 0"]
+        assert set(pp.macros["CLR"].expansions) == {("R1",), ("R2",)}
+
+    def test_lazy(self, pp):
+        lines = pp.expand([".rept 1000000000", "NOP", ".endr"])
+        assert list(itertools.islice(lines, 3)) == ["NOP"] * 3
+
+    def test_source_lineno(self, pp):
+        source = ".macro TWO\nNOP\nNOP\n.endm\nHALT\nTWO"
+        lines = pp.expand(source.splitlines())
+        linenos = [lines.source_lineno for _ in lines]
+        assert linenos == [5, 6, 6]
+
+    @pytest.mark.parametrize("source", [
+        ".macro M\nNOP",
+        ".rept 2\nNOP",
+        ".endm",
+        ".rept x\nNOP\n.endr",
+        ".macro M a\nNOP\n.endm\nM",
+        ".macro M\nNOP\n.endm\n.macro M\nHALT\n.endm",
+        ".macro M\nM\n.endm\nM",
+        ".macro WAIT\nNOP\n.endm",  # an instruction's name
+    ])
+    def test_errors(self, pp, source):
+        with pytest.raises(ac_exc.PreprocessorError):
+            expand(pp, source)
+
+
+class TestAssembleMacros:
+    def test_assemble(self):
+        source = """
+.macro PUTC c
+LDI R1 \\c
+ST R1 0xfc3f
+.endm
+start:
+PUTC 0x41
+.rept 2
+INC R1
+.endr
+HALT
+"""
+        result = asm.assemble_source(source)
+        assert result.bytecode == bytes([
+            0x00, 0x00, 0x00, 0x41,
+            0x10, 0x00, 0xfc, 0x3f,
+            0x42, 0x00, 0x00, 0x00,
+            0x42, 0x00, 0x00, 0x00,
+            0xfe, 0xff, 0xfe, 0xff])
+        assert result.labels == {"start": 0x200}
+        assert result.line_map == {7: 0x200, 9: 0x208, 11: 0x210}
+
+    def test_local_labels(self):
+        source = ".macro SPIN\nloop\\@:\nJMP loop\\@\n.endm\nSPIN\nSPIN"
+        result = asm.assemble_source(source)
+        assert sorted(result.labels.values()) == [0x200, 0x204]
+
+    def test_error_reported(self):
+        assert asm.assemble_source(".rept 2\nNOP") is None
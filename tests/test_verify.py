@@ -0,0 +1,107 @@
+import io
+import pytest
+
+import src.ac100 as emu
+import src.ac100asm as asm
+import src.ac100bench as bench
+import src.ac100dev as dev
+import src.ac100verify as ac_verify
+import src.definitions as defs
+import src.exceptions as ac_exc
+
+def verify_source(source: str) -> ac_verify.Verification:
+    return ac_verify.verify(asm.assemble_source(source).bytecode)
+
+
+class TestVerify:
+    @pytest.mark.parametrize("name", list(bench.EMU_PROGRAMS))
+    def test_bench_programs(self, name):
+        result = verify_source(bench.emu_source(name))
+        assert result.ok and result.diagnostics == []
+
+    def test_verified_addresses(self):
+        source = "LDI R1 1\nJMP end\n.word 0xffff 0xffff\nend:\nHALT"
+        result = verify_source(source)
+        assert result.verified == [0x200, 0x204, 0x20c]
+
+    @pytest.mark.parametrize("code, message", [
+        ("99000000", "unknown opcode 0x99"),
+        ("00100001", "LDI: no register with index 16"),
+        ("01001000", "LDR: no register with index 16"),
+        ("20001100", "CMR: no register with index 17"),
+        ("38000100", "JMP: jump to 0x0100 in the stack"),
+        ("3000fc40", "JZ: jump to 0xfc40 in VRAM"),
+        ("39000202", "JSR: jump to 0x0202, which is not 4-byte aligned"),
+        ("10000100", "ST: store to 0x0100 in the stack"),
+    ])
+    def test_errors(self, code, message):
+        result = ac_verify.verify(bytes.fromhex("ff000000" + code))
+        assert not result.ok
+        (diagnostic,) = result.diagnostics
+        assert diagnostic.address == 0x204
+        assert diagnostic.message == message
+        assert result.verified == [0x200]
+
+    def test_both_branches_followed(self):
+        result = ac_verify.verify(bytes.fromhex("3000020c" "99000000"
+                                                "fefffeff" "fefffeff"))
+        assert [d.address for d in result.diagnostics] == [0x204]
+        assert result.verified == [0x200, 0x20c]
+
+    def test_runs_off_end(self):
+        result = verify_source("LDI R1 1")
+        assert result.ok
+        assert result.diagnostics[0].severity == "warning"
+        assert str(result.diagnostics[0]).startswith("0x0204: warning:")
+
+
+class TestVerifiedExecution:
+    def test_checks_skipped(self):
+        machine = emu.AC100()
+        machine.load_ram(bytes.fromhex("38000202"))
+        with pytest.raises(ac_exc.PcAlignmentError):
+            machine.decode_execute_instruction(machine.fetch_instruction())
+        machine.mark_verified([0x200])
+        machine.decode_execute_instruction(machine.fetch_instruction())
+        assert machine.PC == 0x202
+
+    @pytest.mark.parametrize("verified", [False, True])
+    def test_jump_into_device(self, verified):
+        program = asm.assemble_source("JMP 0xf800").bytecode
+        machine = emu.AC100()
+        machine.load_ram(program)
+        machine.bus.map_device(defs.CONSOLE_START, dev.Console(io.BytesIO()))
+        if verified:
+            machine.mark_verified(ac_verify.verify(program).verified)
+            assert not machine.verified[0x200] # the device isn't executable
+        with pytest.raises(ac_exc.MemoryProtectionError):
+            machine.run_headless()
+        assert machine.PC == 0x200
+
+    def test_device_mapped_after_verifying(self):
+        program = asm.assemble_source("JMP 0xf800").bytecode
+        machine = emu.AC100()
+        machine.load_ram(program)
+        machine.mark_verified(ac_verify.verify(program).verified)
+        assert machine.verified[0x200]
+        machine.bus.map_device(defs.CONSOLE_START, dev.Console(io.BytesIO()))
+        with pytest.raises(ac_exc.MemoryProtectionError):
+            machine.run_headless()
+        assert not machine.verified[0x200] and machine.PC == 0x200
+
+    def test_store_unmarks(self):
+        source = "LDI R1 0x3800\nST R1 jump\njump:\nJMP 0x0200"
+        program = asm.assemble_source(source).bytecode
+        machine = emu.AC100()
+        machine.load_ram(program)
+        machine.mark_verified(ac_verify.verify(program).verified)
+        assert machine.verified[0x208]
+        machine.run_headless(max_instructions=2)
+        assert not machine.verified[0x208]
+        assert machine.verified[0x204]
+
+    def test_load_unmarks(self):
+        machine = emu.AC100()
+        machine.mark_verified([0x200])
+        machine.load_ram(b"\xff\x00\x00\x00")
+        assert not machine.verified[0x200] and machine.verified_end == 0